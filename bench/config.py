@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Measures the time from reading the config to having the views of a commit
+
+Compares parsing C{commitmessage.conf} afresh, as each hook process used to,
+with loading the compiled copy L{loadConfig} keeps next to it, for configs of
+one module per team directory.
+
+Usage: python bench/config.py [repeats]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '.')
+
+from commitmessage.model import Model
+from commitmessage.util import CmConfigParser, loadConfig
+
+def configText(count):
+    """@return: the text of a config with C{count} modules, each with its own email.to"""
+    lines = [
+        '[scm]',
+        'controller = commitmessage.controllers.svn.SvnController',
+        '',
+        '[views]',
+        'email = commitmessage.views.email.TigrisStyleEmailView',
+        '',
+        '[email]',
+        'from = $model.user@example.com',
+        'subject = commit $model.rev: $model.greatestCommonDirectory()',
+        'server = localhost',
+        '',
+        '[modules]']
+    for i in xrange(count):
+        if i % 10 == 9:
+            lines.append(r'team%d = ^/repo/teams/team%d/.*\.(c|h)$' % (i, i))
+        else:
+            lines.append('team%d = /repo/teams/team%d/' % (i, i))
+    for i in xrange(count):
+        lines.extend(['', '[team%d]' % i, 'views = email', 'email.to = team%d@example.com' % i])
+    return '\n'.join(lines) + '\n'
+
+def startup(config, model):
+    """Does what a hook does with the config before executing the views"""
+    config.getRequiredFacets()
+    for module in config.getModulesForPath('/repo/teams/team7/src/file.c'):
+        config.getViewsForModule(module, model)
+
+def best(repeats, function):
+    """@return: the quickest of C{repeats} runs of C{function}, in seconds"""
+    times = []
+    for i in xrange(repeats):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+def main(repeats):
+    model = Model()
+    model.user, model.rev = 'stephen', '12'
+
+    print '%8s %12s %12s' % ('modules', 'parse (ms)', 'cached (ms)')
+    directory = tempfile.mkdtemp()
+    try:
+        for count in [10, 100, 1000, 3000]:
+            path = os.path.join(directory, 'commitmessage%d.conf' % count)
+            f = open(path, 'w')
+            f.write(configText(count))
+            f.close()
+
+            parsed = best(repeats, lambda: startup(CmConfigParser(path), model))
+            loadConfig(path)
+            cached = best(repeats, lambda: startup(loadConfig(path), model))
+
+            print '%8d %12.1f %12.1f' % (count, parsed * 1000, cached * 1000)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main(5)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Measures the memory and time taken to build the model for a large commit
+
+Usage: python bench/model.py [files]
+"""
+
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+from commitmessage.model import Model
+
+def residentBytes():
+    """@return: the resident memory of this process in bytes, or C{None} if it cannot be told"""
+    try:
+        f = open('/proc/self/statm')
+        try:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+def records(files):
+    """@return: the C{(path, action)} records of a commit touching C{files} files, 100 to a directory"""
+    for i in xrange(files):
+        yield '/trunk/module%d/src/dir%d/file%d.c' % (i / 10000, i / 100, i), 'modified'
+
+def main(files):
+    gc.collect()
+    before = residentBytes()
+    start = time.time()
+
+    model = Model()
+    model.load(records(files))
+
+    elapsed = time.time() - start
+    gc.collect()
+    after = residentBytes()
+
+    nodes = files + len(model.directories())
+    start = time.time()
+    for file in model.files():
+        file.path, file.name
+    for directory in model.directories():
+        directory.path, directory.name
+    accessed = time.time() - start
+
+    start = time.time()
+    frozen = model.freeze()
+    frozenElapsed = time.time() - start
+    gc.collect()
+    frozenAfter = residentBytes()
+
+    print 'Built %d files in %d directories in %.2fs' % (files, nodes - files, elapsed)
+    print 'Read every path and name in %.3fs' % accessed
+    print 'Froze the model in %.2fs' % frozenElapsed
+    if before is not None:
+        print 'Model takes %.1f MB, %d bytes per node' % ((after - before) / 1048576.0, (after - before) / nodes)
+        print 'Frozen model takes %.1f MB more, %d bytes per node' % ((frozenAfter - after) / 1048576.0, (frozenAfter - after) / nodes)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main(100000)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Measures routing commits to modules against the number of modules
+
+Compares trying each C{[modules]} pattern in turn with the L{ModuleRouter},
+for one module per team directory plus a tenth as many regex modules, and
+compiling each pattern with building the router.
+
+Usage: python bench/router.py [routes]
+"""
+
+import re
+import sre_compile
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+from commitmessage.router import ModuleRouter
+
+def patterns(count):
+    """@return: C{count} C{(module, pattern)}s, one in ten of them a regex"""
+    result = []
+    for i in xrange(count):
+        if i % 10 == 9:
+            result.append(('regex%d' % i, r'^/repo/teams/team%d/.*\.(c|h)$' % i))
+        else:
+            result.append(('team%d' % i, '/repo/teams/team%d/' % i))
+    return result
+
+def linearRoute(compiled, path):
+    """@return: the modules matching C{path}, found by trying each pattern in turn"""
+    return [module for module, p in compiled if p.match(path)]
+
+def main(routes):
+    print '%8s %12s %12s %14s %14s' % ('modules', 'linear (ms)', 'router (ms)', 'compile (ms)', 'build (ms)')
+    for count in [10, 100, 1000, 3000, 10000]:
+        modulePatterns = patterns(count)
+        paths = ['/repo/teams/team%d/src/file.c' % (i * 7 % count) for i in xrange(routes)]
+
+        # Skip re's cache, as each hook process starts without one
+        start = time.time()
+        compiled = [(module, sre_compile.compile(pattern)) for module, pattern in modulePatterns]
+        compiling = time.time() - start
+        start = time.time()
+        for path in paths:
+            linearRoute(compiled, path)
+        linear = time.time() - start
+
+        re.purge()
+        start = time.time()
+        router = ModuleRouter(modulePatterns)
+        build = time.time() - start
+        start = time.time()
+        for path in paths:
+            router.route(path)
+        routed = time.time() - start
+
+        print '%8d %12.3f %12.3f %14.1f %14.1f' % (count, linear * 1000 / routes, routed * 1000 / routes, compiling * 1000, build * 1000)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main(200)
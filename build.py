@@ -71,6 +71,11 @@ if sys.argv[1] == 'tags':
     import os
     os.popen('exctags -R commitmessage')
 
+if sys.argv[1] == 'bench':
+    for bench in glob.glob('bench/*.py'):
+        print 'Running %s' % bench
+        os.system('%s %s' % (sys.executable, bench))
+
 if sys.argv[1] == 'dist':
     version = '2.0'
     subdir = 'commitmessage-%s/' % version
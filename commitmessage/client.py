@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""The thin hook client for handing commits off to a running L{commitmessage.daemon}
+
+This module is imported by C{main.py} before anything else in the package, so
+it sticks to the standard library to keep hooks fast.
+"""
+
+import marshal
+import socket
+
+def submit(socketPath, controller, argv, stdin):
+    """Sends a C{(controller, argv, stdin)} job to the daemon listening on C{socketPath}
+
+    @param controller: the full class name of the controller to use, or C{''} for the one in the daemon's config
+    @param argv: the command line arguments the hook was given
+    @param stdin: the text the hook was given on C{stdin}
+    @return: C{None} if the daemon accepted the job, otherwise the reason it did not
+    """
+    return request(socketPath, marshal.dumps((controller, argv, stdin)))
+
+def request(socketPath, data):
+    """Sends C{data} to the process listening on C{socketPath}
+
+    @return: C{None} if it replied C{ok}, otherwise the reason it did not
+    """
+    try:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(socketPath)
+    except (AttributeError, socket.error), e:
+        return 'could not connect to %s: %s' % (socketPath, e)
+
+    try:
+        s.sendall(data)
+        s.shutdown(socket.SHUT_WR)
+        reply = readAll(s)
+    finally:
+        s.close()
+
+    if reply == 'ok':
+        return None
+    return reply or 'no reply from %s' % socketPath
+
+def readAll(s):
+    """@return: everything read from the socket C{s} until the other end shuts down"""
+    chunks = []
+    while 1:
+        chunk = s.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return ''.join(chunks)
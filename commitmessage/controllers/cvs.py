@@ -8,34 +8,101 @@
 The controller and utils for the CVS SCM (U{http://www.cvshome.org})
 """
 
+import difflib
 import os
 import cPickle
 import re
+import struct
 import sys
+import time
 
-from commitmessage.model import Controller, Directory, File, Model
-from commitmessage.util import execute
+try:
+    import fcntl
+except ImportError:
+    # Windows, where only one commit is expected at a time anyway
+    fcntl = None
+
+from commitmessage.coordinator import Coordinator, send
+from commitmessage.exceptions import CmException
+from commitmessage.model import Controller, DiffLoader, Directory, File, Model
+from commitmessage.rcs import RcsFile
+from commitmessage.util import Process, execute, parallelMap
 
 # The cvs_status and cvs_diff commands are executed in the ...working
 # directory... either client side or server side, I forget which.
 
-def cvs_status(file):
+def cvs_status(file, timeout=None):
     """@return: the rev and delta for C{file} during a commit"""
-    rev, delta = '', ''
+    return cvs_statuses([file], timeout).get(file, ('', ''))
+
+def cvs_statuses(files, timeout=None):
+    """Looks up the revs and deltas of all of C{files} (in the current directory) with one C{cvs status} and one C{cvs log}
+
+    @return: a dict of each file name to its C{(rev, delta)}, files that CVS did not report on are left out
+    """
+    if len(files) == 0:
+        return {}
+
+    revs = parseStatus(execute(['cvs', '-Qnf', 'status'] + list(files), timeout))
+
+    logged = [file for file in files if revs.has_key(file)]
+    deltas = {}
+    if len(logged) > 0:
+        wanted = {}
+        for file in logged:
+            wanted[revs[file]] = True
+        revList = wanted.keys()
+        revList.sort()
+        deltas = parseLog(execute(['cvs', '-Qnf', 'log', '-r' + ','.join(revList)] + logged, timeout), revs)
+
+    statuses = {}
+    for file in files:
+        if revs.has_key(file):
+            statuses[file] = (revs[file], deltas.get(file, ''))
+    return statuses
+
+def _rcsFileName(path):
+    """@return: the name of the file that the RCS file at C{path} (e.g. C{/cvsroot/module/Attic/foo.txt,v}) holds"""
+    name = path.strip().split('/')[-1]
+    if name.endswith(',v'):
+        name = name[:-2]
+    return name
+
+def parseStatus(lines):
+    """@return: a dict of each file name to its repository revision, from the output of C{cvs status}"""
+    revs = {}
     p = re.compile(r"^[ \t]*Repository revision")
-    q = re.compile(r"^date:")
-    for line in execute('cvs -Qnf status "%s"' % file):
+    for line in lines:
         if p.search(line):
-            rev = line.strip().split('\t')[1]
-            break
-    if rev != '':
-        for line in execute('cvs -Qnf log -r%s "%s"' % (rev, file)):
-            if q.search(line):
-                line = line.strip()
-                line = re.sub(re.compile(r"^.*;"), '', line)
-                line = re.sub(re.compile(r"^[\s]+lines:"), '', line)
-                delta = line.strip()
-    return rev, delta
+            parts = line.strip().split('\t')
+            if len(parts) >= 3:
+                revs[_rcsFileName(parts[2])] = parts[1]
+    return revs
+
+def parseLog(lines, revs):
+    """@return: a dict of each file name to the delta of its revision in C{revs}, from the output of C{cvs log}"""
+    deltas = {}
+    name = None
+    previous = ''
+    revision = None
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.startswith('RCS file: '):
+            name = _rcsFileName(line[len('RCS file: '):])
+        elif previous == '----------------------------' and line.startswith('revision '):
+            # Only trust revision lines right after a separator, as log
+            # messages are free to start a line with 'revision'
+            revision = line.split()[1]
+        elif revision is not None and line.startswith('date:'):
+            if name is not None and revs.get(name) == revision:
+                line = re.sub(r"^.*;", '', line.strip())
+                line = re.sub(r"^[\s]+lines:", '', line)
+                deltas[name] = line.strip()
+            revision = None
+        else:
+            revision = None
+        previous = line
+    return deltas
 
 def cvs_previous_rev(rev):
     """@return: the revision previous to C{rev}"""
@@ -49,38 +116,214 @@ def cvs_previous_rev(rev):
             prev = re.sub(p, '', prev)
     return prev
 
-def cvs_diff(file, rev):
-    """@return: the C{(delta,diff)} on the given L{File} during a commit"""
-    p = re.compile(r"\.(?:pdf|gif|jpg|mpg)$", re.I)
-    if (p.search(file.name)):
-        return '+0 -0', '===================================================================\n<<Binary file>>\n'
-    if file.action == 'removed':
-        return '+0 -0', '===================================================================\n'
+def cvs_diff(file, rev, timeout=None, previousRev=None):
+    """@return: the C{(delta,diff)} on the given L{File} during a commit
 
-    diff, lines = '', []
+    @param previousRev: the revision C{file} had before the commit (C{NONE} if it was added), guessed from C{rev} if not given
+    """
+    skipped = _skippedDiff(file)
+    if skipped is not None:
+        return skipped
+
+    if previousRev is None:
+        isNew = rev == '1.1'
+        previousRev = cvs_previous_rev(rev)
+    else:
+        isNew = previousRev == 'NONE'
 
-    if rev == '1.1':
-        lines = execute('cvs -Qnf update -p -r1.1 "%s"' % file.name)
-        diff = 'Index: %s\n===================================================================\n' % file.name
+    diff = []
+
+    if isNew:
+        process = Process('cvs -Qnf update -p -r%s "%s"' % (rev, file.name), timeout)
+        diff.append('Index: %s\n===================================================================\n' % file.name)
         added, removed = 0, 0
     else:
-        lines = execute('cvs -Qnf diff -u -r%s -r %s "%s"' % (cvs_previous_rev(rev), rev, file.name))
+        process = Process('cvs -Qnf diff -u -r%s -r %s "%s"' % (previousRev, rev, file.name), timeout)
         added, removed = -1, -1
 
-    for line in lines:
-        if rev == '1.1':
+    for line in process:
+        if isNew:
             added = added + 1
         elif len(line) > 0:
             if line[0] == '+':
                 added = added + 1
             elif line[0] == '-':
                 removed = removed + 1
-        diff = diff + line
+        diff.append(line)
+
+    if process.timedOut:
+        sys.stderr.write('%s: %s\n' % (process, process.err))
+        return '<Unavailable>', ''
+
+    if isNew:
+        diff.append('\n')
+
+    return '+%s -%s' % (added, removed), ''.join(diff)
+
+def rcs_diff(file, rcsFile, rev, previousRev):
+    """Builds the same C{(delta,diff)} as L{cvs_diff} straight from the file's
+    L{RcsFile}, without running C{cvs}
+
+    Keywords such as C{$Id$} are not expanded, so they never show up as changes.
+
+    @param rcsFile: the L{RcsFile} holding the history of C{file}
+    @param previousRev: the revision C{file} had before the commit, C{NONE} if it was added
+    """
+    skipped = _skippedDiff(file)
+    if skipped is not None:
+        return skipped
+    if rcsFile.isBinary():
+        return '+0 -0', '===================================================================\n<<Binary file>>\n'
+
+    if previousRev == 'NONE':
+        lines = rcsFile.lines(rev)
+        diff = ['Index: %s\n===================================================================\n' % file.name]
+        diff.extend(lines)
+        diff.append('\n')
+        return '+%s -0' % len(lines), ''.join(diff)
+
+    diff = [
+        'Index: %s\n' % file.name,
+        '===================================================================\n',
+        'RCS file: %s\n' % rcsFile.path,
+        'retrieving revision %s\n' % previousRev,
+        'retrieving revision %s\n' % rev,
+        'diff -u -r%s -r%s\n' % (previousRev, rev)]
+    # One revision is always on the way to the other, so both come from a
+    # single walk through the history
+    previousLines, lines = rcsFile.linesOfEach([previousRev, rev])
+    added, removed = 0, 0
+    hunks = difflib.unified_diff(
+        previousLines,
+        lines,
+        '%s\t%s\t%s' % (file.name, rcsFile.date(previousRev), previousRev),
+        '%s\t%s\t%s' % (file.name, rcsFile.date(rev), rev))
+    for i, line in enumerate(hunks):
+        # The first two lines are the --- and +++ file names
+        if i < 2 or line.startswith('@@'):
+            pass
+        elif line[0] == '+':
+            added = added + 1
+        elif line[0] == '-':
+            removed = removed + 1
+        if not line.endswith('\n'):
+            line = line + '\n\\ No newline at end of file\n'
+        diff.append(line)
+
+    return '+%s -%s' % (added, removed), ''.join(diff)
+
+def findRcsFile(directory, name):
+    """@return: the path of the RCS file for C{name} in the repository C{directory}, C{None} if there is none"""
+    for path in [os.path.join(directory, name + ',v'), os.path.join(directory, 'Attic', name + ',v')]:
+        if os.path.isfile(path):
+            return path
+    return None
+
+def _skippedDiff(file):
+    """@return: the C{(delta,diff)} for a file that is not diffed (binaries and removed files), otherwise C{None}"""
+    p = re.compile(r"\.(?:pdf|gif|jpg|mpg)$", re.I)
+    if (p.search(file.name)):
+        return '+0 -0', '===================================================================\n<<Binary file>>\n'
+    if file.action == 'removed':
+        return '+0 -0', '===================================================================\n'
+    return None
 
-    if rev == '1.1':
-        diff = diff + '\n'
+_revision = re.compile(r"^(?:NONE|[0-9]+(?:\.[0-9]+)+)$")
 
-    return '+%s -%s' % (added, removed), diff
+def parseLoginfoFiles(words):
+    """Parses the files that loginfo passed after the directory
+
+    Understands plain C{%{s}} file names as well as the C{%{sVv}} format,
+    either as C{name,old,new} words (CVS prior to 1.12) or as C{name old new}
+    triples (C{UseNewInfoFmtStrings=yes}).
+
+    @return: the file names and a dict of each name to its C{(old, new)} revisions, empty for plain file names
+    """
+    names, revisions = [], {}
+
+    triples = [word.split(',') for word in words]
+    if len(words) > 0 and [t for t in triples if len(t) >= 3 and _revision.match(t[-2]) and _revision.match(t[-1])] == triples:
+        for t in triples:
+            name = ','.join(t[:-2])
+            names.append(name)
+            revisions[name] = (t[-2], t[-1])
+        return names, revisions
+
+    if len(words) > 0 and len(words) % 3 == 0:
+        for i in range(0, len(words), 3):
+            if not (_revision.match(words[i+1]) and _revision.match(words[i+2])):
+                break
+        else:
+            for i in range(0, len(words), 3):
+                names.append(words[i])
+                revisions[words[i]] = (words[i+1], words[i+2])
+            return names, revisions
+
+    return list(words), revisions
+
+class Journal:
+    """An append-only file of the records that the per-directory executions
+    of commitinfo and loginfo leave for the last loginfo of the commit
+
+    Each C{(kind, value)} record is appended under an exclusive C{fcntl} lock
+    as the lengths of its kind and pickled value, the kind, and then the
+    value, so a loginfo can skip over the values (e.g. whole directories with
+    their diffs) it has no use for.
+    """
+
+    # The lengths in front of each record
+    HEADER = '>HI'
+    HEADER_SIZE = struct.calcsize(HEADER)
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, record):
+        """Durably adds the C{(kind, value)} C{record} to the end of the journal"""
+        kind, value = record
+        data = cPickle.dumps(value, 2)
+        f = open(self.path, 'ab')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.write(struct.pack(Journal.HEADER, len(kind), len(data)) + kind + data)
+            f.flush()
+        finally:
+            f.close()
+
+    def replay(self, kinds=None):
+        """@return: the records in the journal, in the order they were added,
+        only those of C{kinds} if given, without reading the others' values"""
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            return []
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+            size = os.fstat(f.fileno()).st_size
+
+            records = []
+            position = 0
+            while position + Journal.HEADER_SIZE <= size:
+                kindLength, length = struct.unpack(Journal.HEADER, f.read(Journal.HEADER_SIZE))
+                position = position + Journal.HEADER_SIZE + kindLength + length
+                if position > size:
+                    # A record cut short by a crash
+                    break
+                kind = f.read(kindLength)
+                if kinds is None or kind in kinds:
+                    records.append((kind, cPickle.loads(f.read(length))))
+                else:
+                    f.seek(length, 1)
+            return records
+        finally:
+            f.close()
+
+    def remove(self):
+        """Removes the journal once the commit is done"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
 
 class CvsController(Controller):
     """Translates CVS loginfo/commitinfo information into the model"""
@@ -92,18 +335,33 @@ class CvsController(Controller):
     # pgrp will remain the same for each spawned process."""
     FILE_PREFIX = ''
 
-    # The file to store the last directory that commitinfo was executed in. Must
-    # be assigned to after the FILE_PREFIX has been set in __init__.
-    LAST_DIRECTORY_FILE = ''
+    # The L{Journal} that commitinfo saves the last directory it was executed
+    # in to, and loginfo saves each directory to. Must be assigned to after the
+    # FILE_PREFIX has been set in __init__.
+    JOURNAL_FILE = ''
+
+    # The socket of the L{Coordinator} when C{[scm] coordinate = yes}. Must be
+    # assigned to after the FILE_PREFIX has been set in __init__.
+    COORDINATOR_SOCKET = ''
+
+    # How many times to try handing a directory to the coordinator once it
+    # has taken others of the commit, and how many seconds apart
+    SEND_ATTEMPTS = 3
+    SEND_RETRY_DELAY = 0.5
 
     def __init__(self, config, argv, stdin):
-        """Initializes up the L{FILE_PREFIX}, L{LAST_DIRECTORY_FILE}, and other variables"""
+        """Initializes up the L{FILE_PREFIX}, L{JOURNAL_FILE}, and other variables"""
         try:
             CvsController.FILE_PREFIX = '#cvs.%s.' % os.getpgrp()
         except AttributeError:
             sys.stderr.write('WARNING, the CvsController is designed only to run on Unix.')
             CvsController.FILE_PREFIX = '#cvs.'
-        CvsController.LAST_DIRECTORY_FILE = '%s/%slastdir' % (Controller.TMPDIR, CvsController.FILE_PREFIX)
+        CvsController.JOURNAL_FILE = '%s/%sjournal' % (Controller.TMPDIR, CvsController.FILE_PREFIX)
+        CvsController.COORDINATOR_SOCKET = '%s/%ssocket' % (Controller.TMPDIR, CvsController.FILE_PREFIX)
+
+        # Defaults, overridden by the [scm] section
+        self.coordinate = 'no'
+        self.handedOff = False
 
         Controller.__init__(self, config, argv, stdin)
 
@@ -124,8 +382,12 @@ class CvsController(Controller):
         if not hasattr(self, 'currentDirectory'):
             return True
 
+        # If the coordinator took the directory, it executes the views
+        if self.handedOff:
+            return True
+
         # If in loginfo, stop if we're not on the last directory
-        if not self._isLastDirectoryOfCommit():
+        if not self.isLastDirectory:
             return True
 
         return False
@@ -136,9 +398,7 @@ class CvsController(Controller):
         if len(self.currentDirectory.files) == 0:
             return True
 
-        f = file(CvsController.LAST_DIRECTORY_FILE, 'r')
-        fullPath = f.readlines()[0]
-        f.close()
+        fullPath = self.lastDirectory
 
         lastColon = os.environ['CVSROOT'].rindex(':')
         rootPath = os.environ['CVSROOT'][lastColon+1:]
@@ -171,21 +431,23 @@ class CvsController(Controller):
         return False
 
     def _doCommitInfo(self):
-        """Saves the current directory name to C{LAST_DIRECTORY_FILE} so that
+        """Saves the current directory name to the L{Journal} so that
         L{_doLogInfo} will know when it is done (when it's on the same directory
         as the last one L{_doCommitInfo} saved)
 
         Executed for each directory in the commit before any L{_doLogInfo}s are
         called.
         """
-        f = file(CvsController.LAST_DIRECTORY_FILE, 'w')
-
         fullPath = self.argv[1]
         if not fullPath.endswith('/'):
             fullPath = fullPath + '/'
 
-        f.write(fullPath)
-        f.close()
+        Journal(CvsController.JOURNAL_FILE).append(('lastdir', fullPath))
+
+        # The first commitinfo of the commit starts the coordinator
+        if self.coordinate == 'yes' and not os.path.exists(CvsController.COORDINATOR_SOCKET):
+            logPath = '%s/%scoordinator.log' % (Controller.TMPDIR, CvsController.FILE_PREFIX)
+            Coordinator(self, CvsController.COORDINATOR_SOCKET).start(logPath)
 
     def _doLogInfo(self):
         """Starts building the model if this is the last L{_doLogInfo} of the commit
@@ -196,6 +458,15 @@ class CvsController(Controller):
         temp = self.argv[1].split(' ')
         directoryPath = '/' + temp[0] + '/'
         directoryFiles = temp[1:]
+        # Only filled in if loginfo was given the %{sVv} format
+        self.revisions = parseLoginfoFiles(directoryFiles)[1]
+
+        # Where the directory's RCS files are, if the hook can see them
+        self.rcsDirectory = None
+        cvsroot = os.environ.get('CVSROOT', '')
+        rootPath = cvsroot[cvsroot.rfind(':')+1:]
+        if rootPath != '' and os.path.isdir(os.path.join(rootPath, temp[0])):
+            self.rcsDirectory = os.path.join(rootPath, temp[0])
 
         # Handle removing the module prefix from the directory name
         secondSlash = directoryPath.find('/', 1)
@@ -216,13 +487,72 @@ class CvsController(Controller):
             and directoryFiles[2] == 'directory':
             self.currentDirectory.action = 'added'
 
-        self._fillInValues()
-
-        if self._isLastDirectoryOfCommit():
+        journal = Journal(CvsController.JOURNAL_FILE)
+        # Only the last loginfo needs the journaled directories
+        records = journal.replay(['lastdir', 'handedoff'])
+        self.lastDirectory = ''
+        for kind, value in records:
+            if kind == 'lastdir':
+                self.lastDirectory = value
+
+        # Check once, as loading the saved directories removes the journal
+        self.isLastDirectory = self._isLastDirectoryOfCommit()
+
+        filled = False
+        # Without a coordinator (e.g. for a new directory, which has no
+        # commitinfo), the directory is processed here as usual
+        if self.coordinate == 'yes' and os.path.exists(CvsController.COORDINATOR_SOCKET):
+            # The coordinator cannot run cvs in this hook's working directory
+            if not self._canBeFilledInByCoordinator():
+                self._fillInValues(self.currentDirectory, self.revisions, self.rcsDirectory)
+                filled = True
+            log = None
+            if self.isLastDirectory:
+                self._parseLogLinesIntoModel()
+                log = self.model.log
+
+            message = {
+                'directory': self.currentDirectory,
+                'revisions': self.revisions,
+                'rcsDirectory': self.rcsDirectory,
+                'filled': filled,
+                'last': self.isLastDirectory,
+                'repo': self.model.repo,
+                'log': log}
+            reason = send(CvsController.COORDINATOR_SOCKET, message)
+
+            # Once the coordinator has some of the commit, this directory can
+            # not be processed here without them, so it has to go there too
+            handedOff = [value for kind, value in records if kind == 'handedoff']
+            attempts = 1
+            while reason is not None and len(handedOff) > 0 and attempts < CvsController.SEND_ATTEMPTS:
+                time.sleep(CvsController.SEND_RETRY_DELAY)
+                reason = send(CvsController.COORDINATOR_SOCKET, message)
+                attempts = attempts + 1
+
+            if reason is None:
+                self.handedOff = True
+                if not self.isLastDirectory:
+                    journal.append(('handedoff', self.currentDirectory.path))
+                # The coordinator removes the journal once it has read the
+                # directories journaled by the hooks it did not take
+                return
+            if len(handedOff) > 0:
+                raise CmException('The commitmessage coordinator did not take %s (%s), but already has %s, so no views will be executed for the commit.' % (self.currentDirectory.path, reason, ', '.join(handedOff)))
+            sys.stderr.write('The commitmessage coordinator did not take %s (%s), processing it here.\n' % (self.currentDirectory.path, reason))
+
+        if not filled:
+            # The last directory stays in this process for the views, so its
+            # diffs can wait until they are read; the others are journaled
+            self._fillInValues(self.currentDirectory, self.revisions, self.rcsDirectory, self.isLastDirectory)
+
+        if self.isLastDirectory:
             self._parseLogLinesIntoModel()
             self.model.addDirectory(self.currentDirectory)
+            self._loadSavedDirectoriesIntoModel(journal.replay(['directory']))
+            journal.remove()
         else:
-            self._saveDirectory()
+            journal.append(('directory', self.currentDirectory))
 
     def _parseLogLinesIntoModel(self):
         """Saves the log lines found on C{stdin} into the model"""
@@ -236,28 +566,118 @@ class CvsController(Controller):
         else:
             self.model.log = '\n'.join(self.logLines)
 
-    def _saveDirectory(self):
-        """Pickles the current L{Directory} off to the C{TMPDIR/FILE_PREFIX} directory"""
-        path = '%s/%s%s' % (
-            Controller.TMPDIR,
-            CvsController.FILE_PREFIX,
-            self.currentDirectory.path.replace('/', '-'))
-        f = file(path, 'w')
-        cPickle.dump(self.currentDirectory, f)
-        f.close()
-
-    def _fillInValues(self):
-        """Goes through each file in this execution's directory and fills in the missing rev/delta/diff information"""
+    def _canBeFilledInByCoordinator(self):
+        """@return: whether the current directory's files can be filled in from the RCS files alone"""
+        if self.rcsDirectory is None:
+            return False
+        needsRcsFiles = self.requires('deltas') or self.requires('diffs')
         for file in self.currentDirectory.files:
-            (file.rev, file.delta) = cvs_status(file.name)
-
+            if self.revisions.get(file.name, ('', 'NONE'))[1] == 'NONE':
+                return False
+            # Without its RCS file, the file's delta and diff would need cvs
+            if needsRcsFiles and findRcsFile(self.rcsDirectory, file.name) is None:
+                return False
+        return True
+
+    def _fillInValues(self, directory, revisions, rcsDirectory, lazy=False):
+        """Goes through each file in C{directory} and fills in the missing rev/delta/diff information
+
+        The revs of the files are taken from loginfo's C{%{sVv}} arguments
+        when given, and the rest are looked up at once with L{cvs_statuses}.
+        The diffs are then read from the repository's RCS files when the hook
+        can see them and the revs are known, or otherwise taken with C{cvs
+        diff}, C{[scm] concurrency} at a time. They are only stored once they
+        are all in, in the files' order. If the views do not need the diffs,
+        they are not taken, and the deltas are counted from the RCS files, or
+        looked up with the revs if the hook cannot see them.
+
+        @param directory: the L{Directory} to fill in
+        @param revisions: the C{(old, new)} revs loginfo gave for each file name
+        @param rcsDirectory: where the directory's RCS files are, or C{None} if the hook cannot see them
+        @param lazy: whether to leave taking the diffs until a view first reads one
+        """
+        timeout = self.commandTimeout()
+
+        files = directory.files
+
+        # Only look up the revs that loginfo did not pass in (e.g. removed
+        # files, whose new rev is NONE)
+        unknown = [file.name for file in files if revisions.get(file.name, ('', 'NONE'))[1] == 'NONE']
+        rcsDeltas = {}
+        if self.requires('deltas') and not self.requires('diffs'):
+            # Without the diffs to take the deltas from, count them from the
+            # RCS files the hook can see, and ask cvs for the rest
+            rcsDeltas = self._rcsDeltas(files, revisions, rcsDirectory)
+            unknown = [file.name for file in files if not rcsDeltas.has_key(file.name)]
+        statuses = cvs_statuses(unknown, timeout)
+        for file in files:
+            if rcsDeltas.has_key(file.name):
+                file.rev, file.delta = revisions[file.name][1], rcsDeltas[file.name]
+            elif revisions.has_key(file.name) and not statuses.has_key(file.name):
+                file.rev, file.delta = revisions[file.name][1], ''
+            else:
+                file.rev, file.delta = statuses.get(file.name, ('', ''))
+
+        def lookUp(file):
             if file.action == 'added' or file.action == 'modified' or file.action == 'removed':
-                file.delta, file.diff = cvs_diff(file, file.rev)
-
+                if revisions.has_key(file.name):
+                    previousRev = revisions[file.name][0]
+                    rcsPath = None
+                    if rcsDirectory is not None:
+                        rcsPath = findRcsFile(rcsDirectory, file.name)
+                    if rcsPath is not None:
+                        try:
+                            return rcs_diff(file, RcsFile(rcsPath), file.rev, previousRev)
+                        except (CmException, IOError), e:
+                            sys.stderr.write('Could not read %s, running cvs diff instead: %s\n' % (rcsPath, e))
+                    return cvs_diff(file, file.rev, timeout, previousRev)
+                return cvs_diff(file, file.rev, timeout)
+            return None
+
+        # The excluded files get no cvs diff at all; which modules the commit
+        # goes to is not known yet, so only the [scm] patterns apply here
+        excluded = {}
+        for file in self._excludeFiles(files):
+            excluded[file.name] = True
+        files = [file for file in files if not excluded.has_key(file.name)]
+
+        def fetch():
+            results = parallelMap(lookUp, files, self.commandConcurrency())
+            for file, result in zip(files, results):
+                if result is not None:
+                    file.delta, file.diff = result
+
+        if not self.requires('diffs'):
+            return
+        if lazy:
+            DiffLoader(files, fetch)
+        else:
+            fetch()
+
+    def _rcsDeltas(self, files, revisions, rcsDirectory):
+        """@return: a dict of the name of each of C{files} to its delta, counted from its RCS file, for those whose revs loginfo gave and whose RCS file can be read"""
+        deltas = {}
+        if rcsDirectory is None:
+            return deltas
+        for file in files:
+            previousRev, rev = revisions.get(file.name, ('', 'NONE'))
+            if rev == 'NONE':
+                continue
+            rcsPath = findRcsFile(rcsDirectory, file.name)
+            if rcsPath is None:
+                continue
+            try:
+                deltas[file.name] = rcs_diff(file, RcsFile(rcsPath), rev, previousRev)[0]
+            except (CmException, IOError), e:
+                sys.stderr.write('Could not read %s, running cvs log instead: %s\n' % (rcsPath, e))
+        return deltas
 
     def _parseLoginfoStdinIntoFiles(self):
         """Reads in the loginfo text from C{stdin} and parses the file information into L{File}s"""
         self.logLines = []
+        branchLines = []
+        # The (name, action) of each file, loaded into the directory at the end
+        records = []
 
         STATE_NONE = 0
         STATE_MODIFIED = 1
@@ -271,7 +691,7 @@ class CvsController(Controller):
         r = re.compile(r"^Removed Files")
         l = re.compile(r"^Log Message")
         b = re.compile(r"Revision\/Branch:")
-        for line in self.stdin.xreadlines():
+        for line in self.stdin:
             line = line.strip()
             if b.search(line):
                 line = re.sub(b, '', line)
@@ -291,30 +711,28 @@ class CvsController(Controller):
 
             files = line.split(' ')
             if (state == STATE_MODIFIED):
-                for name in files: File(name, self.currentDirectory, 'modified')
+                for name in files: records.append((name, 'modified'))
             if (state == STATE_ADDED):
-                for name in files: File(name, self.currentDirectory, 'added')
+                for name in files: records.append((name, 'added'))
             if (state == STATE_REMOVED):
-                for name in files: File(name, self.currentDirectory, 'removed')
+                for name in files: records.append((name, 'removed'))
             if (state == STATE_LOG):
                 self.logLines.append(line)
 
-    def _executeViews(self):
-        """Overrides the parent C{_executeViews} to r-build the model with all of the temporary files"""
-        self._loadSavedDirectoriesIntoModel()
-        # Carry on with executing the views
-        Controller._executeViews(self)
-
-    def _loadSavedDirectoriesIntoModel(self):
-        """Reloads the pickled L{Directory}s into the model"""
-        allFiles = os.listdir(Controller.TMPDIR)
-        for name in allFiles:
-            if name.startswith(CvsController.FILE_PREFIX):
-                fullPath = '%s/%s' % (Controller.TMPDIR, name)
-                if not name.endswith('lastdir'):
-                    f = file(fullPath)
-                    directory = cPickle.load(f)
-                    f.close()
-                    self.model.addDirectory(directory)
-                os.remove(fullPath)
+        self.currentDirectory.loadFiles(records)
 
+    def _takeJournaledDirectories(self):
+        """Loads the directories that the hooks journaled instead of handing
+        them to the L{Coordinator} into the model, and removes the journal"""
+        journal = Journal(CvsController.JOURNAL_FILE)
+        self._loadSavedDirectoriesIntoModel(journal.replay(['directory']))
+        journal.remove()
+
+    def _loadSavedDirectoriesIntoModel(self, records):
+        """Loads the L{Directory}s saved by the earlier L{_doLogInfo}s into the model
+
+        @param records: the records replayed from the L{Journal}
+        """
+        for kind, value in records:
+            if kind == 'directory':
+                self.model.addDirectory(value)
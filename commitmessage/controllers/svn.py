@@ -8,10 +8,12 @@
 """The controller and utils for the Subversion SCM (U{http://subversion.tigris.org})"""
 
 import os
+import subprocess
 import sys
 
-from commitmessage.model import Controller, File, Directory
-from commitmessage.util import execute
+from commitmessage.exceptions import CmException
+from commitmessage.model import Controller, DiffLoader
+from commitmessage.util import Process
 
 class SvnController(Controller):
     """Uses C{svnlook} to pull data from svn repositories"""
@@ -19,6 +21,21 @@ class SvnController(Controller):
     # A mapping from abbreviation to a better description.
     actions = { 'A': 'added', 'D': 'removed', 'U': 'modified', '_': 'modified' }
 
+    # svnlook only needs the repository path and revision
+    detachable = True
+
+    # The svnlook diff started for the views, and the file it writes to on Windows
+    diffProcess = None
+    diffTempFile = None
+
+    def repository(self):
+        """@return: the path of the repository, which is known before the model is built"""
+        return self.argv[1]
+
+    def revision(self):
+        """@return: the revision being committed, which svnlook is given"""
+        return int(self.argv[2])
+
     def _populateModel(self):
         """Fills out the model by invoking C{svnlook}"""
 
@@ -28,100 +45,184 @@ class SvnController(Controller):
         self.model.repo = os.path.split(self.repoPath)[-1]
         self.prefix = (self.addRepoPrefix() and ('/' + self.model.repo)) or ''
 
-        # First, get the user and log message
-        lines = self._svnlook('info')
-        self.model.user = lines[0][:-1]
-        self.model.log = ''.join(lines[3:]).strip()
-
-        # Now build an initial tree of file and tree changes
-        for line in self._svnlook('changed'):
-            action = self.actions[line[0]]
-            target = '/' + line[4:-1]
-
-            if target.endswith('/'):
-                directory = self.model.directory(self.prefix + target)
-                directory.action = action
-            else:
-                parts = target.split('/')
-                name = parts[-1]
-                directoryPath = '/' + '/'.join(parts[0:-1]) + '/'
-
-                file = File(name, self.model.directory(self.prefix + directoryPath), action)
-
-        # Markers to tell us when we hit a new diff
-        markers = ['Modified', 'Added', 'Copied', 'Deleted', 'Property changes on']
-
-        # Recontruct each diff by parsing through the output of svnlook line by line
-        diffs = []
-        partialDiff = None
-
-        #A marker word after a "____" line is a change in a property and shouldn't be added as a change
-        #in a file. InProperty keeps track of this. If it's 0 this is a normal line, any larger 
-        #and it's a property line.
-        inProperty = 1
-        for line in self.getDiffLines():
-            inProperty = max(0, inProperty-1)
-            if line == "___________________________________________________________________\n":
-                inProperty = 2
-
-            # Look for Modified:, Added:, etc.
-            if line[0:line.find(':')] in markers and not inProperty > 0:
-                # Handle starting a new diff
-                partialDiff = [line]
-                diffs.append(partialDiff)
-            elif partialDiff:
-                partialDiff.append(line)
-
-        if len(diffs) == 0:
+        # Start svnlook info and changed at once, so changed runs while the
+        # output of info is being read
+        if self.requires('log'):
+            info = self._startSvnlook('info')
+        changed = self._startSvnlook('changed')
+
+        # Build an initial tree of file and tree changes
+        self.model.load(self._parseChanged(self._readLines(changed)))
+
+        # Route on the listing, so only what the views of the modules the
+        # commit goes to need is fetched, and nothing if it goes to none
+        startedInfo = self.requires('log')
+        if self.facets is not None:
+            self.facets = self.config.getRequiredFacets([module for module, paths in self.route()])
+
+        # Then get the user and log message
+        if self.requires('log'):
+            lines = self._readLines(info)
+            self.model.user = lines[0][:-1]
+            self.model.log = ''.join(lines[3:]).strip()
+        elif startedInfo:
+            info.kill()
+            info.wait()
+
+        # svnlook diff can not be told to skip the excluded files, so their
+        # diffs are dropped as they are read instead
+        self.excluded = {}
+        if self.requires('deltas') or self.requires('diffs'):
+            for file in self._excludeFiles(self.model.files()):
+                self.excluded[file.path] = True
+        files = [file for file in self.model.files() if not self.excluded.has_key(file.path)]
+
+        # Start svnlook diff now that the routed views are known to need it,
+        # so it runs while the views start, but only parse its output once a
+        # view reads a delta or diff, and only count the lines if the deltas
+        # are all the views need
+        nodes = []
+        if self.requires('diffs') or self.requires('directoryDiffs'):
+            nodes, load = files + self.model.directories(), self._loadDiffs
+        elif self.requires('deltas'):
+            nodes, load = files, self._loadDeltas
+        if len(nodes) > 0:
+            self.diffLines = self.getDiffLines()
+            DiffLoader(nodes, load)
+
+    def _executeViews(self):
+        """Executes the views, then stops C{svnlook diff} if none of them read it"""
+        try:
+            Controller._executeViews(self)
+        finally:
+            self._stopDiff()
+
+    def _stopDiff(self):
+        """Kills and waits for C{svnlook diff} if its output was never read, so
+        it is not left blocked on its pipe (or as a zombie in the daemon)"""
+        if self.diffProcess is not None and self.diffProcess.returncode is None:
+            self.diffProcess.kill()
+            self.diffProcess.wait()
+        if self.diffTempFile is not None and os.path.exists(self.diffTempFile):
+            os.remove(self.diffTempFile)
+
+    def _loadDiffs(self):
+        """Fills in the deltas and diffs of the model's files and directories from C{svnlook diff}"""
+        self.diffUnavailable = False
+
+        # Parse through the output of svnlook one diff at a time, so only the
+        # current file's lines are ever held in memory
+        foundDiffs = False
+        for diff in splitDiffs(self.diffLines):
+            foundDiffs = True
+            self._saveDiff(diff)
+
+        if not foundDiffs or self.diffUnavailable:
+            # Drop whatever was parsed before svnlook was stopped
             for file in self.model.files():
+                if self.excluded.has_key(file.path):
+                    continue
                 file.delta = '<Unavailable>'
                 file.diff = ''
+            for directory in self.model.directories():
+                directory.diff = None
 
-        # And finally parse through the diffs and save them into our tree of changes
-        for diff in diffs:
-            # Use [:-1] to leave of the trailing \n
-            start = diff[0].find(': ') + 2
-            stop = diff[0].find('(') - 1 # -1 ignores the space before the paren
-            if stop == -2: stop = len(diff[0])
+    def _loadDeltas(self):
+        """Fills in the deltas of the model's files by counting the lines of C{svnlook diff}, without keeping them"""
+        self.diffUnavailable = False
 
-            filePath = '/' + diff[0][:-1][start:stop]
-
-            # This could be a file or a directory - going ahead with the .file()
-            # call for most directories is fine as it will just return null.
-            #
-            # Howeever, root / will exception out as an invalid file path so
-            # just special case it
+        for lines, added, removed in splitDiffs(self.diffLines, False):
+            filePath = self._pathOf(lines[0])
             if filePath == '/':
-                file = None
-            else:
-                file = self.model.file(self.prefix + filePath)
-
-            # Maybe its a directory
-            if file:
-                isFile = True
-            else:
-                file = self.model.directory(self.prefix + filePath + '/')
-                isFile = False
-
-            if not diff[0].startswith('Property changes on:'):
-                file.delta, file.diff = self._parse_diff(diff)
+                continue
+            file = self.model.file(self.prefix + filePath)
+            if file is None or self.excluded.has_key(file.path):
+                # A directory's property changes, or an excluded file
+                continue
+            if not lines[0].startswith('Property changes on:'):
+                file.delta = '+%s -%s' % (added, removed)
+            elif file.delta is None:
+                # The file's own diff would have come before its properties
+                file.delta = '+0 -0'
+
+        if self.diffUnavailable:
+            for file in self.model.files():
+                if not self.excluded.has_key(file.path):
+                    file.delta = '<Unavailable>'
+
+    def _pathOf(self, marker):
+        """@return: the path (without the prefix) of the file or directory that the C{Modified:}, etc. C{marker} line of a diff is for"""
+        # Use [:-1] to leave of the trailing \n
+        start = marker.find(': ') + 2
+        stop = marker.find('(') - 1 # -1 ignores the space before the paren
+        if stop == -2: stop = len(marker)
+
+        return '/' + marker[:-1][start:stop]
+
+    def _parseChanged(self, lines):
+        """@return: a generator of the C{(path, action)} of each line of C{svnlook changed} output"""
+        for line in lines:
+            yield self.prefix + '/' + line[4:-1], self.actions[line[0]]
+
+    def _saveDiff(self, diff):
+        """Saves a C{(lines, added, removed)} diff from L{splitDiffs} into the tree of changes"""
+        lines = diff[0]
+        filePath = self._pathOf(lines[0])
+
+        # This could be a file or a directory - going ahead with the .file()
+        # call for most directories is fine as it will just return null.
+        #
+        # Howeever, root / will exception out as an invalid file path so
+        # just special case it
+        if filePath == '/':
+            file = None
+        else:
+            file = self.model.file(self.prefix + filePath)
+            if self.excluded.has_key(self.prefix + filePath):
+                return
+
+        # Maybe its a directory
+        if file:
+            isFile = True
+        else:
+            file = self.model.directory(self.prefix + filePath + '/')
+            isFile = False
+
+        if not lines[0].startswith('Property changes on:'):
+            file.delta, file.diff = self._parse_diff(diff)
+        else:
+            if file.diff:
+                # Only files will already have a diff set
+                file.diff = file.diff + '\n\n' + ''.join(lines)
             else:
-                if file.diff:
-                    # Only files will already have a diff set
-                    file.diff = file.diff + '\n\n' + ''.join(diff)
+                # If the 'Property changes on' line is here without a
+                # file.diff, that file.diff will never come because it would
+                # have been printed before us
+                if isFile:
+                    sep = '===================================================================\n\n'
+                    file.diff = ''.join([sep] + lines)
+                    file.delta = '+0 -0'
                 else:
-                    # If the 'Property changes on' line is here without a
-                    # file.diff, that file.diff will never come because it would
-                    # have been printed before us
-                    if isFile:
-                        sep = '===================================================================\n\n'
-                        file.diff = ''.join([sep] + diff)
-                        file.delta = '+0 -0'
-                    else:
-                        file.diff = ''.join(diff)
+                    file.diff = ''.join(lines)
 
     def getDiffLines(self):
-        """@return: a list of diff lines to process, if under the summary threshold"""
+        """Starts C{svnlook diff} running
+
+        @return: an iterator over the diff lines to process, if under the summary threshold
+        """
+
+        # The temp file is only needed to work around SVN issue 1789 on Windows
+        if os.name == 'nt':
+            return self._getDiffLinesFromTempFile()
+
+        self.diffProcess = self._startSvnlook('diff')
+        return self._streamDiffLines(self.diffProcess, self.config.getSummaryThreshold())
+
+    def _getDiffLinesFromTempFile(self):
+        """Starts C{svnlook diff} running with its output saved to C{cm_temp}
+
+        @return: an iterator over the diff lines to process once C{svnlook} is done, if under the summary threshold
+        """
 
         #Workaround for SVN issue 1789
         tempDir = self.repoPath + '/cm_temp'
@@ -135,38 +236,141 @@ class SvnController(Controller):
         if os.path.exists(tempFile):
             os.remove(tempFile)
 
-        self._svnlook('diff', ' > ' + tempFile)
+        output = open(tempFile, 'w')
+        process = self._startSvnlook('diff', output)
+        output.close()
+        self.diffProcess, self.diffTempFile = process, tempFile
 
-        # getSummaryThreshold returns -1 if the option is undefined (ergo, no summary)
-        diff_lines = []
-        if self.config.getSummaryThreshold() == -1 or os.stat(tempFile).st_size <= self.config.getSummaryThreshold():
-            diff_file = open(tempFile, 'r')
-            diff_lines = diff_file.readlines()
-            diff_file.close()
+        return self._readTempFile(process, tempFile)
 
-        os.remove(tempFile)
+    def _readTempFile(self, process, tempFile):
+        """@return: a generator of the lines in C{tempFile} after C{process} is done, if under the summary threshold"""
+        process.wait()
 
-        return diff_lines
+        # getSummaryThreshold returns -1 if the option is undefined (ergo, no summary)
+        if process.timedOut:
+            self.diffUnavailable = True
+            os.remove(tempFile)
+        elif self.config.getSummaryThreshold() == -1 or os.stat(tempFile).st_size <= self.config.getSummaryThreshold():
+            for line in _readAndRemove(tempFile):
+                yield line
+        else:
+            os.remove(tempFile)
 
     def _parse_diff(self, diff):
-        text = ''
-        added = 0
-        removed = 0
-        for line in diff[1:-1]:
-            if len(line) > 0:
-                if line[0] == '+' and not line[0:4] == '+++ ':
-                    added = added + 1
-                elif line[0] == '-' and not line[0:4] == '--- ':
-                    removed = removed + 1
-            text = text + line
+        """@return: the C{(delta, text)} of a C{(lines, added, removed)} diff from L{splitDiffs}"""
+        lines, added, removed = diff
+
+        # Join once, leaving off the marker line and the trailing blank line
+        text = ''.join(lines[1:-1])
 
         # Handle copy without modification, with results in no diff
         if text == '':
-            text = diff[0]
+            text = lines[0]
 
         return ('+%s -%s' % (added, removed), text)
 
-    def _svnlook(self, command, opt_command=''):
+    def _svnlook(self, command):
         """@return: the lines ouput by the C{svnlook} command against the current repo and rev"""
-        return execute('svnlook %s %s -r %s %s' % (command, self.repoPath, self.rev, opt_command))
+        return self._readLines(self._startSvnlook(command))
+
+    def _startSvnlook(self, command, stdout=subprocess.PIPE):
+        """@return: the L{Process} for the C{svnlook} command against the current repo and rev, left running"""
+        # svnlook may need to write an .svnlook directory into its working
+        # directory, so run it somewhere that is known to be writable
+        return Process(
+            ['svnlook', command, self.repoPath, '-r', self.rev],
+            self.commandTimeout(),
+            Controller.TMPDIR,
+            stdout)
+
+    def _readLines(self, process):
+        """@return: all of the lines output by C{process}, after waiting for it to finish"""
+        lines = process.readlines()
+        if process.timedOut or process.returncode != 0:
+            raise CmException('%s: %s' % (process, process.err))
+        return lines
+
+    def _streamDiffLines(self, process, threshold=-1):
+        """@return: a generator of the lines output by C{process}, read straight from its pipe
+
+        If more than C{threshold} bytes are output, or C{process} times out, the
+        process is killed, the generator stops, and C{self.diffUnavailable} is
+        set.
+        """
+        size = 0
+        for line in process.stdout:
+            size = size + len(line)
+            if threshold != -1 and size > threshold:
+                # No reason to let svnlook finish generating a diff we won't use
+                process.kill()
+                self.diffUnavailable = True
+                break
+            yield line
+        process.wait()
+
+        if process.timedOut:
+            self.diffUnavailable = True
+
+# Markers to tell us when we hit a new diff
+_markers = ['Modified', 'Added', 'Copied', 'Deleted', 'Property changes on']
+
+# The line svnlook puts before the property changes of a path
+_propertySeparator = '___________________________________________________________________\n'
+
+def splitDiffs(lines, keepLines=True):
+    """Splits the output of C{svnlook diff} into one diff per path in a single pass
+
+    Only the lines of the diff currently being read are held onto, so the
+    output can be streamed straight from a file or pipe.
+
+    @param lines: an iterable of the lines output by C{svnlook diff}
+    @param keepLines: whether to keep the lines of each diff, or only count them
+    @return: a generator of C{(lines, added, removed)} tuples, where C{lines}
+    starts with the Modified:/Added:/etc. marker line (and is only that line
+    without C{keepLines}) and C{added}/C{removed} count the +/- lines between
+    the marker line and the trailing line
+    """
+    diff = None
+    previous = None
+    added, removed = 0, 0
+
+    #A marker word after a "____" line is a change in a property and shouldn't be added as a change
+    #in a file. InProperty keeps track of this. If it's 0 this is a normal line, any larger
+    #and it's a property line.
+    inProperty = 1
+    for line in lines:
+        inProperty = max(0, inProperty-1)
+        if line == _propertySeparator:
+            inProperty = 2
+
+        # Look for Modified:, Added:, etc.
+        if line[0:line.find(':')] in _markers and not inProperty > 0:
+            # Handle starting a new diff
+            if diff:
+                yield diff, added, removed
+            diff = [line]
+            previous = None
+            added, removed = 0, 0
+        elif diff:
+            # Count the previous line now that we know it is not the last one
+            if previous is not None:
+                if previous[0:1] == '+' and not previous[0:4] == '+++ ':
+                    added = added + 1
+                elif previous[0:1] == '-' and not previous[0:4] == '--- ':
+                    removed = removed + 1
+            previous = line
+            if keepLines:
+                diff.append(line)
+
+    if diff:
+        yield diff, added, removed
+
+def _readAndRemove(path):
+    """@return: a generator of the lines in the file at C{path}, which is removed once they have all been read"""
+    f = open(path, 'r')
+    for line in f:
+        yield line
+    f.close()
+    os.remove(path)
 
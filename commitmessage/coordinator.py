@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""A short-lived process that assembles a CVS commit as its directories come in
+
+CVS executes the hooks once per directory. With C{[scm] coordinate = yes}, the
+first commitinfo of a commit starts a L{Coordinator}, and each loginfo hands
+its parsed L{commitmessage.model.Directory} to it with L{send} and returns
+straight away. The coordinator fills in the diffs on a worker thread while the
+later directories are still arriving, and executes the views once the last
+one is in.
+"""
+
+import cPickle
+import os
+import Queue
+import socket
+import sys
+import threading
+import traceback
+
+from commitmessage.client import readAll, request
+
+# How long the coordinator waits for the next directory before giving up on
+# the commit, e.g. because another commitinfo check rejected it
+IDLE_TIMEOUT = 300
+
+class Coordinator:
+    """Collects the directories of one commit for a
+    L{commitmessage.controllers.cvs.CvsController}"""
+
+    def __init__(self, controller, socketPath):
+        """
+        @param controller: the commitinfo's controller, which fills in the directories and executes the views
+        @param socketPath: the path of the Unix domain socket to listen on
+        """
+        self.controller = controller
+        self.socketPath = socketPath
+        self.directories = []
+        self._unfilled = Queue.Queue()
+
+    def start(self, logPath):
+        """Starts the coordinator in the background, returning once it is listening
+
+        @param logPath: where the coordinator's output goes, removed if there was none
+        """
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socketPath)
+        server.listen(16)
+
+        pid = os.fork()
+        if pid == 0:
+            # Detach from the hook so CVS does not wait on the coordinator
+            try:
+                os.setsid()
+                if os.fork() == 0:
+                    _redirectOutput(logPath)
+                    try:
+                        try:
+                            self.run(server)
+                        except Exception:
+                            traceback.print_exc()
+                    finally:
+                        sys.stdout.flush()
+                        sys.stderr.flush()
+                        if os.path.getsize(logPath) == 0:
+                            os.remove(logPath)
+            finally:
+                os._exit(0)
+
+        os.waitpid(pid, 0)
+        server.close()
+
+    def run(self, server):
+        """Accepts directories on the listening socket C{server} until the last one, then executes the views"""
+        worker = threading.Thread(target=self._fillIn)
+        worker.setDaemon(True)
+        worker.start()
+
+        server.settimeout(IDLE_TIMEOUT)
+        try:
+            while 1:
+                try:
+                    connection, address = server.accept()
+                except socket.timeout:
+                    sys.stderr.write('Gave up on the commit after %s seconds without a directory\n' % IDLE_TIMEOUT)
+                    return
+                try:
+                    message = cPickle.loads(readAll(connection))
+                    connection.sendall('ok')
+                finally:
+                    connection.close()
+
+                self.directories.append(message['directory'])
+                if not message['filled']:
+                    self._unfilled.put(message)
+                if message['last']:
+                    break
+        finally:
+            server.close()
+            os.remove(self.socketPath)
+
+        # Wait for the diffs still being filled in
+        self._unfilled.put(None)
+        worker.join()
+
+        model = self.controller.model
+        model.repo = message['repo']
+        model.log = message['log']
+        for directory in self.directories:
+            model.addDirectory(directory)
+        # Along with any the coordinator did not take, which their hooks
+        # filled in and journaled
+        self.controller._takeJournaledDirectories()
+        self.controller._executeViews()
+
+    def _fillIn(self):
+        """Fills in the directories that the hooks left to the coordinator, in the order they came in"""
+        while 1:
+            message = self._unfilled.get()
+            if message is None:
+                return
+            try:
+                self.controller._fillInValues(message['directory'], message['revisions'], message['rcsDirectory'])
+            except Exception:
+                sys.stderr.write('Error filling in %s:\n' % message['directory'].path)
+                traceback.print_exc()
+
+def send(socketPath, message):
+    """Hands a loginfo's C{message} (a dict of its C{directory}, C{revisions},
+    C{rcsDirectory}, whether it is C{filled} in already, whether it is the
+    C{last} directory, and the commit's C{repo} and C{log}) to the coordinator
+
+    @return: C{None} if the coordinator took it, otherwise the reason it did not
+    """
+    return request(socketPath, cPickle.dumps(message, 2))
+
+def _redirectOutput(logPath):
+    """Points C{stdin} at C{/dev/null} and C{stdout} and C{stderr} at C{logPath}"""
+    devnull = os.open(getattr(os, 'devnull', '/dev/null'), os.O_RDONLY)
+    log = os.open(logPath, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0600)
+    os.dup2(devnull, 0)
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+    os.close(devnull)
+    os.close(log)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""A long-running process that keeps commitmessage warm between commits
+
+The L{Daemon} parses the configuration once, keeps the controller and view
+modules imported and the SMTP connections open, and processes the jobs that
+hooks hand it with L{commitmessage.client.submit}.
+"""
+
+import marshal
+import os
+import Queue
+import socket
+import sys
+import threading
+import traceback
+
+from StringIO import StringIO
+
+from commitmessage.client import readAll
+from commitmessage.util import CmConfigParser, forgetProcesses, getNewInstance
+from commitmessage.views import email
+
+class Daemon:
+    """Accepts C{(controller, argv, stdin)} jobs on a Unix domain socket and
+    runs L{commitmessage.model.Controller.process} for each of them, one at a
+    time, on a worker thread
+
+    Only controllers that are C{detachable} (that do not depend on the hook's
+    working directory or process group) are accepted; the client processes
+    the commit itself for any others.
+    """
+
+    # How long a client may leave the socket idle while sending its job before
+    # it is dropped, so a stuck hook can not hold up every other commit
+    READ_TIMEOUT = 10.0
+
+    def __init__(self, configFile, socketPath):
+        """
+        @param configFile: the path of the config file, which is re-read whenever it changes
+        @param socketPath: the path of the Unix domain socket to listen on
+        """
+        self.configFile = configFile
+        self.socketPath = socketPath
+        self.jobs = Queue.Queue()
+        self._loadConfig()
+
+    def run(self):
+        """Listens for jobs until the process is killed"""
+        email.keepConnectionsOpen()
+
+        # Clean up after a previous daemon that was killed
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socketPath)
+        server.listen(16)
+
+        worker = threading.Thread(target=self._work)
+        worker.setDaemon(True)
+        worker.start()
+
+        try:
+            while 1:
+                connection, address = server.accept()
+                try:
+                    connection.settimeout(self.READ_TIMEOUT)
+                    try:
+                        connection.sendall(self._accept(readAll(connection)))
+                    except socket.error, e:
+                        # The client processes the commit itself
+                        sys.stderr.write('Dropping a client that did not send its job: %s\n' % e)
+                finally:
+                    connection.close()
+        finally:
+            server.close()
+            os.remove(self.socketPath)
+            email.closeConnections()
+
+    def _accept(self, data):
+        """Queues the job sent by a client
+
+        @return: the reply to the client, C{ok} if the job was queued
+        """
+        try:
+            controllerName, argv, stdin = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            return 'malformed job'
+
+        self._reloadConfigIfChanged()
+
+        if controllerName == '':
+            controllerName = self.config.get('scm', 'controller')
+        try:
+            controllerClass = getNewInstance(controllerName).__class__
+        except (ImportError, AttributeError), e:
+            return 'unknown controller %s: %s' % (controllerName, e)
+        if not getattr(controllerClass, 'detachable', False):
+            return '%s must run within the hook' % controllerName
+
+        self.jobs.put((self.config, controllerName, argv, stdin))
+        return 'ok'
+
+    def _work(self):
+        """Processes the queued jobs, one at a time"""
+        while 1:
+            config, controllerName, argv, stdin = self.jobs.get()
+            try:
+                controller = getNewInstance(controllerName)
+                controller.__init__(config, argv, StringIO(stdin))
+                controller.process()
+            except Exception:
+                sys.stderr.write('Error processing %s:\n' % ' '.join(argv))
+                traceback.print_exc()
+            # Nothing reports the job's svnlooks, which would otherwise be
+            # kept for as long as the daemon runs
+            forgetProcesses()
+
+    def _loadConfig(self):
+        """Parses the config file and imports its controller and views"""
+        mtime = os.stat(self.configFile).st_mtime
+        config = CmConfigParser(self.configFile)
+
+        getNewInstance(config.get('scm', 'controller'))
+        for name in config.options('views'):
+            getNewInstance(config.get('views', name))
+
+        self.config, self.configMtime = config, mtime
+
+    def _reloadConfigIfChanged(self):
+        """Re-reads the config file if it has been changed since it was last read"""
+        try:
+            if os.stat(self.configFile).st_mtime != self.configMtime:
+                self._loadConfig()
+        except Exception:
+            sys.stderr.write('Error reloading %s, keeping the old config:\n' % self.configFile)
+            traceback.print_exc()
@@ -6,14 +6,21 @@
 
 """Provides the model classes for the commitmessage framework"""
 
+import bisect
 import os
 import re
 import string
 import sys
+import threading
+
+from array import array
 
 from commitmessage.exceptions import CmException
 from commitmessage.attribute import attribute
 
+# The delta of a file whose diff is left out by the exclude patterns
+EXCLUDED = '<Excluded>'
+
 class Controller:
     """A base implementation for SCM-specific controllers to extend; mostly does
     the generic Views handling.
@@ -22,6 +29,11 @@ class Controller:
     # A temp directory to dump the diff files to.
     TMPDIR = os.getenv('TMP') or os.getenv('TEMP') or '/tmp'
 
+    # Whether the controller can build its model outside of the hook process
+    # that received the commit, e.g. in L{commitmessage.daemon}, as opposed to
+    # depending on the hook's working directory or process group.
+    detachable = False
+
     def __init__(self, config, argv, stdin):
         """Initializes the controller's model and saves the references to argv and stdin
 
@@ -37,6 +49,16 @@ class Controller:
         # Defaults
         self.addrepoprefix = 'no'
         self.matchwithrepoprefix = 'yes'
+        self.routeperfile = 'no'
+        self.timeout = ''
+        self.concurrency = '4'
+
+        # The facets of the model that the views need (see View.requires),
+        # worked out by buildModel; None until then, for all of them
+        self.facets = None
+
+        # The modules the commit goes to, worked out by route
+        self.routes = None
 
         # Get the other others in the 'scm' section
         for name in self.config.options('scm'):
@@ -57,15 +79,58 @@ class Controller:
         else:
             return False
 
+    def routePerFile(self):
+        """@return: whether each changed path should be matched to modules, rather than just the greatest common directory"""
+        if self.routeperfile == 'yes':
+            return True
+        else:
+            return False
+
+    def commandTimeout(self):
+        """@return: the number of seconds to let each SCM command run before killing it, or C{None} for no limit"""
+        if self.timeout == '':
+            return None
+        else:
+            return float(self.timeout)
+
+    def commandConcurrency(self):
+        """@return: how many SCM commands the controller may run at once"""
+        return max(1, int(self.concurrency))
+
+    def requires(self, facet):
+        """@return: whether the views the commit may go to need C{facet} of the model (see L{View.requires})"""
+        return self.facets is None or self.facets.has_key(facet)
+
     def process(self):
         """Starts the SCM-agnostic process of building the model and executing the views"""
+        if self.buildModel():
+            self._executeViews()
+
+    def buildModel(self):
+        """Builds the model for the commit
+
+        Only the facets of the model that the configured views require are
+        filled in.
+
+        @return: whether the model is complete and the views can be executed
+        """
+        self.facets = self.config.getRequiredFacets()
         self._populateModel()
 
         # Allow cvs to halt the process as it's data is cached between per-directory executions
         if self._stopProcessForNow():
-            return
+            return False
+
+        # There is nothing to execute if the controller routed the commit to no modules
+        return self.routes != []
 
-        self._executeViews()
+    def repository(self):
+        """@return: the repository the commit is to, which spooled commits can be ordered by"""
+        return self.model.repo
+
+    def revision(self):
+        """@return: the number of the repository's revision the commit made, if known before the model is built, otherwise C{None}"""
+        return None
 
     def _populateModel(self):
         """Builds the model for the commit
@@ -83,25 +148,118 @@ class Controller:
         """
         return False
 
+    def route(self):
+        """Matches the commit to modules, which only needs the paths of its
+        files and directories, so controllers can route before fetching the
+        rest of the model
+
+        @return: a list of C{(module, paths)}, where C{paths} are the paths
+        that the module's views see, or C{None} for the whole commit
+        """
+        if self.routes is None:
+            if self.routePerFile():
+                self.routes = self._routePerFile(self.model)
+            else:
+                self.routes = [(module, None) for module in self._routeCommit(self.model)]
+        return self.routes
+
+    def _excludeFiles(self, files):
+        """Leaves out the diffs of the C{files} that none of the views will
+        show, going by the C{exclude} patterns of C{[scm]} and, once the commit
+        is routed, of the modules it goes to
+
+        @return: the files that were excluded
+        """
+        excludes = self.config.getExcludes('scm')
+        routes = None
+        if self.routes is not None:
+            routes = []
+            for module, paths in self.routes:
+                facets = self.config.getRequiredFacets([module])
+                if not facets.has_key('deltas') and not facets.has_key('diffs'):
+                    # The module's views would not show the diff anyway
+                    continue
+                if paths is not None:
+                    paths = dict([(path, True) for path in paths])
+                routes.append((self.config.getExcludes(module), paths))
+
+        excluded = []
+        for file in files:
+            path = file.path
+            if excludes is not None and excludes.match(path):
+                excluded.append(file)
+            elif routes is not None:
+                # Keep the diff if any of the modules that see the file want it
+                wanted = False
+                for moduleExcludes, paths in routes:
+                    if (paths is None or paths.has_key(path)) and (moduleExcludes is None or not moduleExcludes.match(path)):
+                        wanted = True
+                        break
+                if not wanted:
+                    excluded.append(file)
+
+        for file in excluded:
+            file.delta = EXCLUDED
+            file.diff = ''
+        return excluded
+
     def _executeViews(self):
-        """Executes the views for each module that matches the commit's base directory"""
+        """Executes the views for each module that the commit goes to"""
+        # The views only read the model, so they all share one snapshot of it
+        model = self.model.freeze()
+
+        for module, paths in self.route():
+            moduleModel = model
+            if paths is not None:
+                moduleModel = model.slice(paths)
+            excludes = self.config.getExcludes(module)
+            if excludes is not None:
+                moduleModel = moduleModel.exclude(excludes)
+            views = self.config.getViewsForModule(module, moduleModel)
+            for view in views:
+                view.execute()
 
-        gcd = self.model.greatestCommonDirectory()
+    def _routeCommit(self, model):
+        """@return: the modules that match the commit's base directory"""
+        gcd = model.greatestCommonDirectory()
         # Handle adding on the file name if there is only one file involved
-        if len(self.model.files()) == 1:
-            gcd = gcd + self.model.files()[0].name
+        files = model.files()
+        if len(files) == 1:
+            gcd = gcd + files[0].name
         # Handle wanting to match against the repo
         if self.matchWithRepoPrefix():
-            gcd = '/' + self.model.repo + gcd
+            gcd = '/' + model.repo + gcd
 
-        for module in self.config.getModulesForPath(gcd):
-            views = self.config.getViewsForModule(module, self.model)
-            for view in views:
-                view.execute()
+        return self.config.getModulesForPath(gcd)
 
-class File:
+    def _routePerFile(self, model):
+        """@return: C{(module, paths)} for each module that matches any of the
+        commit's paths, with the paths that matched it"""
+        prefix = ''
+        if self.matchWithRepoPrefix():
+            prefix = '/' + model.repo
+
+        # Directories that were only changed through their files are left to
+        # the files, so a module is not handed a directory it has no part in
+        paths = [file.path for file in model.files()]
+        paths.extend([directory.path for directory in model.directories() if directory.action != 'none'])
+
+        pathsByModule = {}
+        for path in paths:
+            for module in self.config.getModulesForPath(prefix + path):
+                pathsByModule.setdefault(module, []).append(path)
+
+        routes = pathsByModule.items()
+        routes.sort()
+        return routes
+
+class File(object):
     """Represents a file that has been affected by the commit"""
 
+    # Commits can touch hundreds of thousands of files, so do without a
+    # __dict__ per file
+    __slots__ = ['_name', '_directory', '_action', '_rev', '_delta', '_diff', '_path', '_loader']
+
     def __init__(self, name, directory, action):
         """
         @param name: the file name, e.g. C{foo.txt}
@@ -111,12 +269,15 @@ class File:
         if name.find('/') != -1:
             raise CmException, "File names may not have foward slashes in them."
 
-        self._name = name
+        self._name = _intern(name)
         self._directory = directory
-        self._action = action
+        self._action = _intern(action)
         self._rev = None
         self._delta = None
         self._diff = None
+        self._path = directory.path + self._name
+        # The L{DiffLoader} still to fetch the delta and diff, if any
+        self._loader = None
 
         self.directory.addFile(self)
 
@@ -124,8 +285,20 @@ class File:
     directory = attribute('_directory', permit='r', doc="""The L{Directory} the file is in""")
     action = attribute('_action', permit='r', doc="""The action on thie file that required a commit, SCM-dependent""")
     rev = attribute('_rev', doc="""The revision number (SCM-dependent, could be per-file or per-commit) for this file""")
-    delta = attribute('_delta', doc="""The number of lines added/removed/changed in this commit""")
-    diff = attribute('_diff', doc="""The diff of what changed in the file""")
+
+    def _getDelta(self):
+        if self._loader is not None:
+            self._loader.load()
+        return self._delta
+
+    def _getDiff(self):
+        if self._loader is not None:
+            self._loader.load()
+        return self._diff
+
+    delta = attribute('_delta', fget=_getDelta, doc="""The number of lines added/removed/changed in this commit""")
+    diff = attribute('_diff', fget=_getDiff, doc="""The diff of what changed in the file""")
+    path = attribute('_path', permit='r', doc="""The full path (C{/dir/foo.txt}) of the file""")
 
     def __str__(self):
         """@return: the path of the file"""
@@ -135,46 +308,61 @@ class File:
         """@return: the cmp'ing of self.path and other.path"""
         return cmp(self.path, other.path)
 
-    def path():
-        doc = """The full path (C{/dir/foo.txt}) of the file"""
-        def fget(self):
-            return self.directory.path + self.name
-        return locals()
-    path = property(**path())
-
 _re_path = re.compile('^/([^/]+/)*$')
 
-class Directory:
+class Directory(object):
     """A directory that has been affected by the commit"""
 
+    __slots__ = ['_path', '_name', '_action', '_files', '_subdirectories', '_diff',
+        '_filesByName', '_subdirectoriesByName', '_deferSort', '_model', '_loader']
+
     def __init__(self, path, action='none'):
         if path == '' or not path.startswith('/') or not path.endswith('/'):
             raise CmException, 'Directory path (%s) must start with a forward slash and end with a forward slash.' % path
         elif not _re_path.match(path):
             raise CmException, 'Directory path (%s) must start with a forward slash and end with a forward slash.' % path
 
-        self._path = path
-        self._action = action
+        self._path = _intern(path)
+        if path == '/':
+            self._name = '/'
+        else:
+            # The path will be /aaa/bbb/name/
+            self._name = _intern(path.split('/')[-2])
+        self._action = _intern(action)
         self._files = []
         self._subdirectories = []
         self._diff = None
 
+        # The files and subdirectories by name, for constant time lookups
+        self._filesByName = {}
+        self._subdirectoriesByName = {}
+
+        # Whether addFile leaves sorting the files to whoever set this
+        self._deferSort = False
+
+        # The L{Model} whose tree this directory is in, told about any changes
+        self._model = None
+
+        # The L{DiffLoader} still to fetch the diff, if any
+        self._loader = None
+
+    def _getDiff(self):
+        if self._loader is not None:
+            self._loader.load()
+        return self._diff
+
+    def _setAction(self, action):
+        """Lets the model know when the directory's action changes"""
+        self._action = _intern(action)
+        if self._model is not None:
+            self._model._changed()
+
     path = attribute('_path', permit='r', doc="""The full path of the directory (C{/dir/dir/})""")
-    action = attribute('_action', permit='r', doc="""The action performed on this directory that caused the commit""")
+    name = attribute('_name', permit='r', doc="""The name of the directory (C{dir} with no slashes)""")
+    action = attribute('_action', permit='r', fset=_setAction, doc="""The action performed on this directory that caused the commit""")
     files = attribute('_files', permit='r', doc="""The L{File}s within this directory affected by the commit""")
     subdirectories = attribute('_subdirectories', permit='r', doc="""The L{Directory}s within this directory affected by the commit""")
-    diff = attribute('_diff', doc="""The diff of what changed in the file""")
-
-    def name():
-        doc = """The name of the directory (C{dir} with no slashes)"""
-        def fget(self):
-            if self.path == '/':
-                return '/'
-            else:
-                # The path will be /aaa/bbb/name/
-                return self.path.split('/')[-2]
-        return locals()
-    name = property(**name())
+    diff = attribute('_diff', fget=_getDiff, doc="""The diff of what changed in the directory""")
 
     def __str__(self):
         """@return: the path of the directory"""
@@ -193,33 +381,51 @@ class Directory:
 
     def file(self, name):
         """@return: the file in the current directory with C{name} or C{None}"""
-        for file in self.files:
-            if file.name == name:
-                return file
-        return None
+        return self._filesByName.get(name)
 
     def subdirectory(self, name):
         """@return: the subdirectory with C{name} or C{None}"""
-        for dir in self.subdirectories:
-            if dir.name == name:
-                return dir
-        return None
+        return self._subdirectoriesByName.get(name)
 
     def hasSubdirectory(self, name):
         """@return: whether the directory has a subdirectory with C{name}."""
-        for dir in self.subdirectories:
-            if dir.name == name:
-                return True
-        return False
+        return self._subdirectoriesByName.has_key(name)
 
     def addFile(self, file):
         """Saves a file object into this directory"""
         self.files.append(file)
+        if not self._deferSort:
+            self._sortFiles()
+        if self._model is not None:
+            self._model._changed()
+        # The first file with a name wins, as when the files were searched in order
+        if not self._filesByName.has_key(file.name):
+            self._filesByName[file.name] = file
+
+    def loadFiles(self, records):
+        """Adds a L{File} for each C{(name, action)} in C{records}, sorting the
+        files once at the end instead of after each one"""
+        self._deferSort = True
+        try:
+            for name, action in records:
+                File(name, self, action)
+        finally:
+            self._deferSort = False
+            self._sortFiles()
+
+    def _sortFiles(self):
+        """Sorts the files by name"""
         self.files.sort(lambda x,y: cmp(x.name, y.name))
+        if self._model is not None:
+            self._model._changed()
 
     def addSubdirectory(self, subdir):
         """Saves a directory object into this directory"""
         self.subdirectories.append(subdir)
+        if not self._subdirectoriesByName.has_key(subdir.name):
+            self._subdirectoriesByName[subdir.name] = subdir
+        if self._model is not None:
+            self._model._attach(subdir)
 
 class Model:
     """Wraps the L{File}s and L{Directory}s created by the L{Controller} and used by L{View}s"""
@@ -228,6 +434,14 @@ class Model:
         self._rootDirectory = Directory('/')
         self._user = ''
 
+        # Every directory in the tree by path
+        self._directoriesByPath = {'/': self._rootDirectory}
+        self._rootDirectory._model = self
+
+        # The flattened listings of the tree by (method, action), thrown away
+        # whenever the tree changes
+        self._listings = {}
+
     rootDirectory = attribute('_rootDirectory', permit='r', doc="""The root directory within the SCM""")
     user = attribute('_user', doc="""The user performing the commit""")
     log = attribute('_log', doc="""The comment the user entered for this commit""")
@@ -238,8 +452,9 @@ class Model:
         """
         if path[0] != '/' or path[-1] != '/':
             raise CmException, 'Directory paths must start with a forward slash and end with a forward slash.'
-        if path == '/':
-            return self.rootDirectory
+        directory = self._directoriesByPath.get(path)
+        if directory is not None:
+            return directory
 
         parts = path.split('/')
         currentDirectory = self.rootDirectory
@@ -254,6 +469,32 @@ class Model:
                     currentDirectory = newdir
         return currentDirectory
 
+    def load(self, records):
+        """Builds the tree from C{(path, action)} records, e.g. the output of
+        C{svnlook changed}, in one pass
+
+        Paths ending with a slash are directories, which get C{action} as
+        their action, and any other path is a file. Each directory's files
+        are only sorted once, after all of the records are in.
+        """
+        loading = {}
+        try:
+            for path, action in records:
+                if path.endswith('/'):
+                    self.directory(path).action = action
+                    continue
+
+                slash = path.rindex('/')
+                directory = self.directory(path[:slash+1])
+                if not directory._deferSort:
+                    directory._deferSort = True
+                    loading[directory.path] = directory
+                File(path[slash+1:], directory, action)
+        finally:
+            for directory in loading.values():
+                directory._deferSort = False
+                directory._sortFiles()
+
     def addDirectory(self, directory):
         """Adds C{directory} into the model's directory tree
 
@@ -266,6 +507,31 @@ class Model:
         if not parentDirectory.hasSubdirectory(directory.name):
             parentDirectory.addSubdirectory(directory)
 
+    def freeze(self):
+        """@return: a read-only L{FrozenModel} snapshot of the model as it is now"""
+        return FrozenModel(self)
+
+    def _attach(self, directory):
+        """Indexes C{directory} and its subdirectories, which were just added to the tree"""
+        self._directoriesByPath[directory.path] = directory
+        directory._model = self
+        for subdir in directory.subdirectories:
+            self._attach(subdir)
+        self._changed()
+
+    def _changed(self):
+        """Throws away the cached listings as the tree has changed"""
+        if self._listings:
+            self._listings = {}
+
+    def _listing(self, method, action):
+        """@return: a copy of the listing returned by C{method(action)}, which is only called when the listing is not cached"""
+        key = (method.__name__, action)
+        listing = self._listings.get(key)
+        if listing is None:
+            listing = self._listings[key] = method(action)
+        return listing[:]
+
     def greatestCommonDirectory(self):
         """@return: the greatest common directory of the commit to base the module matching on"""
         dir = self.rootDirectory
@@ -290,6 +556,10 @@ class Model:
 
     def files(self, action=None):
         """@return: a flat list of L{File}s, optionally those that match C{action}"""
+        return self._listing(self._allFiles, action)
+
+    def _allFiles(self, action):
+        """@return: a flat list of L{File}s (uncached)"""
         return self._files(self.rootDirectory, action)
 
     def _files(self, directory, action):
@@ -307,6 +577,10 @@ class Model:
 
     def directories(self, action=None):
         """@return: a flat list of L{Directory}s, optionally those that match C{action}."""
+        return self._listing(self._allDirectories, action)
+
+    def _allDirectories(self, action):
+        """@return: a flat list of L{Directory}s (uncached)"""
         dirs = self._directories(self.rootDirectory, action)
         dirs.sort(lambda x, y: cmp(x.name, y.name))
         return dirs
@@ -326,6 +600,10 @@ class Model:
 
     def directoriesWithFiles(self, action=None):
         """@return: a flat list of L{Directory}s that have changes to files"""
+        return self._listing(self._allDirectoriesWithFiles, action)
+
+    def _allDirectoriesWithFiles(self, action):
+        """@return: a flat list of L{Directory}s that have changes to files (uncached)"""
         dirs = self._directoriesWithFiles(self.rootDirectory, action)
         dirs.sort(lambda x, y: cmp(x.name, y.name))
         return dirs
@@ -339,9 +617,476 @@ class Model:
             dirs.extend(self._directoriesWithFiles(subdir, action))
         return dirs
 
+class DiffLoader:
+    """Leaves fetching the deltas and diffs of a group of L{File}s and
+    L{Directory}s until one of them is first read
+
+    Views that only list the files (e.g. the IM views) then never pay for
+    running C{svnlook diff} or C{cvs diff}. The fetch is run once, by
+    whichever thread reads a delta or diff first; any others wait for it.
+    If it fails, the deltas and diffs are left unavailable, as they are for
+    a commit over the summary threshold, rather than failing whichever view
+    happened to read first.
+    """
+
+    def __init__(self, nodes, fetch):
+        """
+        @param nodes: the files and directories whose deltas and diffs C{fetch} fills in
+        @param fetch: called with no arguments to fill them in, setting them as usual
+        """
+        self._nodes = nodes
+        self._fetch = fetch
+        self._lock = threading.RLock()
+        for node in nodes:
+            node._loader = self
+
+    def load(self):
+        """Runs the fetch, unless it has already been run"""
+        self._lock.acquire()
+        try:
+            # The fetch may read what it has filled in so far, which must not
+            # start it again
+            if self._fetch is None:
+                return
+            fetch, self._fetch = self._fetch, None
+            try:
+                try:
+                    fetch()
+                except Exception, e:
+                    sys.stderr.write('Could not fetch the diffs of the commit, leaving them unavailable: %s\n' % e)
+                    # Drop whatever was fetched before the failure
+                    for node in self._nodes:
+                        if isinstance(node, File):
+                            node.delta = '<Unavailable>'
+                            node.diff = ''
+                        else:
+                            node.diff = None
+            finally:
+                for node in self._nodes:
+                    node._loader = None
+                self._nodes = []
+        finally:
+            self._lock.release()
+
+class FrozenModel(object):
+    """A read-only snapshot of a L{Model}, made by L{Model.freeze} once the
+    controller has populated it
+
+    The tree is flattened into parallel arrays: by file, in the order of
+    L{Model.files}, the paths, names, actions, revisions, deltas, and the
+    offsets of each diff within one string of all of them; and by directory,
+    in a pre-order walk of the tree, the paths, names, actions, diffs,
+    subdirectories and the range of files each one holds. As nothing changes
+    once it is made, any number of threads can read it without locking, and
+    forked processes keep sharing its pages as it is a handful of large
+    objects instead of several per file.
+
+    It has the same read methods as L{Model}, returning L{FrozenDirectory}s
+    and L{FrozenFile}s made on demand, except that L{directory} returns
+    C{None} for a directory that is not in the commit instead of creating it.
+
+    Deltas and diffs that a L{DiffLoader} is still to fetch are read through
+    the model's own files and directories instead, and are fetched before the
+    snapshot is pickled.
+    """
+
+    def __init__(self, model):
+        state = self.__dict__
+        # Keep whatever else the controller set on the model, e.g. rev
+        for name, value in model.__dict__.items():
+            if not name.startswith('_'):
+                state[name] = value
+        for name in ['user', 'log', 'repo']:
+            if hasattr(model, name):
+                state[name] = getattr(model, name)
+
+        for name in ['_paths', '_names', '_actions', '_revs',
+                '_directoryPaths', '_directoryNames', '_directoryActions', '_directoryDiffs', '_subdirectories',
+                '_sources', '_directorySources']:
+            state[name] = []
+        for name in ['_directoryOf', '_firstFiles', '_lastFiles', '_parents']:
+            state[name] = array('l')
+        state['_pending'] = False
+
+        # Which files and directories are in the snapshot, None for all of
+        # them, or masks for a L{slice} of it
+        state['_selectedFiles'] = state['_fileMask'] = state['_directoryMask'] = None
+
+        # Which directories of a slice were routed to it themselves, rather
+        # than only being above its paths, None for all of them
+        state['_routedDirectories'] = None
+
+        # Which files the views should not see the diffs of, None for none
+        state['_excludedFiles'] = None
+
+        # The (delta, diff) of each file
+        values = []
+        self._flatten(model.rootDirectory, -1, values)
+        _storeValues(state, values)
+
+        # The files and directories are only kept to read the deltas and diffs
+        # that a L{DiffLoader} is still to fetch from
+        if not self._pending:
+            state['_sources'] = state['_directorySources'] = None
+
+        state['_directoryIndexes'] = {}
+        for i in xrange(len(self._directoryPaths)):
+            self._directoryIndexes.setdefault(self._directoryPaths[i], i)
+
+        # Model.directories lists the directories by name
+        order = range(len(self._directoryNames))
+        order.sort(lambda x, y: cmp(self._directoryNames[x], self._directoryNames[y]))
+        state['_directoryOrder'] = array('l', order)
+
+    def _flatten(self, directory, parent, values):
+        """Appends C{directory} (within the directory at index C{parent}), its
+        files and then its subdirectories to the arrays
+
+        @return: the index of C{directory}
+        """
+        state = self.__dict__
+        index = len(self._directoryPaths)
+        self._directoryPaths.append(directory.path)
+        self._directoryNames.append(directory.name)
+        self._directoryActions.append(directory.action)
+        self._parents.append(parent)
+        self._directorySources.append(directory)
+        if directory._loader is not None:
+            state['_pending'] = True
+            self._directoryDiffs.append(None)
+        else:
+            self._directoryDiffs.append(directory._diff)
+        self._subdirectories.append(())
+
+        self._firstFiles.append(len(self._paths))
+        for file in directory.files:
+            self._paths.append(file.path)
+            self._names.append(file.name)
+            self._actions.append(file.action)
+            self._revs.append(file.rev)
+            self._directoryOf.append(index)
+            self._sources.append(file)
+            if file._loader is not None:
+                state['_pending'] = True
+                values.append((None, None))
+            else:
+                values.append((file._delta, file._diff))
+        self._lastFiles.append(len(self._paths))
+
+        self._subdirectories[index] = tuple([self._flatten(subdir, index, values) for subdir in directory.subdirectories])
+        return index
+
+    def __getstate__(self):
+        """@return: the snapshot to pickle, with whatever deltas and diffs were left to fetch fetched"""
+        if self._sources is None:
+            return self.__dict__
+        state = self.__dict__.copy()
+        _storeValues(state, [(file.delta, file.diff) for file in self._sources])
+        state['_directoryDiffs'] = [directory.diff for directory in self._directorySources]
+        state['_sources'] = state['_directorySources'] = None
+        state['_pending'] = False
+        return state
+
+    def __setattr__(self, name, value):
+        raise AttributeError('The frozen model can not be changed')
+
+    rootDirectory = property(lambda self: FrozenDirectory(self, 0), doc="""The root directory within the SCM""")
+
+    def freeze(self):
+        """@return: the model itself, as it is already frozen"""
+        return self
+
+    def slice(self, paths):
+        """@return: a L{FrozenModel} of only the files and directories at
+        C{paths}, and the directories above them, for views that should only
+        see their part of the commit; it shares this snapshot's arrays
+        instead of copying them"""
+        fileMask = array('B', [0]) * len(self._paths)
+        directoryMask = array('B', [0]) * len(self._directoryPaths)
+        directoryMask[0] = 1
+        routedDirectories = array('B', [0]) * len(self._directoryPaths)
+        for path in paths:
+            if path.endswith('/'):
+                index = self._directoryIndexes.get(path)
+                if index is None or not self._hasDirectory(index):
+                    continue
+                if self._isRouted(index):
+                    routedDirectories[index] = 1
+            else:
+                file = self.file(path)
+                if file is None:
+                    continue
+                fileMask[file._index] = 1
+                index = self._directoryOf[file._index]
+            while index != -1 and not directoryMask[index]:
+                directoryMask[index] = 1
+                index = self._parents[index]
+
+        sliced = self._copy()
+        state = sliced.__dict__
+        state['_fileMask'] = fileMask
+        state['_directoryMask'] = directoryMask
+        state['_routedDirectories'] = routedDirectories
+        state['_selectedFiles'] = array('l', [i for i in self._fileIndexes() if fileMask[i]])
+        return sliced
+
+    def exclude(self, regex):
+        """@return: a L{FrozenModel} of the same files, but where those whose
+        paths match C{regex} have no diff and an L{EXCLUDED} delta; it shares
+        this snapshot's arrays instead of copying them"""
+        if self._excludedFiles is None:
+            excludedFiles = array('B', [0]) * len(self._paths)
+        else:
+            excludedFiles = array('B', self._excludedFiles)
+        for i in self._fileIndexes():
+            if regex.match(self._paths[i]):
+                excludedFiles[i] = 1
+
+        excluding = self._copy()
+        excluding.__dict__['_excludedFiles'] = excludedFiles
+        return excluding
+
+    def _copy(self):
+        """@return: a shallow copy of the snapshot, for L{slice} and L{exclude}"""
+        copy = object.__new__(FrozenModel)
+        copy.__dict__.update(self.__dict__)
+        return copy
+
+    def _fileIndexes(self):
+        """@return: the indexes of the files in the snapshot"""
+        if self._selectedFiles is None:
+            return xrange(len(self._paths))
+        return self._selectedFiles
+
+    def _isRouted(self, index):
+        """@return: whether the directory at C{index} was itself routed to the
+        snapshot, as opposed to only being above the paths of a L{slice}"""
+        return self._routedDirectories is None or self._routedDirectories[index]
+
+    def _directoryAction(self, index):
+        """@return: the action of the directory at C{index}, or C{none} if it is only above the paths of a L{slice}"""
+        if self._isRouted(index):
+            return self._directoryActions[index]
+        return 'none'
+
+    def _hasDirectory(self, index):
+        """@return: whether the directory at C{index} is in the snapshot"""
+        return self._directoryMask is None or self._directoryMask[index]
+
+    def _filesOf(self, index):
+        """@return: the indexes of the files of the directory at C{index} that are in the snapshot"""
+        files = xrange(self._firstFiles[index], self._lastFiles[index])
+        if self._fileMask is None:
+            return files
+        return [i for i in files if self._fileMask[i]]
+
+    def _subdirectoriesOf(self, index):
+        """@return: the indexes of the subdirectories of the directory at C{index} that are in the snapshot"""
+        if self._directoryMask is None:
+            return self._subdirectories[index]
+        return [i for i in self._subdirectories[index] if self._directoryMask[i]]
+
+    def directory(self, path):
+        """@return: the L{FrozenDirectory} for C{path} or C{None}"""
+        if path[0] != '/' or path[-1] != '/':
+            raise CmException, 'Directory paths must start with a forward slash and end with a forward slash.'
+        index = self._directoryIndexes.get(path)
+        if index is None or not self._hasDirectory(index):
+            return None
+        return FrozenDirectory(self, index)
+
+    def file(self, path):
+        """@return: the L{FrozenFile} for C{path} or C{None}"""
+        if path == '':
+            raise CmException, "File paths may not be empty."
+        if path[0] != '/' or path[-1] == '/':
+            raise CmException, "File paths must begin with a forward slash and not end with a forward slash."
+        slash = path.rindex('/')
+        directory = self.directory(path[:slash+1])
+        if directory is None:
+            return None
+        return directory.file(path[slash+1:])
+
+    def greatestCommonDirectory(self):
+        """@return: the greatest common directory of the commit to base the module matching on"""
+        i = 0
+        while self._directoryAction(i) == 'none' \
+            and len(self._subdirectoriesOf(i)) == 1 \
+            and len(self._filesOf(i)) == 0:
+            i = self._subdirectoriesOf(i)[0]
+        return self._directoryPaths[i]
+
+    def files(self, action=None):
+        """@return: a flat list of L{FrozenFile}s, optionally those that match C{action}"""
+        return [FrozenFile(self, i) for i in self._fileIndexes() if action is None or self._actions[i] == action]
+
+    def directories(self, action=None):
+        """@return: a flat list of L{FrozenDirectory}s, optionally those that match C{action}."""
+        return [FrozenDirectory(self, i) for i in self._directoryOrder
+            if self._hasDirectory(i) and (action is None or self._directoryAction(i) == action)]
+
+    def directoriesWithFiles(self, action=None):
+        """@return: a flat list of L{FrozenDirectory}s that have changes to files"""
+        return [FrozenDirectory(self, i) for i in self._directoryOrder if self._hasDirectory(i) and self._hasFiles(i, action)]
+
+    def _hasFiles(self, index, action):
+        """@return: whether the directory at C{index} has any files with C{action}"""
+        for i in self._filesOf(index):
+            if action is None or self._actions[i] == action:
+                return True
+        return False
+
+class FrozenDirectory(object):
+    """A read-only view of a directory in a L{FrozenModel}"""
+
+    __slots__ = ['_model', '_index']
+
+    def __init__(self, model, index):
+        self._model = model
+        self._index = index
+
+    path = property(lambda self: self._model._directoryPaths[self._index], doc="""The full path of the directory (C{/dir/dir/})""")
+    name = property(lambda self: self._model._directoryNames[self._index], doc="""The name of the directory (C{dir} with no slashes)""")
+    action = property(lambda self: self._model._directoryAction(self._index), doc="""The action performed on this directory that caused the commit""")
+
+    def diff():
+        doc = """The diff of what changed in the directory"""
+        def fget(self):
+            if not self._model._isRouted(self._index):
+                # The diff went to whichever module the directory was routed to
+                return None
+            if self._model._directorySources is not None:
+                return self._model._directorySources[self._index].diff
+            return self._model._directoryDiffs[self._index]
+        return locals()
+    diff = property(**diff())
+
+    def files():
+        doc = """The L{FrozenFile}s within this directory affected by the commit"""
+        def fget(self):
+            return [FrozenFile(self._model, i) for i in self._model._filesOf(self._index)]
+        return locals()
+    files = property(**files())
+
+    def subdirectories():
+        doc = """The L{FrozenDirectory}s within this directory affected by the commit"""
+        def fget(self):
+            return [FrozenDirectory(self._model, i) for i in self._model._subdirectoriesOf(self._index)]
+        return locals()
+    subdirectories = property(**subdirectories())
+
+    def __str__(self):
+        """@return: the path of the directory"""
+        return """<Directory '%s'>""" % self.path
+
+    def __cmp__(self, other):
+        """@return: the cmp'ing self.path and other.path"""
+        return cmp(self.path, other.path)
+
+    def filesByAction(self, action):
+        """@return: the files in this directory with C{action}, or all of them if it is C{None}"""
+        if action == None:
+            return self.files
+        else:
+            return filter(lambda file: file.action == action, self.files)
+
+    def file(self, name):
+        """@return: the file in the current directory with C{name} or C{None}"""
+        # The files are sorted by name within each directory
+        model, last = self._model, self._model._lastFiles[self._index]
+        i = bisect.bisect_left(model._names, name, model._firstFiles[self._index], last)
+        if i < last and model._names[i] == name and (model._fileMask is None or model._fileMask[i]):
+            return FrozenFile(model, i)
+        return None
+
+    def subdirectory(self, name):
+        """@return: the subdirectory with C{name} or C{None}"""
+        for i in self._model._subdirectoriesOf(self._index):
+            if self._model._directoryNames[i] == name:
+                return FrozenDirectory(self._model, i)
+        return None
+
+    def hasSubdirectory(self, name):
+        """@return: whether the directory has a subdirectory with C{name}."""
+        return self.subdirectory(name) is not None
+
+class FrozenFile(object):
+    """A read-only view of a file in a L{FrozenModel}"""
+
+    __slots__ = ['_model', '_index']
+
+    def __init__(self, model, index):
+        self._model = model
+        self._index = index
+
+    name = property(lambda self: self._model._names[self._index], doc="""The file name (C{foo.txt})""")
+    path = property(lambda self: self._model._paths[self._index], doc="""The full path (C{/dir/foo.txt}) of the file""")
+    directory = property(lambda self: FrozenDirectory(self._model, self._model._directoryOf[self._index]), doc="""The L{FrozenDirectory} the file is in""")
+    action = property(lambda self: self._model._actions[self._index], doc="""The action on the file that required a commit, SCM-dependent""")
+    rev = property(lambda self: self._model._revs[self._index], doc="""The revision number for this file""")
+
+    def delta():
+        doc = """The number of lines added/removed/changed in this commit"""
+        def fget(self):
+            if self._model._excludedFiles is not None and self._model._excludedFiles[self._index]:
+                return EXCLUDED
+            if self._model._sources is not None:
+                return self._model._sources[self._index].delta
+            return self._model._deltas[self._index]
+        return locals()
+    delta = property(**delta())
+
+    def diff():
+        doc = """The diff of what changed in the file"""
+        def fget(self):
+            model, i = self._model, self._index
+            if model._excludedFiles is not None and model._excludedFiles[i]:
+                return ''
+            if model._sources is not None:
+                return model._sources[i].diff
+            if model._noDiffs[i]:
+                return None
+            return model._diffs[model._diffOffsets[i]:model._diffOffsets[i+1]]
+        return locals()
+    diff = property(**diff())
+
+    def __str__(self):
+        """@return: the path of the file"""
+        return '<File %s>' % self.path
+
+    def __cmp__(self, other):
+        """@return: the cmp'ing of self.path and other.path"""
+        return cmp(self.path, other.path)
+
+def _storeValues(state, values):
+    """Stores the C{(delta, diff)} of each file into the arrays of a L{FrozenModel}'s C{state}"""
+    state['_deltas'] = [delta for delta, diff in values]
+    state['_diffOffsets'] = offsets = array('l', [0])
+    # Whether each file's diff is None rather than empty
+    state['_noDiffs'] = array('B', [diff is None for delta, diff in values])
+    diffs = [diff for delta, diff in values if diff is not None]
+    for delta, diff in values:
+        offsets.append(offsets[-1] + len(diff or ''))
+    state['_diffs'] = ''.join(diffs)
+
+def _intern(s):
+    """@return: the interned copy of C{s}, as the same names and actions
+    come up over and over again in a large commit"""
+    try:
+        return intern(s)
+    except TypeError:
+        # Only plain strings can be interned
+        return s
+
 class View:
     """A base class for specific view implementations to extend"""
 
+    # The facets of the model the view reads, so the controller can skip
+    # fetching the others: 'files' (the files and directories and their
+    # actions), 'log' (the user and log message), 'deltas', 'diffs' (of the
+    # files) and 'directoryDiffs' (the property changes of directories)
+    requires = ['files', 'log', 'deltas', 'diffs', 'directoryDiffs']
+
     def __init__(self, name, model):
         """Initializes a new view given it's instance C{name} and C{model}"""
         self.acceptance = 0
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""A reader for the RCS C{,v} files that CVS keeps its history in
+
+Lets the CVS controller get at the text of any revision of a file without
+running C{cvs}, as the loginfo hook runs on the server next to the
+repository. See C{man rcsfile} for the format.
+"""
+
+import re
+
+from commitmessage.exceptions import CmException
+
+_space = re.compile(r"\s*")
+_word = re.compile(r"[^\s;:@]+|[;:]")
+
+class RcsFile:
+    """The parsed contents of an RCS C{,v} file
+
+    C{admin} maps each header keyword (C{head}, C{expand}, etc.) to its list
+    of values, C{deltas} maps each revision to its C{date}, C{author},
+    C{state}, C{branches} and C{next}, and C{texts} maps each revision to its
+    stored text, which is the full text for the head revision and an edit
+    script against a neighbouring revision for every other one.
+    """
+
+    def __init__(self, path):
+        """Reads and parses the RCS file at C{path}"""
+        self.path = path
+        f = open(path, 'rb')
+        try:
+            self._data = f.read()
+        finally:
+            f.close()
+        self._pos = 0
+
+        self.admin = {}
+        self.deltas = {}
+        self.texts = {}
+        self.logs = {}
+        try:
+            self._parse()
+        except (IndexError, ValueError):
+            raise CmException('%s ends early' % path)
+        del self._data
+
+    def isBinary(self):
+        """@return: whether the file is stored with C{-kb}"""
+        return self.admin.get('expand') == ['b']
+
+    def date(self, rev):
+        """@return: the date C{rev} was committed, formatted as CVS does (C{2005/01/01 12:00:00})"""
+        parts = self.deltas[rev]['date'][0].split('.')
+        # Dates before 2000 have two digit years
+        if len(parts[0]) == 2:
+            parts[0] = '19' + parts[0]
+        return '%s/%s/%s %s:%s:%s' % tuple(parts)
+
+    def lines(self, rev):
+        """@return: the lines of the text of C{rev}, without any keywords expanded"""
+        return self.linesOfEach([rev])[0]
+
+    def linesOfEach(self, revs):
+        """Rebuilds several revisions at once, such as the two sides of a diff
+
+        The history is walked once, along the longest of the revisions' paths
+        from the head, picking up the others on the way; any that are not on
+        it are rebuilt on their own.
+
+        @return: the lines of the text of each of C{revs}, in the same order
+        """
+        paths = [self._path(rev) for rev in revs]
+        longest = paths[0]
+        for path in paths[1:]:
+            if len(path) > len(longest):
+                longest = path
+
+        wanted = {}
+        for rev in revs:
+            wanted[rev] = True
+        found = {}
+        lines = splitLines(self.texts[longest[0]])
+        for current in longest:
+            if current != longest[0]:
+                lines = applyEdits(lines, self.texts[current])
+            if wanted.has_key(current):
+                found[current] = lines
+
+        for path in paths:
+            if not found.has_key(path[-1]):
+                found[path[-1]] = self.linesOfEach([path[-1]])[0]
+        return [found[rev] for rev in revs]
+
+    def _path(self, rev):
+        """@return: the revisions whose texts are applied, starting with the head's full text, to rebuild C{rev}"""
+        if not self.deltas.has_key(rev):
+            raise CmException('%s has no revision %s' % (self.path, rev))
+        nums = rev.split('.')
+
+        # Walk back down the trunk from the head to where rev branches off
+        current = self.admin['head'][0]
+        path = [current]
+        trunk = '.'.join(nums[:2])
+        while current != trunk:
+            current = self._next(current)
+            path.append(current)
+
+        # Then walk up each branch to rev
+        for i in range(2, len(nums), 2):
+            branch = '.'.join(nums[:i+1]) + '.'
+            target = '.'.join(nums[:i+2])
+            starts = [b for b in self.deltas[current]['branches'] if b.startswith(branch)]
+            if len(starts) == 0:
+                raise CmException('%s has no branch %s' % (self.path, branch[:-1]))
+            current = starts[0]
+            path.append(current)
+            while current != target:
+                current = self._next(current)
+                path.append(current)
+
+        return path
+
+    def _next(self, rev):
+        """@return: the revision whose text is stored as edits against C{rev}'s"""
+        next = self.deltas[rev]['next']
+        if len(next) == 0:
+            raise CmException('%s has nothing after revision %s' % (self.path, rev))
+        return next[0]
+
+    def _parse(self):
+        """Parses the admin, delta, desc and deltatext sections"""
+        word = self._nextWord()
+        while word != 'desc' and not word[0].isdigit():
+            self.admin[word] = self._phrase()
+            word = self._nextWord()
+
+        while word != 'desc':
+            rev, delta = word, {'branches': [], 'next': []}
+            word = self._nextWord()
+            while word != 'desc' and not word[0].isdigit():
+                delta[word] = self._phrase()
+                word = self._nextWord()
+            self.deltas[rev] = delta
+
+        self._nextString()
+
+        while self._skipSpace():
+            rev = self._nextWord()
+            while 1:
+                word = self._nextWord()
+                if word == 'log':
+                    self.logs[rev] = self._nextString()
+                elif word == 'text':
+                    self.texts[rev] = self._nextString()
+                    break
+                else:
+                    self._phrase()
+
+    def _phrase(self):
+        """@return: the values up to the next C{;}, skipping over the C{:}s"""
+        values = []
+        while 1:
+            if self._skipSpace() and self._data[self._pos] == '@':
+                values.append(self._nextString())
+                continue
+            word = self._nextWord()
+            if word == ';':
+                return values
+            if word != ':':
+                values.append(word)
+
+    def _skipSpace(self):
+        """@return: whether there is anything left after skipping the whitespace"""
+        self._pos = _space.match(self._data, self._pos).end()
+        return self._pos < len(self._data)
+
+    def _nextWord(self):
+        """@return: the next id, num, C{;} or C{:}"""
+        self._skipSpace()
+        match = _word.match(self._data, self._pos)
+        if match is None:
+            raise CmException('%s has a malformed word at byte %s' % (self.path, self._pos))
+        self._pos = match.end()
+        return match.group()
+
+    def _nextString(self):
+        """@return: the next C{@}-quoted string, unquoted"""
+        self._skipSpace()
+        if self._data[self._pos] != '@':
+            raise CmException('%s is missing a string at byte %s' % (self.path, self._pos))
+        start = end = self._pos + 1
+        while 1:
+            end = self._data.index('@', end)
+            if self._data[end+1:end+2] != '@':
+                break
+            end = end + 2
+        self._pos = end + 1
+        return self._data[start:end].replace('@@', '@')
+
+def splitLines(text):
+    """@return: the lines of C{text}, each with its C{\\n} except for a final line without one"""
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last != '':
+        lines.append(last)
+    return lines
+
+def applyEdits(lines, script):
+    """Applies an RCS edit script (C{dL N} deletes N lines at line L, C{aL N}
+    adds the N lines that follow after line L) to C{lines}
+
+    @return: the edited lines
+    """
+    result = []
+    # How many of the original lines have been used up
+    used = 0
+    script = splitLines(script)
+    i = 0
+    while i < len(script):
+        command = script[i]
+        i = i + 1
+        line, count = [int(n) for n in command[1:].split()]
+        if command[0] == 'd':
+            result.extend(lines[used:line-1])
+            used = line - 1 + count
+        elif command[0] == 'a':
+            result.extend(lines[used:line])
+            used = line
+            result.extend(script[i:i+count])
+            i = i + count
+        else:
+            raise CmException('Unknown RCS edit command %s' % command.strip())
+    result.extend(lines[used:])
+    return result
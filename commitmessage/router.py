@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Matches commit paths against the C{[modules]} patterns without trying each one in turn
+
+With thousands of modules (e.g. one per team directory), trying every pattern
+against every commit adds up, so the L{ModuleRouter} is built once per config
+and splits the patterns in two: plain strings, which only match the start of
+the path, go into a trie that is walked once per path, and the rest are
+combined into a few large regexes.
+"""
+
+import fnmatch
+import re
+
+# The characters that make a pattern more than a plain string
+_special = '.^$*+?{}[]|()\\'
+
+# How many patterns to combine into each regex, which keeps the regexes small
+# enough to compile quickly and the ones that need checking one by one few
+CHUNK_SIZE = 50
+
+# Python's re module only supports 100 groups in a regex
+MAX_GROUPS = 99
+
+# Patterns that can not be combined with others: inline flags apply to the
+# whole regex, back references would point at the wrong group, and a named
+# group may be defined by another module's pattern too
+_standalone = re.compile(r'\(\?P<|\(\?P=|\(\?[a-zA-Z]|\\[0-9]')
+
+class ModuleRouter:
+    """The modules whose C{[modules]} pattern matches (with C{re.match}) a path"""
+
+    def __init__(self, patterns):
+        """
+        @param patterns: a list of C{(module, pattern)}, as in the C{[modules]} section
+        """
+        # Each node of the trie is its edges, by the first character of their
+        # label, to the (label, node) they lead to, and the modules whose
+        # string ends at the node
+        self._trie = ({}, [])
+        # The compiled regexes, by pattern; a router loaded from its
+        # __getstate__ compiles them as they are needed
+        self._compiled = {}
+        regexes = []
+        for module, pattern in patterns:
+            literal = literalPrefix(pattern)
+            if literal is None:
+                regexes.append((module, self._regex(pattern)))
+            else:
+                self._insert(literal, module)
+
+        # Each chunk is a regex of its patterns as alternatives, which only
+        # matches if one of them does, and the patterns themselves
+        self._chunks = []
+        chunk, groups = [], 0
+        for module, regex in regexes:
+            if _standalone.search(regex.pattern):
+                self._chunks.append((regex.pattern, [(module, regex.pattern)]))
+                continue
+            if len(chunk) == CHUNK_SIZE or groups + regex.groups > MAX_GROUPS:
+                self._addChunk(chunk)
+                chunk, groups = [], 0
+            chunk.append((module, regex.pattern))
+            groups = groups + regex.groups
+        self._addChunk(chunk)
+
+    def __getstate__(self):
+        """@return: the trie and chunks, which are plain data that marshal can store too"""
+        return {'trie': self._trie, 'chunks': self._chunks}
+
+    def __setstate__(self, state):
+        """Restores a router from its L{__getstate__}, without compiling any regexes yet"""
+        self._trie = state['trie']
+        self._chunks = state['chunks']
+        self._compiled = {}
+
+    def _regex(self, pattern):
+        """@return: C{pattern} compiled, once per router"""
+        regex = self._compiled.get(pattern)
+        if regex is None:
+            regex = self._compiled[pattern] = re.compile(pattern)
+        return regex
+
+    def _insert(self, literal, module):
+        """Adds C{module} to the trie under the string C{literal}"""
+        node = self._trie
+        while literal != '':
+            edge = node[0].get(literal[0])
+            if edge is None:
+                node[0][literal[0]] = (literal, ({}, [module]))
+                return
+            label, child = edge
+            # Find how much of the label the literal shares
+            common = 1
+            while common < len(label) and common < len(literal) and label[common] == literal[common]:
+                common = common + 1
+            if common < len(label):
+                # Split the edge where the literal leaves it
+                middle = ({label[common]: (label[common:], child)}, [])
+                node[0][literal[0]] = (label[:common], middle)
+                child = middle
+            node, literal = child, literal[common:]
+        node[1].append(module)
+
+    def _addChunk(self, chunk):
+        """Combines the C{(module, pattern)}s in C{chunk} into one regex"""
+        if len(chunk) == 0:
+            return
+        if len(chunk) == 1:
+            self._chunks.append((chunk[0][1], chunk))
+        else:
+            combined = self._regex('|'.join(['(?:%s)' % pattern for module, pattern in chunk]))
+            self._chunks.append((combined.pattern, chunk))
+
+    def route(self, path):
+        """@return: the modules whose pattern matches C{path}, in no particular order"""
+        modules = []
+
+        node, i = self._trie, 0
+        while 1:
+            modules.extend(node[1])
+            if i == len(path):
+                break
+            edge = node[0].get(path[i])
+            if edge is None or not path.startswith(edge[0], i):
+                break
+            i = i + len(edge[0])
+            node = edge[1]
+
+        for combined, chunk in self._chunks:
+            if self._regex(combined).match(path):
+                if len(chunk) == 1:
+                    modules.append(chunk[0][0])
+                else:
+                    for module, pattern in chunk:
+                        if self._regex(pattern).match(path):
+                            modules.append(module)
+
+        return modules
+
+def compileExcludes(patterns):
+    """@return: a regex that matches the paths that any of the fnmatch-style
+    C{patterns} (e.g. C{vendor/*} or C{*.lock}) match, or C{None} if there are
+    none; patterns that do not start with a C{/} match from any directory
+    down"""
+    regexes = []
+    for pattern in patterns:
+        regex = fnmatch.translate(pattern)
+        if not pattern.startswith('/'):
+            regex = '(?:.*/)?' + regex
+        regexes.append('(?:%s)' % regex)
+    if len(regexes) == 0:
+        return None
+    return re.compile('|'.join(regexes))
+
+def literalPrefix(pattern):
+    """@return: the string that C{pattern} matches at the start of a path, or
+    C{None} if it is not a plain string (other than an optional leading C{^}
+    and escaped punctuation)"""
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    literal = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            # \. is a plain ., but \d, \w, etc. are not plain strings
+            if i + 1 == len(pattern) or pattern[i+1].isalnum():
+                return None
+            literal.append(pattern[i+1])
+            i = i + 2
+            continue
+        if c in _special:
+            return None
+        literal.append(c)
+        i = i + 1
+    return ''.join(literal)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""A durable on-disk queue of commits and the pool of worker processes that empties it
+
+Hooks add their commit to a L{Spool} with L{spoolCommit} and exit, so a slow
+mail server or a huge diff no longer holds up the committer. L{runWorkers}
+then processes the spooled commits in parallel (Unix only).
+"""
+
+import cPickle
+import errno
+import fcntl
+import os
+import sys
+import time
+import traceback
+
+from StringIO import StringIO
+
+from commitmessage.util import CmConfigParser, getNewInstance
+
+try:
+    from hashlib import md5
+except ImportError:
+    # Python 2.4
+    from md5 import new as md5
+
+class Spool:
+    """A directory of commits waiting to be processed
+
+    Uses the maildir layout so that a crash never leaves a half-written job
+    behind: jobs are written to C{tmp}, renamed into C{new} once they are
+    safely on disk, moved into C{cur} while being processed, and moved into
+    C{failed} if processing them raised an exception.
+
+    Job file names start with the time they were added, so sorting them gives
+    the order they arrived in, and end with the commit's revision, if its
+    controller knows it up front, and a hash of the commit's repository, so
+    they can be ordered per repository without being read.
+    """
+
+    def __init__(self, path):
+        """Creates the spool's directories at C{path} if they do not exist yet"""
+        self.path = path
+        for name in ['tmp', 'new', 'cur', 'failed']:
+            try:
+                os.makedirs(os.path.join(path, name))
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+        self._count = 0
+
+    def add(self, job):
+        """Durably adds C{job} (a dict as created by L{spoolCommit}) to the spool"""
+        self._count = self._count + 1
+        revision = job.get('revision')
+        if revision is None:
+            revision = '-'
+        name = '%017.6f.%s.%06d.%s.%s' % (time.time(), os.getpid(), self._count, revision, keyOf(job['repository']))
+
+        tmpPath = os.path.join(self.path, 'tmp', name)
+        f = open(tmpPath, 'wb')
+        cPickle.dump(job, f, 2)
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+        os.rename(tmpPath, os.path.join(self.path, 'new', name))
+        _fsyncDirectory(os.path.join(self.path, 'new'))
+
+    def pending(self):
+        """@return: the names of the jobs waiting to be processed, oldest first
+
+        The hooks of two commits to the same repository can race, so each
+        repository's jobs with a revision are put back in revision order,
+        within the places they arrived in. Jobs without one (such as CVS
+        commits) stay in the order they arrived in.
+        """
+        names = os.listdir(os.path.join(self.path, 'new'))
+        names.sort()
+
+        places = {}
+        for i in range(len(names)):
+            if revisionOf(names[i]) is not None:
+                places.setdefault(names[i].split('.')[-1], []).append(i)
+        for indexes in places.values():
+            byRevision = [(revisionOf(names[i]), names[i]) for i in indexes]
+            byRevision.sort()
+            for i, (revision, name) in zip(indexes, byRevision):
+                names[i] = name
+
+        return names
+
+    def claim(self, name):
+        """Marks the job C{name} as being processed"""
+        os.rename(os.path.join(self.path, 'new', name), os.path.join(self.path, 'cur', name))
+
+    def load(self, name):
+        """@return: the claimed job C{name}"""
+        f = open(os.path.join(self.path, 'cur', name), 'rb')
+        job = cPickle.load(f)
+        f.close()
+        return job
+
+    def finish(self, name):
+        """Removes the claimed job C{name} now that it has been processed"""
+        os.remove(os.path.join(self.path, 'cur', name))
+
+    def fail(self, name):
+        """Sets aside the claimed job C{name} as processing it failed"""
+        os.rename(os.path.join(self.path, 'cur', name), os.path.join(self.path, 'failed', name))
+
+    def isClaimed(self, name):
+        """@return: whether the job C{name} is claimed, and has been neither finished nor set aside"""
+        return os.path.exists(os.path.join(self.path, 'cur', name))
+
+    def release(self, name):
+        """Puts back the claimed job C{name} to be processed again"""
+        os.rename(os.path.join(self.path, 'cur', name), os.path.join(self.path, 'new', name))
+
+    def recover(self):
+        """Puts back the jobs that were claimed by workers that have since died"""
+        for name in os.listdir(os.path.join(self.path, 'cur')):
+            self.release(name)
+
+    def lock(self):
+        """Makes sure only one pool of workers uses the spool
+
+        @return: the locked file, which must be kept open
+        """
+        f = open(os.path.join(self.path, 'lock'), 'w')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            f.close()
+            raise IOError('Another pool of workers is already using %s' % self.path)
+        return f
+
+def revisionOf(name):
+    """@return: the revision of the commit spooled as the job C{name}, C{None} if it was not known"""
+    parts = name.split('.')
+    # Jobs spooled before revisions were added to the names have one part less
+    if len(parts) < 6 or parts[-2] == '-':
+        return None
+    return int(parts[-2])
+
+def keyOf(repository):
+    """@return: a short file-name-safe key for C{repository}"""
+    return md5(str(repository)).hexdigest()[:12]
+
+def spoolCommit(spool, controllerName, controller):
+    """Adds the commit being handled by C{controller} to C{spool} as early as the controller allows
+
+    A C{detachable} controller is spooled straight away. Otherwise, the model is
+    built within the hook and a frozen snapshot of it is spooled with the job,
+    so only the views are executed by the workers.
+    """
+    if controller.detachable:
+        stdin, model = '', None
+        if controller.stdin is not None and not controller.stdin.isatty():
+            stdin = controller.stdin.read()
+    else:
+        if not controller.buildModel():
+            return
+        stdin, model = '', controller.model.freeze()
+
+    spool.add({
+        'controller': controllerName,
+        'argv': controller.argv,
+        'stdin': stdin,
+        'model': model,
+        'repository': controller.repository(),
+        'revision': controller.revision()})
+
+# How many times a job is tried by workers that die before finishing it
+# (e.g. are killed, or crash) before the job is set aside
+MAX_ATTEMPTS = 3
+
+def runWorkers(spool, configFile, poll=1.0):
+    """Processes the spooled commits in forked worker processes, forever
+
+    The C{[scm]} section's C{spoolWorkers} sets how many commits are processed
+    at once (defaulting to the number of CPUs), and C{spoolOrdering = repo}
+    makes commits to the same repository get processed one at a time, in the
+    order they were made.
+    """
+    # Held open for as long as the workers run
+    lock = spool.lock()
+    spool.recover()
+
+    config, mtime = None, None
+    running = {}
+    attempts = {}
+    while 1:
+        # Re-read the config whenever it changes
+        if os.stat(configFile).st_mtime != mtime:
+            mtime = os.stat(configFile).st_mtime
+            config = CmConfigParser(configFile)
+            workers = _getWorkers(config)
+            ordered = config.has_option('scm', 'spoolOrdering') and config.get('scm', 'spoolOrdering') == 'repo'
+
+        # Reap the finished workers
+        while running:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            name, key = running.pop(pid)
+            _reap(spool, name, status, attempts)
+
+        busy = {}
+        for name, key in running.values():
+            busy[key] = True
+
+        for name in spool.pending():
+            if len(running) >= workers:
+                break
+
+            key = name.split('.')[-1]
+            if ordered and busy.has_key(key):
+                continue
+            busy[key] = True
+
+            spool.claim(name)
+            pid = os.fork()
+            if pid == 0:
+                os._exit(_work(spool, name, config))
+            running[pid] = (name, key)
+
+        time.sleep(poll)
+
+def _reap(spool, name, status, attempts):
+    """Puts back the job C{name} if its worker exited with C{status} without
+    finishing it or setting it aside, or sets it aside once it has been tried
+    L{MAX_ATTEMPTS} times
+
+    @param attempts: a dict of the name of each job to how many of its workers have died, which is kept up to date
+    """
+    if not spool.isClaimed(name):
+        # The worker finished the job, or set it aside and said why
+        if attempts.has_key(name):
+            del attempts[name]
+        return
+
+    if os.WIFSIGNALED(status):
+        how = 'was killed by signal %d' % os.WTERMSIG(status)
+    else:
+        how = 'exited with %d' % os.WEXITSTATUS(status)
+    attempts[name] = attempts.get(name, 0) + 1
+    if attempts[name] >= MAX_ATTEMPTS:
+        sys.stderr.write('The worker for spooled commit %s %s, setting it aside after %d attempts\n' % (name, how, attempts[name]))
+        del attempts[name]
+        spool.fail(name)
+    else:
+        sys.stderr.write('The worker for spooled commit %s %s, trying it again\n' % (name, how))
+        spool.release(name)
+
+def _getWorkers(config):
+    """@return: the configured number of worker processes"""
+    if config.has_option('scm', 'spoolWorkers'):
+        return config.getint('scm', 'spoolWorkers')
+    try:
+        return max(1, os.sysconf('SC_NPROCESSORS_ONLN'))
+    except (AttributeError, ValueError, OSError):
+        return 1
+
+def _work(spool, name, config):
+    """Processes the claimed job C{name} in a worker process
+
+    @return: the worker's exit status
+    """
+    try:
+        job = spool.load(name)
+        controller = getNewInstance(job['controller'])
+        controller.__init__(config, job['argv'], StringIO(job['stdin']))
+        if job['model'] is None:
+            controller.process()
+        else:
+            controller.model = job['model']
+            controller._executeViews()
+    except Exception:
+        sys.stderr.write('Error processing spooled commit %s:\n' % name)
+        traceback.print_exc()
+        spool.fail(name)
+        status = 1
+    else:
+        spool.finish(name)
+        status = 0
+
+    # os._exit will not flush what the views printed
+    sys.stdout.flush()
+    return status
+
+def _fsyncDirectory(path):
+    """Makes sure a rename into the directory at C{path} survives a crash"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -4,17 +4,34 @@
 # Copyright 2002-2004 Stephen Haberman
 #
 
-"""Basic utility functions and classes (L{CmConfigParser}, L{getNewInstance}, and L{execute})"""
+"""Basic utility functions and classes (L{CmConfigParser}, L{loadConfig}, L{getNewInstance}, L{Process}, L{execute}, and L{parallelMap})"""
 
 from ConfigParser import ConfigParser
 from types import ModuleType
+import marshal
 import new
 import os
 import re
+import signal
+import subprocess
 import sys
+import threading
+import time
 
 from commitmessage.Itpl import Itpl
 from commitmessage.exceptions import CmException
+from commitmessage.model import View
+from commitmessage.router import ModuleRouter, compileExcludes
+
+try:
+    from hashlib import md5
+except ImportError:
+    # Python 2.4
+    from md5 import new as md5
+
+# Bumped whenever what CmConfigParser.__getstate__ returns changes, so older
+# config caches are made afresh
+CONFIG_CACHE_VERSION = 2
 
 class CmConfigParser(ConfigParser):
     """Provides config-centric logic for views and modules that would be confused elsewhere"""
@@ -29,6 +46,57 @@ class CmConfigParser(ConfigParser):
             for name in self.options('userMap'):
                 self.userMap[name] = self.get('userMap', name)
 
+        # The router for the [modules] patterns, built on first use
+        self._router = None
+
+        # The facets of the model required by the views, worked out on first use
+        self._requiredFacets = None
+
+        # The compiled exclude option of each section, by section
+        self._excludes = {}
+
+        # The class name and parsed option templates (see _getViewOptions) of
+        # each view, by (module, view name), worked out on first use
+        self._viewOptions = {}
+
+    def __getstate__(self):
+        """@return: the config and what has been worked out from it, as
+        plain data that marshal can store too"""
+        state = self.__dict__.copy()
+        # ConfigParser's own regexes and dict class are set up by __setstate__
+        for name in ['_dict', '_optcre']:
+            if state.has_key(name):
+                del state[name]
+        # Kept as lists of pairs, as marshal would lose the order of the
+        # sections and options
+        state['_defaults'] = self._defaults.items()
+        state['_sections'] = [(name, options.items()) for name, options in self._sections.items()]
+        if self._router is not None:
+            state['_router'] = self._router.__getstate__()
+        state['_excludes'] = dict([(section, regex and regex.pattern) for section, regex in self._excludes.items()])
+        state['_viewOptions'] = self._viewOptions.items()
+        # The facets come from the view classes rather than the config file,
+        # so they are worked out afresh in case the views have changed since
+        state['_requiredFacets'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restores a config from its L{__getstate__}"""
+        ConfigParser.__init__(self)
+        # Python 2.4's ConfigParser has no dict class of its own
+        makeDict = getattr(self, '_dict', dict)
+        self.__dict__.update(state)
+        self._defaults = makeDict(self._defaults)
+        self._sections = makeDict([(name, makeDict(options)) for name, options in self._sections])
+        if self._router is not None:
+            router = new.instance(ModuleRouter)
+            router.__setstate__(self._router)
+            self._router = router
+        for section, pattern in self._excludes.items():
+            if pattern is not None:
+                self._excludes[section] = re.compile(pattern)
+        self._viewOptions = dict(self._viewOptions)
+
     def getSummaryThreshold(self):
         """@return: the summary breakout threshold in KB. If the diffs exceed this size, the controller should null the individual file diffs"""
         threshold = -1
@@ -41,13 +109,7 @@ class CmConfigParser(ConfigParser):
 
     def getModulesForPath(self, commitPath):
         """@return: the modules that match the given path (and should hence have their views executed)"""
-        modules = []
-
-        # Load the user-defined modules
-        for module in ConfigParser.options(self, 'modules'):
-            p = re.compile(ConfigParser.get(self, 'modules', module))
-            if p.match(commitPath):
-                modules.append(module)
+        modules = self._getRouter().route(commitPath)
 
         # Add default if necessary
         if len(modules) == 0:
@@ -69,23 +131,40 @@ class CmConfigParser(ConfigParser):
         @param model: the L{commitmessage.model.Model} to initialize views with
         @return: the configured views for a module
         """
-        viewLine = ConfigParser.get(self, module, 'views')
-        p = re.compile(',\s?')
-        viewNames = [name.strip() for name in p.split(viewLine) if len(name.strip()) > 0]
+        viewNames = self._getViewNames(module)
 
+        # The templates are evaluated here, so they can use model, userMap, etc.
         userMap = self.userMap
 
         views = []
         for viewName in viewNames:
-            fullClassName = ConfigParser.get(self, 'views', viewName)
+            fullClassName, templates = self._getViewOptions(module, viewName)
             view = getNewInstance(fullClassName)
             view.__init__(viewName, model)
 
+            for name, format, chunks in templates:
+                # Skip parsing the template again
+                template = new.instance(Itpl, {'format': format, 'chunks': chunks})
+                view.__dict__[name] = str(template)
+
+            views.append(view)
+        return views
+
+    def _getViewOptions(self, module, viewName):
+        """@return: the class name of the view C{viewName} and its C{(name,
+        format, chunks)} options for C{module}, the defaults from the view's
+        section and then the module-specific values, with the C{chunks} of
+        the L{Itpl} each C{format} parses into"""
+        key = (module, viewName)
+        if not self._viewOptions.has_key(key):
+            fullClassName = ConfigParser.get(self, 'views', viewName)
+            templates = []
+
             # Setup default values
             if ConfigParser.has_section(self, viewName):
                 for name in ConfigParser.options(self, viewName):
                     value = ConfigParser.get(self, viewName, name, 1)
-                    view.__dict__[name] = str(Itpl(value))
+                    templates.append((name, value, Itpl(value).chunks))
 
             # Setup module-specific values
             forViewPrefix = re.compile('^%s.' % viewName)
@@ -94,10 +173,99 @@ class CmConfigParser(ConfigParser):
                     # Take off the 'viewName.'
                     name = option[len(viewName)+1:]
                     value = ConfigParser.get(self, module, option, 1)
-                    view.__dict__[name] = str(Itpl(value))
+                    templates.append((name, value, Itpl(value).chunks))
 
-            views.append(view)
-        return views
+            self._viewOptions[key] = (fullClassName, templates)
+        return self._viewOptions[key]
+
+    def _getRouter(self):
+        """@return: the L{ModuleRouter} for the user-defined modules, built once per config"""
+        if self._router is None:
+            self._router = ModuleRouter([
+                (module, ConfigParser.get(self, 'modules', module))
+                for module in ConfigParser.options(self, 'modules')])
+        return self._router
+
+    def compile(self):
+        """Works out what is otherwise worked out from the config file on
+        first use, so the compiled copy of it (see L{loadConfig}) has it ready
+
+        Anything that fails is left to be worked out, and to fail, on first
+        use as before.
+        """
+        try:
+            self._getRouter()
+        except Exception:
+            pass
+
+        modules = ['DEFAULT_MODULE', 'UNIVERSAL_MODULE']
+        if ConfigParser.has_section(self, 'modules'):
+            modules.extend(ConfigParser.options(self, 'modules'))
+        self.getExcludes('scm')
+        for module in modules:
+            if not ConfigParser.has_section(self, module):
+                continue
+            self.getExcludes(module)
+            if not ConfigParser.has_option(self, module, 'views'):
+                continue
+            for viewName in self._getViewNames(module):
+                try:
+                    self._getViewOptions(module, viewName)
+                except Exception:
+                    pass
+
+    def getRequiredFacets(self, modules=None):
+        """@return: a dict of the facets of the model (see
+        L{commitmessage.model.View.requires}) that the views of C{modules}
+        require, by default of any of the modules, for before which modules a
+        commit goes to is known"""
+        if modules is not None:
+            return self._getFacets(modules)
+
+        if self._requiredFacets is None:
+            modules = ['DEFAULT_MODULE', 'UNIVERSAL_MODULE']
+            if ConfigParser.has_section(self, 'modules'):
+                modules.extend(ConfigParser.options(self, 'modules'))
+            self._requiredFacets = self._getFacets(modules)
+        return self._requiredFacets
+
+    def _getFacets(self, modules):
+        """@return: a dict of the facets that the views of C{modules} require"""
+        facets = {}
+        # The same views come up in module after module
+        requiresByView = {}
+        for module in modules:
+            if not ConfigParser.has_option(self, module, 'views'):
+                continue
+            for viewName in self._getViewNames(module):
+                if requiresByView.has_key(viewName):
+                    continue
+                try:
+                    requires = getNewInstance(ConfigParser.get(self, 'views', viewName)).requires
+                except Exception:
+                    # Leave the error to when the view is executed, and
+                    # fetch everything in case it does work by then
+                    requires = View.requires
+                requiresByView[viewName] = requires
+                for facet in requires:
+                    facets[facet] = True
+        return facets
+
+    def getExcludes(self, section):
+        """@return: a regex of the paths that the C{exclude} patterns of
+        C{section} (C{scm} or a module) leave the diffs of out, or C{None}"""
+        if not self._excludes.has_key(section):
+            patterns = []
+            if ConfigParser.has_option(self, section, 'exclude'):
+                patterns = [p for p in re.split('[,\s]+', ConfigParser.get(self, section, 'exclude')) if p != '']
+            self._excludes[section] = compileExcludes(patterns)
+        return self._excludes[section]
+
+    def _getViewNames(self, module):
+        """@return: the names of the views configured for C{module}"""
+        viewLine = ConfigParser.get(self, module, 'views')
+        p = re.compile(',\s?')
+        return [name.strip() for name in p.split(viewLine) if len(name.strip()) > 0]
 
     """Patch by Juan F. Codagnone <juam@users.sourceforge.net> for Python 2.2.1 support."""
     if sys.hexversion < 0x2030000:
@@ -110,6 +278,57 @@ class CmConfigParser(ConfigParser):
 
             return ret
 
+def loadConfig(filePath):
+    """Loads the config file at C{filePath} in one read of a compiled copy
+    of it, C{filePath}.cache, which is made afresh (if the directory is
+    writable) whenever the file's mtime, size, or contents change
+
+    @return: the compiled L{CmConfigParser}
+    """
+    info = os.stat(filePath)
+    f = open(filePath, 'rb')
+    try:
+        key = (CONFIG_CACHE_VERSION, info.st_mtime, info.st_size, md5(f.read()).hexdigest())
+    finally:
+        f.close()
+
+    cachePath = filePath + '.cache'
+    try:
+        f = open(cachePath, 'rb')
+        try:
+            cachedKey, state = marshal.loads(f.read())
+        finally:
+            f.close()
+        if cachedKey == key:
+            config = new.instance(CmConfigParser)
+            config.__setstate__(state)
+            return config
+    except Exception:
+        # Missing, unreadable, or written by another version of Python
+        pass
+
+    config = CmConfigParser(filePath)
+    config.compile()
+
+    # Write the cache under another name first, so concurrent hooks never
+    # read half of it
+    tempPath = '%s.%s' % (cachePath, os.getpid())
+    try:
+        f = open(tempPath, 'wb')
+        try:
+            f.write(marshal.dumps((key, config.__getstate__())))
+        finally:
+            f.close()
+        os.rename(tempPath, cachePath)
+    except (IOError, OSError, ValueError):
+        # The config still works without the cache
+        try:
+            os.remove(tempPath)
+        except OSError:
+            pass
+
+    return config
+
 def getNewInstance(fullClassName, searchPath=['./']):
     """@return: an instance of the fullClassName class WITHOUT the C{__init__} method having been called"""
 
@@ -136,32 +355,200 @@ def getNewInstance(fullClassName, searchPath=['./']):
 
     return new.instance(function)
 
-def execute(command):
-    """@return: the contents of C{stdout} as a list of lines after executing C{command}"""
-    pipeIn, pipeOut, pipeErr = os.popen3(command)
-    lines = pipeOut.readlines()
-    err = '\n'.join(pipeErr.readlines())
-    pipeIn.close(), pipeOut.close(), pipeErr.close()
+# Every L{Process} that has finished since the last L{reportProcesses} or
+# L{forgetProcesses}, in the order they finished
+processes = []
 
-    # If no lines are there, an error might have occurred
-    if len(lines) == 0:
+class Process:
+    """Runs a command in the background, streaming its C{stdout} lines
 
-        # See if it is permission related (e.g. creating .svnlook)
-        if err.find('Permission denied') != -1:
-            os.chdir('/tmp')
+    The command's C{stderr} is drained on its own thread so that a chatty
+    command can never fill that pipe and block, and the command is killed if
+    it runs for longer than its C{timeout}. Once the command is done,
+    C{returncode}, C{err}, C{elapsed}, and C{timedOut} describe how it went.
+    """
 
-            # Retry
-            pipeIn, pipeOut, pipeErr = os.popen3(command)
-            lines = pipeOut.readlines()
-            err = '\n'.join(pipeErr.readlines())
-            pipeIn.close(), pipeOut.close(), pipeErr.close()
+    def __init__(self, command, timeout=None, cwd=None, stdout=subprocess.PIPE):
+        """Starts the command running
 
-        # If there is still an error, print it
-        if len(err) > 0:
-            print err
+        @param command: a shell command string or a list of arguments
+        @param timeout: the number of seconds to let the command run before killing it, or C{None} for no limit
+        @param cwd: the directory to run the command in, defaults to the current directory
+        @param stdout: where to send C{stdout}, defaults to a pipe that is read by iterating over this object
+        """
+        self.command = command
+        self.returncode = None
+        self.err = ''
+        self.elapsed = None
+        self.timedOut = False
+
+        # On Unix, run the command in its own process group so that killing it
+        # also kills anything it started (e.g. the commands in a shell pipeline)
+        preexec = None
+        if hasattr(os, 'setpgrp'):
+            preexec = os.setpgrp
+
+        self._start = time.time()
+        self._popen = subprocess.Popen(
+            command,
+            shell=isinstance(command, basestring),
+            cwd=cwd,
+            stdout=stdout,
+            stderr=subprocess.PIPE,
+            preexec_fn=preexec)
+        self.stdout = self._popen.stdout
+
+        self._errLines = []
+        self._errThread = threading.Thread(target=self._drainStderr)
+        self._errThread.setDaemon(True)
+        self._errThread.start()
+
+        self._timer = None
+        if timeout:
+            self._timer = threading.Timer(timeout, self._timeOut)
+            self._timer.setDaemon(True)
+            self._timer.start()
+
+    def __iter__(self):
+        """@return: a generator of the lines output on C{stdout}, waiting for the command once they have all been read"""
+        for line in self.stdout:
+            yield line
+        self.wait()
+
+    def __str__(self):
+        """@return: the command, its exit status, and how long it took"""
+        command = self.command
+        if not isinstance(command, basestring):
+            command = ' '.join(command)
+
+        if self.returncode is None:
+            status = 'is still running'
+        elif self.timedOut:
+            status = 'timed out'
+        else:
+            status = 'exited with %s' % self.returncode
+
+        return '%s %s after %.2fs' % (command, status, (self.elapsed or time.time() - self._start))
+
+    def readlines(self):
+        """@return: all of the lines output on C{stdout}, after waiting for the command to finish"""
+        lines = self.stdout.readlines()
+        self.wait()
+        return lines
+
+    def kill(self):
+        """Kills the command if it is still running"""
+        if self._popen.poll() is None:
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(self._popen.pid, signal.SIGKILL)
+                else:
+                    self._popen.kill()
+            except OSError:
+                # It finished on its own in the meantime
+                pass
+
+    def wait(self):
+        """Waits for the command to finish and records how it went
+
+        @return: the exit status of the command
+        """
+        if self.returncode is not None:
+            return self.returncode
+
+        if self.stdout is not None:
+            self.stdout.close()
+        returncode = self._popen.wait()
+        self._errThread.join()
+        if self._timer is not None:
+            self._timer.cancel()
+
+        self.elapsed = time.time() - self._start
+        self.err = ''.join(self._errLines)
+        self.returncode = returncode
+        processes.append(self)
+
+        return self.returncode
+
+    def _drainStderr(self):
+        """Reads C{stderr} until the command closes it"""
+        for line in self._popen.stderr:
+            self._errLines.append(line)
+        self._popen.stderr.close()
+
+    def _timeOut(self):
+        """Called by the timer when the command has run for too long"""
+        self.timedOut = True
+        self.kill()
+
+def execute(command, timeout=None, cwd=None):
+    """@return: the contents of C{stdout} as a list of lines after executing C{command}"""
+    process = Process(command, timeout, cwd)
+    lines = process.readlines()
+
+    # If no lines are there, an error might have occurred
+    if process.timedOut or (len(lines) == 0 and len(process.err) > 0):
+        print process
+        print process.err
 
     return lines
 
+def parallelMap(function, items, concurrency):
+    """Calls C{function} on each of C{items} with up to C{concurrency} threads at once
+
+    Any exception raised by C{function} is re-raised once all of the threads
+    have finished, so a failure is reported as if the calls were sequential.
+
+    @return: the results, in the same order as C{items}
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if concurrency <= 1 or len(items) <= 1:
+        for i in range(len(items)):
+            results[i] = function(items[i])
+        return results
+
+    errors = []
+    remaining = range(len(items))
+    lock = threading.Lock()
+
+    def work():
+        while 1:
+            lock.acquire()
+            try:
+                if not remaining or errors:
+                    return
+                i = remaining.pop(0)
+            finally:
+                lock.release()
+            try:
+                results[i] = function(items[i])
+            except Exception:
+                errors.append(sys.exc_info())
+
+    threads = []
+    for n in range(min(concurrency, len(items))):
+        thread = threading.Thread(target=work)
+        thread.setDaemon(True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return results
+
+def reportProcesses(stream):
+    """Writes the exit status and timing of every finished L{Process} to C{stream}, then forgets them"""
+    for process in processes:
+        stream.write('%s\n' % process)
+    forgetProcesses()
+
+def forgetProcesses():
+    """Forgets the finished L{Process}es, so a long-running process does not keep every one it ran"""
+    del processes[:]
+
 def _doctest():
     import doctest, util
     return doctest.testmod(util)
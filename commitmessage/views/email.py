@@ -7,14 +7,36 @@
 """Provides an email L{commitmessage.model.View}s"""
 
 import os
+import socket
 import sys
 import time
 import rfc822
 
 from StringIO import StringIO
-from smtplib import SMTP
+from smtplib import SMTP, SMTPException
 from commitmessage.model import View
 
+# The SMTP connections kept open between emails, keyed on (server, username),
+# or None to open a new connection for each email
+_connections = None
+
+def keepConnectionsOpen():
+    """Keeps SMTP connections open between emails (e.g. for L{commitmessage.daemon})"""
+    global _connections
+    if _connections is None:
+        _connections = {}
+
+def closeConnections():
+    """Closes any SMTP connections being kept open"""
+    global _connections
+    if _connections is not None:
+        for smtp in _connections.values():
+            try:
+                smtp.quit()
+            except (SMTPException, socket.error):
+                pass
+        _connections = None
+
 class BaseEmailView(View):
     """A basic email implementation for other style-specific email views to extend
 
@@ -88,17 +110,36 @@ class BaseEmailView(View):
         if self.isTesting():
             self.dumpToTestFile(body)
         elif len(self.server) > 0:
-            smtp = SMTP(self.server)
-            if self.username is not None:
-                smtp.login(self.username, self.password)
+            smtp = self._connect()
             smtp.sendmail(
                 self['from'],
                 filter(lambda x: x != '', [addr.strip() for addr in self.to.split(',')] + [addr.strip() for addr in self.cc.split(',')]),
                 body)
-            smtp.quit()
+            if _connections is None:
+                smtp.quit()
         else:
             print 'No server provided, not sending an email.'
 
+    def _connect(self):
+        """@return: an SMTP connection to the server, reusing one being kept open if it is still alive"""
+        if _connections is not None:
+            key = (self.server, self.username)
+            smtp = _connections.get(key)
+            if smtp is not None:
+                try:
+                    smtp.noop()
+                    return smtp
+                except (SMTPException, socket.error):
+                    del _connections[key]
+
+        smtp = SMTP(self.server)
+        if self.username is not None:
+            smtp.login(self.username, self.password)
+
+        if _connections is not None:
+            _connections[(self.server, self.username)] = smtp
+        return smtp
+
 class ApacheStyleEmailView(BaseEmailView):
     """Sends out an email in a style mimicking the U{Apache<http://www.apache.org>} commit email format (not implemented)"""
     pass
@@ -193,6 +234,8 @@ class InlineAttachmentEmailView(BaseEmailView):
     Contributed by Juan F. Codagnone <juam@users.sourceforge.net>
     """
 
+    requires = ['files', 'log', 'deltas', 'diffs']
+
     def __init__(self, name, model):
         """Initializes the the username to None, header, footer, and rfc_header
 
@@ -271,6 +314,9 @@ class EtherealStyleEmailView(BaseEmailView):
     Contributed by Gerald Combs <gerald [AT] ethereal.com>
     """
 
+    # Only the deltas, not the diffs themselves
+    requires = ['files', 'log', 'deltas']
+
     def __init__(self, name, model):
         """Initializes the the username to None, header, footer, and rfc_header
 
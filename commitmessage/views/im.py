@@ -17,6 +17,8 @@ from commitmessage.model import View
 class IMView(View):
     """An abstract class to hold the message-generation logic for IM clients"""
 
+    requires = ['files', 'log']
+
     # Borrowed from email.py
     def _printFiles(self, text, action):
         directories = self.model.directoriesWithFiles(action)
@@ -9,6 +9,14 @@
 It does so by setting up the C{sys.path} (it assumes this file, C{main.py}, is
 in the C{commitmessage} package), reading in the configuration file, and
 initializing the controller.
+
+With C{-d socketPath}, it instead runs a L{commitmessage.daemon.Daemon} that
+listens on C{socketPath}. With C{-s socketPath}, it hands the commit off to
+that daemon and exits, only processing the commit itself if the daemon is not
+running or will not take it.
+
+With C{-q spoolPath}, it adds the commit to a L{commitmessage.spool.Spool} and
+exits, and with C{-w spoolPath} it runs the workers that process the spool.
 """
 
 import getopt
@@ -24,18 +32,50 @@ rootCmPath = os.path.realpath(currentDir)
 if __name__ == '__main__':
     sys.path.append(rootCmPath)
 
-from commitmessage.exceptions import CmException
-from commitmessage.util import CmConfigParser, getNewInstance
-
 def main():
-    profiling, configFile = 0, 'commitmessage.conf'
+    profiling, verbose, configFile = 0, 0, 'commitmessage.conf'
+    daemonSocket, clientSocket, spoolPath, workerSpoolPath = None, None, None, None
 
-    options, args = getopt.getopt(sys.argv[1:], "c:p")
+    options, args = getopt.getopt(sys.argv[1:], "c:pvd:s:q:w:")
     for option, value in options:
         if option == '-c':
             configFile = value
         if option == '-p':
             profiling = 1
+        if option == '-v':
+            verbose = 1
+        if option == '-d':
+            daemonSocket = value
+        if option == '-s':
+            clientSocket = value
+        if option == '-q':
+            spoolPath = value
+        if option == '-w':
+            workerSpoolPath = value
+
+    # Remove the -c configFile argument that getopt looks for above and pass on
+    # the rest of the arguments getopt did not grok to the controller
+    cleanArgs = [sys.argv[0]]
+    cleanArgs.extend(args)
+
+    stdin = sys.stdin
+    if clientSocket:
+        # Only the client module is imported so that the hook returns quickly
+        from commitmessage.client import submit
+
+        text = ''
+        if not sys.stdin.isatty():
+            text = sys.stdin.read()
+
+        reason = submit(clientSocket, '', cleanArgs, text)
+        if reason is None:
+            return
+        sys.stderr.write('The commitmessage daemon did not take the commit (%s), processing it here.\n' % reason)
+
+        from StringIO import StringIO
+        stdin = StringIO(text)
+
+    from commitmessage.util import getNewInstance, loadConfig, reportProcesses
 
     if profiling:
         import hotshot
@@ -51,19 +91,39 @@ def main():
     if configFile[0] != '/' and configFile[0] != '.' and configFile[1] != ':':
        configFile = rootCmPath + os.sep + configFile
 
-    config = CmConfigParser(configFile)
+    if daemonSocket:
+        from commitmessage.daemon import Daemon
 
-    controller = getNewInstance(config.get('scm', 'controller'))
+        # Exit cleanly on kill so the daemon removes its socket
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-    # Remove the -c configFile argument that getopt looks for above and pass on
-    # the rest of the arguments getopt did not grok to the controller
-    cleanArgs = [sys.argv[0]]
-    cleanArgs.extend(args)
+        Daemon(configFile, daemonSocket).run()
+        return
+
+    if workerSpoolPath:
+        from commitmessage.spool import Spool, runWorkers
+        runWorkers(Spool(workerSpoolPath), configFile)
+        return
+
+    # Load the compiled copy of the config, rather than parsing it every commit
+    config = loadConfig(configFile)
+
+    controllerName = config.get('scm', 'controller')
+    controller = getNewInstance(controllerName)
 
     # getNewInstance does not call the __init__ constructor, so we do
-    controller.__init__(config, cleanArgs, sys.stdin)
+    controller.__init__(config, cleanArgs, stdin)
+
+    if spoolPath:
+        from commitmessage.spool import Spool, spoolCommit
+        spoolCommit(Spool(spoolPath), controllerName, controller)
+    else:
+        controller.process()
 
-    controller.process()
+    # Report the exit status and timing of each svnlook/cvs command
+    if verbose:
+        reportProcesses(sys.stderr)
 
     if profiling:
         profile.stop()
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests loading the config through its compiled copy with L{loadConfig}."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.model import Model
+from commitmessage.util import loadConfig
+
+CONFIG = '''[scm]
+controller = commitmessage.controllers.svn.SvnController
+exclude = *.lock
+
+[modules]
+trunk = ^/project/trunk
+c = ^/project/.*\\.c$
+
+[views]
+tigris = commitmessage.views.email.TigrisStyleEmailView
+
+[tigris]
+subject = commit $model.rev
+
+[trunk]
+views = tigris
+tigris.to = %s@example.com
+
+[c]
+views = tigris
+'''
+
+class TestLoadConfig(unittest.TestCase):
+    """Tests that the compiled copy is used until the config file changes."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'commitmessage.conf')
+        self.write('trunk')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, to):
+        f = open(self.path, 'w')
+        f.write(CONFIG % to)
+        f.close()
+
+    def assertConfig(self, config, to):
+        self.assertEquals(['c', 'trunk'], config.getModulesForPath('/project/trunk/a.c'))
+        self.failUnless(config.getExcludes('scm').match('/project/trunk/Cargo.lock'))
+        model = Model()
+        model.rev = '12'
+        view = config.getViewsForModule('trunk', model)[0]
+        self.assertEquals('commit 12', view.subject)
+        self.assertEquals('%s@example.com' % to, view.to)
+
+    def testCompiledCopy(self):
+        self.assertConfig(loadConfig(self.path), 'trunk')
+        self.failUnless(os.path.exists(self.path + '.cache'))
+        config = loadConfig(self.path)
+        # Nothing is parsed or compiled until it is used
+        self.assertEquals({}, config._router._compiled)
+        # The facets depend on the view classes, which the key does not cover
+        self.assertEquals(None, config._requiredFacets)
+        self.assertConfig(config, 'trunk')
+
+    def testKeepsTheOrder(self):
+        parsed = loadConfig(self.path)
+        cached = loadConfig(self.path)
+        self.assertEquals(parsed.sections(), cached.sections())
+        for section in parsed.sections():
+            self.assertEquals(parsed.options(section), cached.options(section))
+        self.assertEquals(['scm', 'modules', 'views', 'tigris', 'trunk', 'c'], cached.sections())
+        self.assertEquals(['controller', 'exclude'], cached.options('scm'))
+
+    def testChanged(self):
+        loadConfig(self.path)
+        self.write('changed')
+        self.assertConfig(loadConfig(self.path), 'changed')
+
+    def testChangedWithinTheSameMtime(self):
+        loadConfig(self.path)
+        info = os.stat(self.path)
+        self.write('trunK')
+        os.utime(self.path, (info.st_atime, info.st_mtime))
+        self.assertConfig(loadConfig(self.path), 'trunK')
+
+    def testBrokenCache(self):
+        f = open(self.path + '.cache', 'w')
+        f.write('not a cache')
+        f.close()
+        self.assertConfig(loadConfig(self.path), 'trunk')
+        self.assertConfig(loadConfig(self.path), 'trunk')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests handing the directories of a CVS commit to the L{commitmessage.coordinator} (Unix only)."""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+from StringIO import StringIO
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.controllers import cvs
+from commitmessage.controllers.cvs import CvsController
+from commitmessage.exceptions import CmException
+from commitmessage.coordinator import Coordinator, send
+from commitmessage.model import Controller, Directory, File
+from commitmessage.util import CmConfigParser
+
+CONFIG = '[scm]\ncontroller = commitmessage.controllers.cvs.CvsController\ncoordinate = yes\n'
+
+LOGINFO = '''Update of /cvsroot/module/%s
+In directory server:/tmp/cvs-serv1
+
+Modified Files:
+\t%s
+Log Message:
+Changed things
+'''
+
+RCS = '''head\t1.2;
+access;
+symbols;
+locks; strict;
+comment\t@# @;
+
+
+1.2
+date\t2005.01.02.12.00.00;\tauthor stephen;\tstate Exp;
+branches;
+next\t1.1;
+
+1.1
+date\t2005.01.01.12.00.00;\tauthor stephen;\tstate Exp;
+branches;
+next\t;
+
+
+desc
+@@
+
+
+1.2
+log
+@Changed b
+@
+text
+@a
+B
+c
+@
+
+
+1.1
+log
+@Initial revision
+@
+text
+@d2 1
+a2 1
+b
+@
+'''
+
+class RecordingCvsController(CvsController):
+    """Records the directories it fills in and the model it executes the views for."""
+
+    def _fillInValues(self, directory, revisions, rcsDirectory, lazy=False):
+        self.filled.append(directory.path)
+        for file in directory.files:
+            file.diff = 'diff of %s' % file.name
+
+    def _executeViews(self):
+        self.executed.append(self.model)
+
+class TestCoordinator(unittest.TestCase):
+    """Runs a L{Coordinator} on a thread and hands loginfo directories to it."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.oldTmpDir = Controller.TMPDIR
+        Controller.TMPDIR = self.dir
+        os.environ['CVSROOT'] = ':local:/cvsroot'
+        os.environ.setdefault('USER', 'stephen')
+
+        path = os.path.join(self.dir, 'commitmessage.conf')
+        f = open(path, 'w')
+        f.write(CONFIG)
+        f.close()
+        self.config = CmConfigParser(path)
+
+    def tearDown(self):
+        Controller.TMPDIR = self.oldTmpDir
+        cvs.send = send
+        shutil.rmtree(self.dir)
+
+    def refuse(self, path):
+        """Makes the coordinator seem to refuse the directory at C{path}"""
+        def refusingSend(socketPath, message):
+            if message['directory'].path == path:
+                return 'refused'
+            return send(socketPath, message)
+        cvs.send = refusingSend
+
+    def controller(self, argv, stdin=None):
+        controller = RecordingCvsController(self.config, ['main.py'] + argv, stdin)
+        controller.filled, controller.executed = [], []
+        return controller
+
+    def startCoordinator(self, controller):
+        """Starts the coordinator on a thread instead of in its own process"""
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(CvsController.COORDINATOR_SOCKET)
+        server.listen(16)
+        self.thread = threading.Thread(target=Coordinator(controller, CvsController.COORDINATOR_SOCKET).run, args=(server,))
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def testExecutesViewsOnceWithEveryDirectory(self):
+        first = self.controller(['/cvsroot/module/a', 'x.txt'])
+        self.startCoordinator(first)
+        first.buildModel()
+        self.controller(['/cvsroot/module/b', 'y.txt']).buildModel()
+
+        for name, file in [('a', 'x.txt'), ('b', 'y.txt')]:
+            controller = self.controller(['module/%s %s' % (name, file)], StringIO(LOGINFO % (name, file)))
+            self.assertEquals(False, controller.buildModel())
+            self.failUnless(controller.handedOff)
+            # Without the RCS files, the hook fills in its own directory
+            self.assertEquals(['/%s/' % name], controller.filled)
+        self.thread.join()
+
+        self.assertEquals(1, len(first.executed))
+        model = first.executed[0]
+        paths = [file.path for file in model.files()]
+        paths.sort()
+        self.assertEquals(['/a/x.txt', '/b/y.txt'], paths)
+        self.assertEquals('diff of x.txt', model.file('/a/x.txt').diff)
+        self.assertEquals('Changed things', model.log)
+        self.assertEquals('module', model.repo)
+        self.failIf(os.path.exists(CvsController.COORDINATOR_SOCKET))
+        self.failIf(os.path.exists(CvsController.JOURNAL_FILE))
+
+    def testFillsInWhatTheHooksLeftToIt(self):
+        controller = self.controller(['/cvsroot/module/a', 'x.txt'])
+        self.startCoordinator(controller)
+
+        directory = Directory('/a/')
+        File('x.txt', directory, 'modified')
+        self.assertEquals(None, send(CvsController.COORDINATOR_SOCKET, {
+            'directory': directory,
+            'revisions': {'x.txt': ('1.1', '1.2')},
+            'rcsDirectory': '/cvsroot/module/a',
+            'filled': False,
+            'last': True,
+            'repo': 'module',
+            'log': 'Changed x'}))
+        self.thread.join()
+
+        self.assertEquals(['/a/'], controller.filled)
+        self.assertEquals('diff of x.txt', controller.executed[0].file('/a/x.txt').diff)
+
+    def deltasOnlyController(self, rcsFiles):
+        """@return: a controller whose views only need deltas, in the middle of a loginfo for C{/a/x.txt}"""
+        rcsDirectory = os.path.join(self.dir, 'a')
+        os.mkdir(rcsDirectory)
+        for name in rcsFiles:
+            f = open(os.path.join(rcsDirectory, name), 'w')
+            f.write(RCS)
+            f.close()
+        controller = CvsController(self.config, ['main.py', 'module/a x.txt'], None)
+        controller.facets = {'files': True, 'deltas': True}
+        controller.currentDirectory = Directory('/a/')
+        File('x.txt', controller.currentDirectory, 'modified')
+        controller.revisions = {'x.txt': ('1.1', '1.2')}
+        controller.rcsDirectory = rcsDirectory
+        return controller
+
+    def testDeltasFromTheRcsFiles(self):
+        controller = self.deltasOnlyController(['x.txt,v'])
+        self.failUnless(controller._canBeFilledInByCoordinator())
+        controller._fillInValues(controller.currentDirectory, controller.revisions, controller.rcsDirectory)
+        file = controller.currentDirectory.files[0]
+        self.assertEquals(('1.2', '+1 -1'), (file.rev, file.delta))
+
+    def testFillsInDeltasItselfWithoutTheRcsFiles(self):
+        controller = self.deltasOnlyController([])
+        self.failIf(controller._canBeFilledInByCoordinator())
+
+    def testTakesTheDirectoriesItRefused(self):
+        first = self.controller(['/cvsroot/module/a', 'x.txt'])
+        self.startCoordinator(first)
+        first.buildModel()
+        self.controller(['/cvsroot/module/b', 'y.txt']).buildModel()
+
+        self.refuse('/a/')
+        controller = self.controller(['module/a x.txt'], StringIO(LOGINFO % ('a', 'x.txt')))
+        self.assertEquals(False, controller.buildModel())
+        self.failIf(controller.handedOff)
+        controller = self.controller(['module/b y.txt'], StringIO(LOGINFO % ('b', 'y.txt')))
+        self.assertEquals(False, controller.buildModel())
+        self.failUnless(controller.handedOff)
+        self.thread.join()
+
+        paths = [file.path for file in first.executed[0].files()]
+        paths.sort()
+        self.assertEquals(['/a/x.txt', '/b/y.txt'], paths)
+        self.failIf(os.path.exists(CvsController.JOURNAL_FILE))
+
+    def testRefusedAfterHandingOff(self):
+        first = self.controller(['/cvsroot/module/a', 'x.txt'])
+        self.startCoordinator(first)
+        first.buildModel()
+        self.controller(['/cvsroot/module/b', 'y.txt']).buildModel()
+
+        controller = self.controller(['module/a x.txt'], StringIO(LOGINFO % ('a', 'x.txt')))
+        self.assertEquals(False, controller.buildModel())
+        self.failUnless(controller.handedOff)
+
+        self.refuse('/b/')
+        oldDelay, CvsController.SEND_RETRY_DELAY = CvsController.SEND_RETRY_DELAY, 0
+        try:
+            controller = self.controller(['module/b y.txt'], StringIO(LOGINFO % ('b', 'y.txt')))
+            self.assertRaises(CmException, controller.buildModel)
+        finally:
+            CvsController.SEND_RETRY_DELAY = oldDelay
+        self.assertEquals([], first.executed)
+
+    def testWithoutCoordinator(self):
+        commitinfo = self.controller(['/cvsroot/module/a', 'x.txt'])
+        commitinfo.coordinate = 'no'
+        commitinfo.buildModel()
+
+        controller = self.controller(['module/a x.txt'], StringIO(LOGINFO % ('a', 'x.txt')))
+        self.assertEquals(True, controller.buildModel())
+        self.failIf(controller.handedOff)
+
+if __name__ == '__main__':
+    unittest.main()
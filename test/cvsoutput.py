@@ -0,0 +1,110 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests the parsing of C{cvs} output and loginfo arguments by the CVS controller's utility functions."""
+
+import sys
+import unittest
+
+class TestParseLoginfoFiles(unittest.TestCase):
+    """Tests L{parseLoginfoFiles} on the file arguments loginfo can pass."""
+
+    def testPlainNames(self):
+        self.assertEquals((['foo.txt', 'bar.txt'], {}), parseLoginfoFiles(['foo.txt', 'bar.txt']))
+
+    def testNewDirectory(self):
+        self.assertEquals((['-', 'New', 'directory'], {}), parseLoginfoFiles(['-', 'New', 'directory']))
+
+    def testCommaSeparatedRevisions(self):
+        names, revisions = parseLoginfoFiles(['foo.txt,1.2,1.3', 'a,b.txt,NONE,1.1', 'bar.txt,1.1.2.1,NONE'])
+        self.assertEquals(['foo.txt', 'a,b.txt', 'bar.txt'], names)
+        self.assertEquals({
+            'foo.txt': ('1.2', '1.3'),
+            'a,b.txt': ('NONE', '1.1'),
+            'bar.txt': ('1.1.2.1', 'NONE')}, revisions)
+
+    def testSeparateRevisions(self):
+        names, revisions = parseLoginfoFiles(['foo.txt', '1.2', '1.3', 'bar.txt', 'NONE', '1.1'])
+        self.assertEquals(['foo.txt', 'bar.txt'], names)
+        self.assertEquals({'foo.txt': ('1.2', '1.3'), 'bar.txt': ('NONE', '1.1')}, revisions)
+
+    def testNamesThatAreNotRevisions(self):
+        words = ['a.txt', 'b.txt', 'c.txt']
+        self.assertEquals((words, {}), parseLoginfoFiles(words))
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.controllers.cvs import parseLog, parseLoginfoFiles, parseStatus
+
+STATUS = [
+    '===================================================================\n',
+    'File: foo.txt            \tStatus: Up-to-date\n',
+    '\n',
+    '   Working revision:\t1.3\n',
+    '   Repository revision:\t1.3\t/cvsroot/module/foo.txt,v\n',
+    '   Sticky Tag:\t\t(none)\n',
+    '\n',
+    '===================================================================\n',
+    'File: no file bar.txt\t\tStatus: Up-to-date\n',
+    '\n',
+    '   Working revision:\tNo entry for bar.txt\n',
+    '   Repository revision:\t1.2\t/cvsroot/module/Attic/bar.txt,v\n',
+    '\n']
+
+LOG = [
+    '\n',
+    'RCS file: /cvsroot/module/foo.txt,v\n',
+    'Working file: foo.txt\n',
+    'head: 1.3\n',
+    'description:\n',
+    '----------------------------\n',
+    'revision 1.3\n',
+    'date: 2005/01/01 12:00:00;  author: stephen;  state: Exp;  lines: +2 -1\n',
+    'Changed foo\n',
+    'revision 1.2\n',
+    'date: 2005/01/01 12:00:00;  author: stephen;  state: Exp;  lines: +9 -9\n',
+    '----------------------------\n',
+    'revision 1.2\n',
+    'date: 2004/12/01 12:00:00;  author: stephen;  state: Exp;  lines: +5 -5\n',
+    'Older change\n',
+    '=============================================================================\n',
+    '\n',
+    'RCS file: /cvsroot/module/Attic/bar.txt,v\n',
+    'Working file: bar.txt\n',
+    'head: 1.2\n',
+    'description:\n',
+    '----------------------------\n',
+    'revision 1.2\n',
+    'date: 2005/01/01 12:00:00;  author: stephen;  state: dead;  lines: +0 -0\n',
+    'Removed bar\n',
+    '=============================================================================\n']
+
+class TestParseStatus(unittest.TestCase):
+    """Tests L{parseStatus} on the output of C{cvs status} for several files."""
+
+    def testRevs(self):
+        self.assertEquals({'foo.txt': '1.3', 'bar.txt': '1.2'}, parseStatus(STATUS))
+
+    def testNoRevisionControlFile(self):
+        self.assertEquals({}, parseStatus(['   Repository revision:\tNo revision control file\n']))
+
+class TestParseLog(unittest.TestCase):
+    """Tests L{parseLog} on the output of C{cvs log} for several files."""
+
+    def testDeltasOfRequestedRevs(self):
+        deltas = parseLog(LOG, {'foo.txt': '1.3', 'bar.txt': '1.2'})
+        self.assertEquals({'foo.txt': '+2 -1', 'bar.txt': '+0 -0'}, deltas)
+
+    def testIgnoresRevsOfOtherFiles(self):
+        # foo.txt's 1.2 must not be mistaken for bar.txt's
+        self.assertEquals({'bar.txt': '+0 -0'}, parseLog(LOG, {'bar.txt': '1.2'}))
+
+    def testIgnoresRevisionLinesInLogMessages(self):
+        self.assertEquals({'foo.txt': '+5 -5'}, parseLog(LOG, {'foo.txt': '1.2'}))
+
+if __name__ == '__main__':
+    unittest.main()
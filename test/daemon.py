@@ -0,0 +1,102 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests handing jobs from the hook client to the daemon (Unix only)."""
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.client import submit
+from commitmessage.daemon import Daemon
+from commitmessage import util
+from commitmessage.model import Controller
+
+CONFIG = """[scm]
+controller = %s.RecordingController
+
+[modules]
+
+[views]
+"""
+
+# The (argv, stdin) of each job processed by a RecordingController
+processed = []
+
+class RecordingController(Controller):
+    """Records the jobs it is given instead of building a model."""
+
+    detachable = True
+
+    def process(self):
+        util.Process('true').wait()
+        processed.append((self.argv, self.stdin.read()))
+
+class HookOnlyController(Controller):
+    """A controller that has to run within the hook."""
+
+class TestDaemon(unittest.TestCase):
+    """Runs a L{Daemon} on a thread and submits jobs to it."""
+
+    def setUp(self):
+        del processed[:]
+        self.dir = tempfile.mkdtemp()
+        self.socketPath = os.path.join(self.dir, 'socket')
+        configPath = os.path.join(self.dir, 'commitmessage.conf')
+        f = open(configPath, 'w')
+        f.write(CONFIG % __name__)
+        f.close()
+
+        daemon = Daemon(configPath, self.socketPath)
+        daemon.READ_TIMEOUT = 0.2
+        thread = threading.Thread(target=daemon.run)
+        thread.setDaemon(True)
+        thread.start()
+        while not os.path.exists(self.socketPath):
+            time.sleep(0.01)
+
+    def testProcessesJob(self):
+        self.assertEquals(None, submit(self.socketPath, '', ['main.py', '/repo', '12'], 'text'))
+        for i in range(100):
+            if processed:
+                break
+            time.sleep(0.01)
+        self.assertEquals([(['main.py', '/repo', '12'], 'text')], processed)
+        for i in range(100):
+            if not util.processes:
+                break
+            time.sleep(0.01)
+        self.assertEquals([], util.processes)
+
+    def testDropsStalledClient(self):
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect(self.socketPath)
+        try:
+            self.assertEquals(None, submit(self.socketPath, '', ['main.py', '/repo', '13'], ''))
+        finally:
+            stalled.close()
+        for i in range(100):
+            if processed:
+                break
+            time.sleep(0.01)
+        self.assertEquals([(['main.py', '/repo', '13'], '')], processed)
+
+    def testRejectsHookOnlyController(self):
+        reason = submit(self.socketPath, '%s.HookOnlyController' % __name__, ['main.py'], '')
+        self.failUnless(reason.endswith('must run within the hook'))
+
+    def testNotRunning(self):
+        self.failUnless(submit(os.path.join(self.dir, 'missing'), '', [], '').startswith('could not connect'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests the L{commitmessage.controllers.cvs.Journal} that carries a CVS commit between hook executions."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.controllers.cvs import CvsController, Journal
+from commitmessage.model import Controller
+from commitmessage.util import CmConfigParser
+
+CONFIG = '[scm]\ncontroller = commitmessage.controllers.cvs.CvsController\n'
+
+LOGINFO = '''Update of /cvsroot/module/%s
+In directory server:/tmp/cvs-serv1
+
+Modified Files:
+\t%s
+Log Message:
+Changed things
+'''
+
+class FakeCvsController(CvsController):
+    """Leaves the revs and diffs alone instead of running C{cvs}."""
+
+    def _fillInValues(self, directory, revisions, rcsDirectory, lazy=False):
+        pass
+
+class TestJournal(unittest.TestCase):
+    """Tests appending and replaying journal records."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.journal = Journal(os.path.join(self.dir, 'journal'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testReplaysInOrder(self):
+        self.journal.append(('lastdir', '/a/'))
+        self.journal.append(('directory', {'b': 1}))
+        self.assertEquals([('lastdir', '/a/'), ('directory', {'b': 1})], self.journal.replay())
+
+    def testReplaysOnlyKinds(self):
+        self.journal.append(('lastdir', '/a/'))
+        self.journal.append(('directory', {'b': 1}))
+        self.journal.append(('lastdir', '/c/'))
+        self.assertEquals([('lastdir', '/a/'), ('lastdir', '/c/')], self.journal.replay(['lastdir']))
+        self.assertEquals([('directory', {'b': 1})], self.journal.replay(['directory']))
+
+    def testMissingJournalIsEmpty(self):
+        self.assertEquals([], self.journal.replay())
+
+    def testIgnoresTruncatedRecord(self):
+        self.journal.append(('lastdir', '/a/'))
+        self.journal.append(('lastdir', '/b/'))
+        f = open(self.journal.path, 'rb+')
+        f.truncate(os.path.getsize(self.journal.path) - 1)
+        f.close()
+        self.assertEquals([('lastdir', '/a/')], self.journal.replay())
+
+    def testRemove(self):
+        self.journal.append(('lastdir', '/a/'))
+        self.journal.remove()
+        self.failIf(os.path.exists(self.journal.path))
+        self.journal.remove()
+
+class TestCommit(unittest.TestCase):
+    """Tests assembling a two directory commit across hook executions."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.oldTmpDir = Controller.TMPDIR
+        Controller.TMPDIR = self.dir
+        os.environ['CVSROOT'] = ':local:/cvsroot'
+        os.environ.setdefault('USER', 'stephen')
+
+        path = os.path.join(self.dir, 'commitmessage.conf')
+        f = open(path, 'w')
+        f.write(CONFIG)
+        f.close()
+        self.config = CmConfigParser(path)
+
+    def tearDown(self):
+        Controller.TMPDIR = self.oldTmpDir
+        shutil.rmtree(self.dir)
+
+    def run_(self, argv, stdin=None):
+        controller = FakeCvsController(self.config, ['main.py'] + argv, stdin)
+        return controller, controller.buildModel()
+
+    def testLastLoginfoBuildsTheWholeModel(self):
+        self.assertEquals(False, self.run_(['/cvsroot/module/a', 'x.txt'])[1])
+        self.assertEquals(False, self.run_(['/cvsroot/module/b', 'y.txt'])[1])
+
+        controller, done = self.run_(['module/a x.txt'], StringIO(LOGINFO % ('a', 'x.txt')))
+        self.assertEquals(False, done)
+
+        controller, done = self.run_(['module/b y.txt'], StringIO(LOGINFO % ('b', 'y.txt')))
+        self.assertEquals(True, done)
+        paths = [file.path for file in controller.model.files()]
+        paths.sort()
+        self.assertEquals(['/a/x.txt', '/b/y.txt'], paths)
+        self.assertEquals('Changed things', controller.model.log)
+
+        # Nothing is left behind for the next commit
+        self.assertEquals(['commitmessage.conf'], os.listdir(self.dir))
+
+if __name__ == '__main__':
+    unittest.main()
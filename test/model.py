@@ -0,0 +1,372 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests looking up the L{Directory}s and L{File}s of the L{Model}."""
+
+import cPickle
+import re
+import sys
+import threading
+import unittest
+
+from StringIO import StringIO
+
+class TestLoad(unittest.TestCase):
+    """Tests building the tree in bulk with L{Model.load}."""
+
+    def setUp(self):
+        self.model = Model()
+        self.model.load([
+            ('/trunk/b.txt', 'modified'),
+            ('/trunk/', 'modified'),
+            ('/trunk/a.txt', 'added'),
+            ('/trunk/lib/c.txt', 'removed'),
+            ('/d.txt', 'added')])
+
+    def testFiles(self):
+        self.assertEquals(['/d.txt', '/trunk/a.txt', '/trunk/b.txt', '/trunk/lib/c.txt'], [f.path for f in self.model.files()])
+        self.assertEquals('removed', self.model.file('/trunk/lib/c.txt').action)
+
+    def testDirectoryActions(self):
+        self.assertEquals('modified', self.model.directory('/trunk/').action)
+        self.assertEquals('none', self.model.directory('/trunk/lib/').action)
+
+    def testSortsAfterLoading(self):
+        trunk = self.model.directory('/trunk/')
+        File('0.txt', trunk, 'added')
+        self.assertEquals(['0.txt', 'a.txt', 'b.txt'], [f.name for f in trunk.files])
+
+    def testLoadFiles(self):
+        directory = Directory('/a/')
+        directory.loadFiles([('y.txt', 'added'), ('x.txt', 'removed')])
+        self.assertEquals(['x.txt', 'y.txt'], [f.name for f in directory.files])
+        self.assertEquals('removed', directory.file('x.txt').action)
+
+class TestListings(unittest.TestCase):
+    """Tests that the cached flattened listings follow changes to the tree."""
+
+    def setUp(self):
+        self.model = Model()
+        self.model.load([('/a/x.txt', 'added'), ('/b/', 'added')])
+
+    def paths(self, nodes):
+        return [node.path for node in nodes]
+
+    def testNewFile(self):
+        self.assertEquals(['/a/x.txt'], self.paths(self.model.files()))
+        File('y.txt', self.model.directory('/b/'), 'added')
+        self.assertEquals(['/a/x.txt', '/b/y.txt'], self.paths(self.model.files()))
+        self.assertEquals(['/a/', '/b/'], self.paths(self.model.directoriesWithFiles('added')))
+
+    def testNewDirectory(self):
+        self.assertEquals(['/', '/a/', '/b/'], self.paths(self.model.directories()))
+        c = Directory('/c/', 'added')
+        File('z.txt', c, 'added')
+        self.model.addDirectory(c)
+        self.assertEquals(['/', '/a/', '/b/', '/c/'], self.paths(self.model.directories()))
+        self.assertEquals(['/b/', '/c/'], self.paths(self.model.directories('added')))
+        self.assertEquals(['/a/x.txt', '/c/z.txt'], self.paths(self.model.files()))
+
+    def testSubdirectoryOfAnAttachedDirectory(self):
+        self.model.files()
+        d = Directory('/a/d/')
+        File('w.txt', d, 'modified')
+        self.model.directory('/a/').addSubdirectory(d)
+        self.failUnless(d is self.model.directory('/a/d/'))
+        self.assertEquals(['/a/x.txt', '/a/d/w.txt'], self.paths(self.model.files()))
+
+    def testDirectoryAction(self):
+        self.assertEquals(['/b/'], self.paths(self.model.directories('added')))
+        self.model.directory('/a/').action = 'added'
+        self.assertEquals(['/a/', '/b/'], self.paths(self.model.directories('added')))
+
+    def testListingsAreCopies(self):
+        self.model.files().append('junk')
+        self.assertEquals(['/a/x.txt'], self.paths(self.model.files()))
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.exceptions import CmException
+from commitmessage.model import EXCLUDED, DiffLoader, Directory, File, Model
+
+class TestLookups(unittest.TestCase):
+    """Tests the indexed lookups of directories and files."""
+
+    def setUp(self):
+        self.model = Model()
+
+    def testDirectoryIsCreatedOnce(self):
+        a = self.model.directory('/a/b/')
+        self.failUnless(a is self.model.directory('/a/b/'))
+        self.failUnless(self.model.directory('/a/') is self.model.rootDirectory.subdirectory('a'))
+        self.assertEquals(['a'], [d.name for d in self.model.rootDirectory.subdirectories])
+
+    def testAddedDirectoriesAreIndexed(self):
+        a = Directory('/a/')
+        b = Directory('/a/b/')
+        a.addSubdirectory(b)
+        File('x.txt', b, 'added')
+        self.model.addDirectory(a)
+        self.failUnless(b is self.model.directory('/a/b/'))
+        self.failUnless(b.file('x.txt') is self.model.file('/a/b/x.txt'))
+
+    def testExistingDirectoryIsKept(self):
+        existing = self.model.directory('/a/')
+        self.model.addDirectory(Directory('/a/'))
+        self.failUnless(existing is self.model.directory('/a/'))
+
+    def testDirectoriesAddedOutsideTheModel(self):
+        a = self.model.directory('/a/')
+        b = Directory('/a/b/')
+        a.addSubdirectory(b)
+        self.failUnless(b is self.model.directory('/a/b/'))
+
+    def testFiles(self):
+        directory = self.model.directory('/a/')
+        y = File('y.txt', directory, 'added')
+        x = File('x.txt', directory, 'modified')
+        self.failUnless(x is self.model.file('/a/x.txt'))
+        self.assertEquals(None, self.model.file('/a/z.txt'))
+        self.assertEquals([x, y], directory.files)
+
+    def testHasSubdirectory(self):
+        self.model.directory('/a/')
+        self.failUnless(self.model.rootDirectory.hasSubdirectory('a'))
+        self.failIf(self.model.rootDirectory.hasSubdirectory('b'))
+
+class TestCompact(unittest.TestCase):
+    """Tests the slotted L{File}s and L{Directory}s."""
+
+    def setUp(self):
+        self.model = Model()
+        self.model.load([('/a/b/x.txt', 'added')])
+        self.file = self.model.file('/a/b/x.txt')
+
+    def testReadOnly(self):
+        directory = self.file.directory
+        for node, name in [(directory, 'path'), (directory, 'name'), (directory, 'files'), (self.file, 'path'), (self.file, 'name')]:
+            self.assertRaises(AttributeError, setattr, node, name, 'foo')
+        self.assertRaises(AttributeError, setattr, self.file, 'other', 'foo')
+
+    def testNames(self):
+        self.assertEquals('b', self.model.directory('/a/b/').name)
+        self.assertEquals('/', self.model.rootDirectory.name)
+        self.failUnless(self.file.name is self.model.file('/a/b/x.txt').name)
+        self.failUnless(self.file.name is intern('x.txt'))
+
+    def testPickle(self):
+        self.file.diff = 'diff'
+        model = cPickle.loads(cPickle.dumps(self.model, 2))
+        file = model.file('/a/b/x.txt')
+        self.assertEquals('/a/b/x.txt', file.path)
+        self.assertEquals('diff', file.diff)
+        self.failUnless(file.directory is model.directory('/a/b/'))
+        model.directory('/a/').action = 'added'
+        self.assertEquals(['/a/'], [d.path for d in model.directories('added')])
+
+class TestFreeze(unittest.TestCase):
+    """Tests the read-only snapshots made by L{Model.freeze}."""
+
+    def setUp(self):
+        self.model = Model()
+        self.model.load([
+            ('/trunk/b.txt', 'modified'),
+            ('/trunk/', 'modified'),
+            ('/trunk/a.txt', 'added'),
+            ('/trunk/lib/c.txt', 'removed'),
+            ('/d.txt', 'added')])
+        self.model.log = 'log'
+        self.model.rev = '12'
+        self.model.file('/trunk/a.txt').diff = 'a diff'
+        self.model.file('/trunk/b.txt').diff = ''
+        self.model.file('/trunk/b.txt').delta = '+1 -1'
+        self.frozen = self.model.freeze()
+
+    def assertSameNodes(self, nodes, frozenNodes):
+        self.assertEquals([(n.path, n.name, n.action) for n in nodes], [(n.path, n.name, n.action) for n in frozenNodes])
+
+    def testListings(self):
+        for action in [None, 'added', 'modified', 'removed']:
+            self.assertSameNodes(self.model.files(action), self.frozen.files(action))
+            self.assertSameNodes(self.model.directories(action), self.frozen.directories(action))
+            self.assertSameNodes(self.model.directoriesWithFiles(action), self.frozen.directoriesWithFiles(action))
+        self.assertEquals(self.model.greatestCommonDirectory(), self.frozen.greatestCommonDirectory())
+
+    def testTree(self):
+        trunk = self.frozen.directory('/trunk/')
+        self.assertSameNodes(self.model.directory('/trunk/').files, trunk.files)
+        self.assertEquals(['/trunk/lib/'], [d.path for d in trunk.subdirectories])
+        self.assertEquals('/trunk/lib/', trunk.subdirectory('lib').path)
+        self.assertEquals('/trunk/', self.frozen.file('/trunk/b.txt').directory.path)
+        self.assertEquals(['a.txt'], [f.name for f in trunk.filesByAction('added')])
+        self.assertEquals(None, self.frozen.directory('/branches/'))
+        self.assertEquals(None, self.frozen.file('/trunk/e.txt'))
+
+    def testValues(self):
+        self.assertEquals('a diff', self.frozen.file('/trunk/a.txt').diff)
+        self.assertEquals('', self.frozen.file('/trunk/b.txt').diff)
+        self.assertEquals(None, self.frozen.file('/d.txt').diff)
+        self.assertEquals('+1 -1', self.frozen.file('/trunk/b.txt').delta)
+        self.assertEquals('log', self.frozen.log)
+        self.assertEquals('12', self.frozen.rev)
+
+    def testReadOnly(self):
+        self.assertRaises(AttributeError, setattr, self.frozen, 'log', 'changed')
+        self.assertRaises(AttributeError, setattr, self.frozen.file('/d.txt'), 'diff', 'changed')
+        self.assertRaises(AttributeError, setattr, self.frozen.directory('/trunk/'), 'action', 'added')
+
+    def testSnapshot(self):
+        File('e.txt', self.model.directory('/trunk/'), 'added')
+        self.assertEquals(4, len(self.frozen.files()))
+        self.failUnless(self.frozen.freeze() is self.frozen)
+
+    def testPickle(self):
+        frozen = cPickle.loads(cPickle.dumps(self.frozen, 2))
+        self.assertSameNodes(self.frozen.files(), frozen.files())
+        self.assertEquals('a diff', frozen.file('/trunk/a.txt').diff)
+
+class TestSlice(unittest.TestCase):
+    """Tests the slices of a snapshot made by L{FrozenModel.slice}."""
+
+    def setUp(self):
+        model = Model()
+        model.load([
+            ('/trunk/a.txt', 'added'),
+            ('/trunk/b.txt', 'modified'),
+            ('/trunk/lib/c.txt', 'removed'),
+            ('/trunk/old/', 'removed'),
+            ('/d.txt', 'added')])
+        model.file('/trunk/b.txt').diff = 'b diff'
+        self.frozen = model.freeze()
+
+    def paths(self, nodes):
+        return [n.path for n in nodes]
+
+    def testFiles(self):
+        sliced = self.frozen.slice(['/trunk/b.txt', '/trunk/lib/c.txt'])
+        self.assertEquals(['/trunk/b.txt', '/trunk/lib/c.txt'], self.paths(sliced.files()))
+        self.assertEquals(['/trunk/lib/c.txt'], self.paths(sliced.files('removed')))
+        self.assertEquals(['/', '/trunk/lib/', '/trunk/'], self.paths(sliced.directories()))
+        self.assertEquals(['/trunk/lib/', '/trunk/'], self.paths(sliced.directoriesWithFiles()))
+        self.assertEquals('/trunk/', sliced.greatestCommonDirectory())
+        self.assertEquals('b diff', sliced.file('/trunk/b.txt').diff)
+
+    def testTree(self):
+        sliced = self.frozen.slice(['/trunk/lib/c.txt'])
+        trunk = sliced.directory('/trunk/')
+        self.assertEquals([], trunk.files)
+        self.assertEquals(None, trunk.file('a.txt'))
+        self.assertEquals(['/trunk/lib/'], self.paths(trunk.subdirectories))
+        self.assertEquals(None, trunk.subdirectory('old'))
+        self.assertEquals(None, sliced.directory('/trunk/old/'))
+        self.assertEquals(None, sliced.file('/d.txt'))
+        self.assertEquals('/trunk/lib/', sliced.greatestCommonDirectory())
+
+    def testDirectories(self):
+        sliced = self.frozen.slice(['/trunk/old/', '/missing.txt'])
+        self.assertEquals([], sliced.files())
+        self.assertEquals(['/trunk/old/'], self.paths(sliced.directories('removed')))
+        self.assertEquals('/trunk/old/', sliced.greatestCommonDirectory())
+
+    def testParentDirectories(self):
+        model = Model()
+        model.load([('/trunk/', 'modified'), ('/trunk/a/x.c', 'modified'), ('/trunk/b.c', 'modified')])
+        model.directory('/trunk/').diff = 'svn:ignore'
+        frozen = model.freeze()
+        sliced = frozen.slice(['/trunk/a/x.c'])
+        self.assertEquals('none', sliced.directory('/trunk/').action)
+        self.assertEquals(None, sliced.directory('/trunk/').diff)
+        self.assertEquals([], sliced.directories('modified'))
+        self.assertEquals('/trunk/a/', sliced.greatestCommonDirectory())
+        routed = frozen.slice(['/trunk/', '/trunk/b.c'])
+        self.assertEquals('modified', routed.directory('/trunk/').action)
+        self.assertEquals('svn:ignore', routed.directory('/trunk/').diff)
+        self.assertEquals('none', routed.slice(['/trunk/b.c']).directory('/trunk/').action)
+
+    def testSlicingASlice(self):
+        sliced = self.frozen.slice(['/trunk/a.txt', '/d.txt']).slice(['/d.txt', '/trunk/b.txt'])
+        self.assertEquals(['/d.txt'], self.paths(sliced.files()))
+        self.assertEquals(['/d.txt', '/trunk/a.txt', '/trunk/b.txt', '/trunk/lib/c.txt'], self.paths(self.frozen.files()))
+
+    def testPickle(self):
+        sliced = cPickle.loads(cPickle.dumps(self.frozen.slice(['/trunk/b.txt']), 2))
+        self.assertEquals(['/trunk/b.txt'], self.paths(sliced.files()))
+
+    def testExclude(self):
+        excluding = self.frozen.exclude(re.compile('.*/b'))
+        self.assertEquals(self.paths(self.frozen.files()), self.paths(excluding.files()))
+        self.assertEquals(EXCLUDED, excluding.file('/trunk/b.txt').delta)
+        self.assertEquals('', excluding.file('/trunk/b.txt').diff)
+        self.assertEquals('b diff', self.frozen.file('/trunk/b.txt').diff)
+        sliced = excluding.exclude(re.compile('/d')).slice(['/d.txt', '/trunk/a.txt'])
+        self.assertEquals([EXCLUDED, None], [f.delta for f in sliced.files()])
+
+class TestDiffLoader(unittest.TestCase):
+    """Tests leaving the deltas and diffs to be fetched on first read."""
+
+    def setUp(self):
+        self.model = Model()
+        self.model.load([('/a/x.txt', 'added'), ('/a/y.txt', 'modified')])
+        self.fetched = 0
+        DiffLoader(self.model.files() + self.model.directories(), self.fetch)
+
+    def fetch(self):
+        self.fetched = self.fetched + 1
+        for file in self.model.files():
+            file.diff = 'diff of %s' % file.name
+            # Reading what has been filled in so far does not fetch again
+            file.delta = '+%s -0' % len(file.diff)
+        self.model.directory('/a/').diff = 'property'
+
+    def testFetchesOnFirstRead(self):
+        self.assertEquals(0, self.fetched)
+        self.assertEquals(['/a/x.txt', '/a/y.txt'], [f.path for f in self.model.files()])
+        self.assertEquals('+13 -0', self.model.file('/a/y.txt').delta)
+        self.assertEquals('diff of x.txt', self.model.file('/a/x.txt').diff)
+        self.assertEquals('property', self.model.directory('/a/').diff)
+        self.assertEquals(1, self.fetched)
+
+    def testFrozenModel(self):
+        frozen = self.model.freeze()
+        self.assertEquals(0, self.fetched)
+        self.assertEquals('diff of x.txt', frozen.file('/a/x.txt').diff)
+        self.assertEquals('property', frozen.directory('/a/').diff)
+        self.assertEquals(1, self.fetched)
+
+    def testPicklingFrozenModelFetches(self):
+        frozen = cPickle.loads(cPickle.dumps(self.model.freeze(), 2))
+        self.assertEquals(1, self.fetched)
+        self.assertEquals('+13 -0', frozen.file('/a/y.txt').delta)
+        self.assertEquals('property', frozen.directory('/a/').diff)
+
+    def testFailedFetch(self):
+        def fail():
+            model.file('/a/x.txt').diff = 'partial'
+            raise CmException('cvs diff failed')
+        model = Model()
+        model.load([('/a/x.txt', 'added'), ('/a/y.txt', 'modified')])
+        DiffLoader(model.files() + model.directories(), fail)
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            self.assertEquals('<Unavailable>', model.file('/a/x.txt').delta)
+            self.failUnless(sys.stderr.getvalue().find('cvs diff failed') != -1)
+        finally:
+            sys.stderr = stderr
+        self.assertEquals('', model.file('/a/x.txt').diff)
+        self.assertEquals('<Unavailable>', model.file('/a/y.txt').delta)
+        self.assertEquals(None, model.directory('/a/').diff)
+
+    def testThreads(self):
+        threads = [threading.Thread(target=lambda: self.model.file('/a/x.txt').diff) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(1, self.fetched)
+
+if __name__ == '__main__':
+    unittest.main()
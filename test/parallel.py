@@ -0,0 +1,56 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests the L{commitmessage.util.parallelMap} thread pool."""
+
+import sys
+import threading
+import time
+import unittest
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.util import parallelMap
+
+class TestParallelMap(unittest.TestCase):
+    """Tests calling a function over a list with L{parallelMap}."""
+
+    def testKeepsOrder(self):
+        def slowerForSmaller(n):
+            time.sleep((10 - n) * 0.01)
+            return n * 2
+        self.assertEquals([n * 2 for n in range(10)], parallelMap(slowerForSmaller, range(10), 4))
+
+    def testLimitsConcurrency(self):
+        lock = threading.Lock()
+        counts = {'running': 0, 'most': 0}
+        def track(n):
+            lock.acquire()
+            counts['running'] = counts['running'] + 1
+            counts['most'] = max(counts['most'], counts['running'])
+            lock.release()
+            time.sleep(0.02)
+            lock.acquire()
+            counts['running'] = counts['running'] - 1
+            lock.release()
+        parallelMap(track, range(12), 3)
+        self.assertEquals(3, counts['most'])
+
+    def testSequentialWithoutConcurrency(self):
+        threads = []
+        parallelMap(lambda n: threads.append(threading.currentThread()), range(3), 1)
+        self.assertEquals([threading.currentThread()] * 3, threads)
+
+    def testReraisesErrors(self):
+        def fail(n):
+            if n == 5:
+                raise ValueError(n)
+            return n
+        self.assertRaises(ValueError, parallelMap, fail, range(10), 4)
+
+if __name__ == '__main__':
+    unittest.main()
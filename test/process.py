@@ -0,0 +1,65 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests the L{commitmessage.util.Process} command runner (Unix only)."""
+
+import sys
+import unittest
+
+from StringIO import StringIO
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage import util
+from commitmessage.util import Process, execute, reportProcesses
+
+class TestProcess(unittest.TestCase):
+    """Tests running commands with L{Process}."""
+
+    def testStreamsLines(self):
+        process = Process(['printf', 'a\\nb\\n'])
+        self.assertEquals(['a\n', 'b\n'], list(process))
+        self.assertEquals(0, process.returncode)
+        self.failUnless(process.elapsed >= 0)
+
+    def testReportsExitStatus(self):
+        process = Process('exit 3')
+        process.wait()
+        self.assertEquals(3, process.returncode)
+        self.failUnless(str(process).endswith('exited with 3 after %.2fs' % process.elapsed))
+
+    def testDrainsStderrWhileReadingStdout(self):
+        # More stderr than a pipe can hold would block the command if it
+        # were only read after stdout
+        process = Process('head -c 1000000 /dev/zero >&2; echo done')
+        self.assertEquals(['done\n'], process.readlines())
+        self.assertEquals(1000000, len(process.err))
+
+    def testKillsOnTimeout(self):
+        process = Process('echo start; sleep 10; echo end', 0.5)
+        self.assertEquals(['start\n'], process.readlines())
+        self.failUnless(process.timedOut)
+        self.failUnless(process.elapsed < 5)
+
+    def testKill(self):
+        process = Process('sleep 10')
+        process.kill()
+        process.wait()
+        self.failIf(process.returncode == 0)
+
+    def testExecute(self):
+        self.assertEquals(['hi\n'], execute(['echo', 'hi']))
+
+    def testReportForgetsProcesses(self):
+        Process('exit 3').wait()
+        stream = StringIO()
+        reportProcesses(stream)
+        self.failUnless(stream.getvalue().find('exited with 3 after') != -1)
+        self.assertEquals([], util.processes)
+
+if __name__ == '__main__':
+    unittest.main()
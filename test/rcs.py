@@ -0,0 +1,228 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests reading RCS files with L{commitmessage.rcs} and diffing them with the CVS controller."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.controllers.cvs import rcs_diff
+from commitmessage.exceptions import CmException
+from commitmessage.model import Directory, File
+from commitmessage import rcs
+from commitmessage.rcs import RcsFile, applyEdits, splitLines
+
+RCS = '''head\t1.3;
+access;
+symbols
+\tbranch:1.2.0.2;
+locks; strict;
+comment\t@# @;
+
+
+1.3
+date\t2005.01.03.12.00.00;\tauthor stephen;\tstate Exp;
+branches;
+next\t1.2;
+commitid\tabc123;
+
+1.2
+date\t2005.01.02.12.00.00;\tauthor stephen;\tstate Exp;
+branches
+\t1.2.2.1;
+next\t1.1;
+
+1.1
+date\t99.01.01.12.00.00;\tauthor stephen;\tstate Exp;
+branches;
+next\t;
+
+1.2.2.1
+date\t2005.01.04.12.00.00;\tauthor stephen;\tstate Exp;
+branches;
+next\t1.2.2.2;
+
+1.2.2.2
+date\t2005.01.05.12.00.00;\tauthor stephen;\tstate Exp;
+branches;
+next\t;
+
+
+desc
+@@
+
+
+1.3
+log
+@Added e and an @@
+@
+text
+@a
+B
+c
+d
+e
+@@x
+@
+
+
+1.2
+log
+@Changed b
+@
+text
+@d5 2
+@
+
+
+1.1
+log
+@Initial revision
+@
+text
+@d2 1
+a2 1
+b
+d4 1
+@
+
+
+1.2.2.1
+log
+@On the branch
+@
+text
+@a4 1
+branch
+@
+
+
+1.2.2.2
+log
+@Still on the branch
+@
+text
+@d1 1
+@
+'''
+
+class TestRcsFile(unittest.TestCase):
+    """Tests parsing an RCS file and rebuilding its revisions."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(',v')
+        os.write(fd, RCS)
+        os.close(fd)
+        self.rcs = RcsFile(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def testAdmin(self):
+        self.assertEquals(['1.3'], self.rcs.admin['head'])
+        self.assertEquals(['branch', '1.2.0.2'], self.rcs.admin['symbols'])
+        self.assertEquals(['# '], self.rcs.admin['comment'])
+        self.failIf(self.rcs.isBinary())
+
+    def testDeltas(self):
+        self.assertEquals(['1.2.2.1'], self.rcs.deltas['1.2']['branches'])
+        self.assertEquals(['1.1'], self.rcs.deltas['1.2']['next'])
+        self.assertEquals([], self.rcs.deltas['1.1']['next'])
+        self.assertEquals(['abc123'], self.rcs.deltas['1.3']['commitid'])
+
+    def testLogs(self):
+        self.assertEquals('Added e and an @\n', self.rcs.logs['1.3'])
+
+    def testDates(self):
+        self.assertEquals('2005/01/03 12:00:00', self.rcs.date('1.3'))
+        self.assertEquals('1999/01/01 12:00:00', self.rcs.date('1.1'))
+
+    def testTrunkRevisions(self):
+        self.assertEquals(['a\n', 'B\n', 'c\n', 'd\n', 'e\n', '@x\n'], self.rcs.lines('1.3'))
+        self.assertEquals(['a\n', 'B\n', 'c\n', 'd\n'], self.rcs.lines('1.2'))
+        self.assertEquals(['a\n', 'b\n', 'c\n'], self.rcs.lines('1.1'))
+
+    def testBranchRevisions(self):
+        self.assertEquals(['a\n', 'B\n', 'c\n', 'd\n', 'branch\n'], self.rcs.lines('1.2.2.1'))
+        self.assertEquals(['B\n', 'c\n', 'd\n', 'branch\n'], self.rcs.lines('1.2.2.2'))
+
+    def testLinesOfEach(self):
+        self.assertEquals([self.rcs.lines('1.1'), self.rcs.lines('1.2')], self.rcs.linesOfEach(['1.1', '1.2']))
+        self.assertEquals([self.rcs.lines('1.2.2.1'), self.rcs.lines('1.2.2.2')], self.rcs.linesOfEach(['1.2.2.1', '1.2.2.2']))
+        self.assertEquals([self.rcs.lines('1.1'), self.rcs.lines('1.2.2.2')], self.rcs.linesOfEach(['1.1', '1.2.2.2']))
+
+    def testWalksTheHistoryOnce(self):
+        applied = []
+        def record(lines, script):
+            applied.append(script)
+            return realApplyEdits(lines, script)
+        realApplyEdits = rcs.applyEdits
+        rcs.applyEdits = record
+        try:
+            self.rcs.linesOfEach(['1.2.2.1', '1.2.2.2'])
+        finally:
+            rcs.applyEdits = realApplyEdits
+        # 1.2, then up the branch to 1.2.2.1 and 1.2.2.2
+        self.assertEquals(3, len(applied))
+
+    def testUnknownRevision(self):
+        self.assertRaises(CmException, self.rcs.lines, '1.4')
+
+    def testTruncatedFile(self):
+        f = open(self.path, 'w')
+        f.write(RCS[:RCS.index('d5 2')])
+        f.close()
+        self.assertRaises(CmException, RcsFile, self.path)
+
+class TestApplyEdits(unittest.TestCase):
+    """Tests applying RCS edit scripts."""
+
+    def testAppendToStart(self):
+        self.assertEquals(['x\n', 'a\n'], applyEdits(['a\n'], 'a0 1\nx\n'))
+
+    def testNoFinalNewline(self):
+        self.assertEquals(['a\n', 'b'], splitLines('a\nb'))
+        self.assertEquals(['a\n', 'c'], applyEdits(['a\n', 'b'], 'd2 1\na2 1\nc'))
+
+class TestRcsDiff(unittest.TestCase):
+    """Tests L{rcs_diff} building diffs from an RCS file."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(',v')
+        os.write(fd, RCS)
+        os.close(fd)
+        self.rcs = RcsFile(self.path)
+        self.directory = Directory('/module/')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def testModified(self):
+        delta, diff = rcs_diff(File('foo.txt', self.directory, 'modified'), self.rcs, '1.2', '1.1')
+        self.assertEquals('+2 -1', delta)
+        lines = diff.splitlines(True)
+        self.assertEquals('Index: foo.txt\n', lines[0])
+        self.assertEquals('diff -u -r1.1 -r1.2\n', lines[5])
+        self.assertEquals('--- foo.txt\t1999/01/01 12:00:00\t1.1\n', lines[6])
+        self.assertEquals('+++ foo.txt\t2005/01/02 12:00:00\t1.2\n', lines[7])
+        self.assertEquals([' a\n', '-b\n', '+B\n', ' c\n', '+d\n'], lines[9:])
+
+    def testAdded(self):
+        delta, diff = rcs_diff(File('foo.txt', self.directory, 'added'), self.rcs, '1.1', 'NONE')
+        self.assertEquals('+3 -0', delta)
+        self.assertEquals('Index: foo.txt\n' + '=' * 67 + '\na\nb\nc\n\n', diff)
+
+    def testRemoved(self):
+        delta, diff = rcs_diff(File('foo.txt', self.directory, 'removed'), self.rcs, '1.3', '1.2')
+        self.assertEquals('+0 -0', delta)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests matching paths against the C{[modules]} patterns with the L{ModuleRouter}."""
+
+import random
+import re
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.router import ModuleRouter, compileExcludes, literalPrefix
+
+def linearRoute(patterns, path):
+    """@return: the modules matching C{path}, found by trying each pattern in turn"""
+    modules = [module for module, pattern in patterns if re.match(pattern, path)]
+    modules.sort()
+    return modules
+
+class TestLiteralPrefix(unittest.TestCase):
+    """Tests telling plain strings apart from regexes."""
+
+    def testPlain(self):
+        self.assertEquals('/trunk/', literalPrefix('/trunk/'))
+        self.assertEquals('/trunk/', literalPrefix('^/trunk/'))
+        self.assertEquals('', literalPrefix('^'))
+
+    def testEscapedPunctuation(self):
+        self.assertEquals('/a.b/', literalPrefix(r'/a\.b/'))
+
+    def testRegexes(self):
+        for pattern in ['/a.b/', '/trunk/$', r'/\d+/', '/(a|b)/', '/a*', r'/a\w']:
+            self.assertEquals(None, literalPrefix(pattern), pattern)
+
+class TestCompileExcludes(unittest.TestCase):
+    """Tests matching paths against the fnmatch-style C{exclude} patterns."""
+
+    def testNone(self):
+        self.assertEquals(None, compileExcludes([]))
+
+    def testPatterns(self):
+        excludes = compileExcludes(['vendor/*', '*.lock', '/trunk/gen/*.c'])
+        for path in ['/vendor/a.c', '/trunk/vendor/lib/a.c', '/yarn.lock', '/trunk/a/Gemfile.lock', '/trunk/gen/x.c']:
+            self.failUnless(excludes.match(path), path)
+        for path in ['/trunk/vendors/a.c', '/trunk/lock', '/trunk/a.lock.txt', '/branches/trunk/gen/x.c', '/trunk/gen/x.h']:
+            self.failIf(excludes.match(path), path)
+
+class TestModuleRouter(unittest.TestCase):
+    """Tests that routing gives the same modules as trying each pattern."""
+
+    def assertRoutes(self, patterns, paths):
+        router = ModuleRouter(patterns)
+        for path in paths:
+            modules = router.route(path)
+            modules.sort()
+            self.assertEquals(linearRoute(patterns, path), modules, path)
+
+    def testPrefixes(self):
+        patterns = [('a', '/trunk/'), ('b', '/trunk/foo'), ('c', '/trunk/foobar/'), ('d', '/tags/'), ('e', '^/trunk/'), ('root', '^')]
+        self.assertRoutes(patterns, ['/', '/trunk', '/trunk/', '/trunk/fo', '/trunk/foo', '/trunk/foobar/x', '/trunk/food/', '/tags/1/', '/t'])
+
+    def testRegexes(self):
+        patterns = [('a', '/trunk/.*\\.c$'), ('b', '/(trunk|branches)/'), ('c', '(?i)/TRUNK/'), ('d', r'/(\w)\1/'), ('e', '/trunk/')]
+        self.assertRoutes(patterns, ['/trunk/x.c', '/trunk/x.h', '/branches/', '/Trunk/', '/aa/', '/ab/'])
+
+    def testSameGroupNames(self):
+        patterns = [('a', r'^/(?P<team>\w+)/trunk/'), ('b', r'^/(?P<team>\w+)/branches/'), ('c', '/trunk/')]
+        self.assertRoutes(patterns, ['/x/trunk/', '/x/branches/', '/x/tags/'])
+
+    def testManyGroups(self):
+        patterns = [('m%d' % i, '/(%d)/(x|y)/' % i) for i in range(200)]
+        self.assertRoutes(patterns, ['/5/x/', '/199/y/', '/200/x/'])
+
+    def testRandom(self):
+        random.seed(1)
+        parts = ['a', 'b', 'ab', 'team1', 'team2', 'x.c']
+        patterns = []
+        for i in range(300):
+            path = '/' + '/'.join([random.choice(parts) for j in range(random.randint(0, 3))])
+            if i % 3 == 0:
+                patterns.append(('m%d' % i, re.escape(path) + '(/.*)?$'))
+            elif i % 3 == 1:
+                patterns.append(('m%d' % i, '^' + path.replace('.', '\\.')))
+            else:
+                patterns.append(('m%d' % i, path))
+        paths = ['/' + '/'.join([random.choice(parts) for j in range(random.randint(0, 4))]) + '/' for i in range(200)]
+        self.assertRoutes(patterns, paths)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests the on-disk commit L{commitmessage.spool.Spool} (Unix only)."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.model import Controller
+from commitmessage import spool
+from commitmessage.spool import Spool, keyOf, spoolCommit
+
+class FakeConfig:
+    """Stands in for a L{commitmessage.util.CmConfigParser} with an empty C{[scm]} section and no views."""
+
+    def options(self, section):
+        return []
+
+    def getRequiredFacets(self):
+        return {}
+
+class DetachableController(Controller):
+    """A controller that can be spooled before building its model."""
+
+    detachable = True
+
+    def repository(self):
+        return self.argv[1]
+
+    def revision(self):
+        return int(self.argv[2])
+
+class HookOnlyController(Controller):
+    """A controller that has to build its model within the hook."""
+
+    def _populateModel(self):
+        self.model.repo = 'module1'
+        self.model.log = self.stdin.read()
+
+class TestSpool(unittest.TestCase):
+    """Tests adding, claiming and finishing jobs."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.spool = Spool(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testDetachableControllerIsSpooledAsIs(self):
+        controller = DetachableController(FakeConfig(), ['main.py', '/repo', '12'], StringIO('text'))
+        spoolCommit(self.spool, 'DetachableController', controller)
+
+        names = self.spool.pending()
+        self.assertEquals(1, len(names))
+        self.failUnless(names[0].endswith('.12.' + keyOf('/repo')))
+        self.assertEquals([], os.listdir(os.path.join(self.dir, 'tmp')))
+
+        self.spool.claim(names[0])
+        job = self.spool.load(names[0])
+        self.assertEquals(['main.py', '/repo', '12'], job['argv'])
+        self.assertEquals('text', job['stdin'])
+        self.assertEquals(None, job['model'])
+
+        self.spool.finish(names[0])
+        self.assertEquals([], self.spool.pending())
+        self.assertEquals([], os.listdir(os.path.join(self.dir, 'cur')))
+
+    def testHookOnlyControllerIsSpooledWithItsModel(self):
+        controller = HookOnlyController(FakeConfig(), ['main.py'], StringIO('log'))
+        spoolCommit(self.spool, 'HookOnlyController', controller)
+
+        name = self.spool.pending()[0]
+        self.spool.claim(name)
+        self.assertEquals('log', self.spool.load(name)['model'].log)
+
+    def testPendingIsInCommitOrder(self):
+        for rev in range(12):
+            self.spool.add({'repository': '/repo', 'rev': rev})
+        revs = []
+        for name in self.spool.pending():
+            self.spool.claim(name)
+            revs.append(self.spool.load(name)['rev'])
+        self.assertEquals(range(12), revs)
+
+    def testPendingIsInRevisionOrderPerRepository(self):
+        for repository, revision in [('/repo', 13), ('/other', 5), ('/repo', 12), ('/other', 4), ('/cvs', None)]:
+            self.spool.add({'repository': repository, 'revision': revision})
+        jobs = []
+        for name in self.spool.pending():
+            self.spool.claim(name)
+            job = self.spool.load(name)
+            jobs.append((job['repository'], job['revision']))
+        self.assertEquals([('/repo', 12), ('/other', 4), ('/repo', 13), ('/other', 5), ('/cvs', None)], jobs)
+
+    def testRecover(self):
+        self.spool.add({'repository': '/repo'})
+        name = self.spool.pending()[0]
+        self.spool.claim(name)
+        self.spool.recover()
+        self.assertEquals([name], self.spool.pending())
+
+    def testFail(self):
+        self.spool.add({'repository': '/repo'})
+        name = self.spool.pending()[0]
+        self.spool.claim(name)
+        self.spool.fail(name)
+        self.assertEquals([name], os.listdir(os.path.join(self.dir, 'failed')))
+
+class TestReap(unittest.TestCase):
+    """Tests putting back the jobs of workers that died."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.spool = Spool(self.dir)
+        self.spool.add({'repository': '/repo'})
+        self.name = self.spool.pending()[0]
+        self.oldStderr = sys.stderr
+        sys.stderr = StringIO()
+
+    def tearDown(self):
+        sys.stderr = self.oldStderr
+        shutil.rmtree(self.dir)
+
+    def testFinished(self):
+        self.spool.claim(self.name)
+        self.spool.finish(self.name)
+        attempts = {self.name: 1}
+        spool._reap(self.spool, self.name, 0, attempts)
+        self.assertEquals({}, attempts)
+        self.assertEquals('', sys.stderr.getvalue())
+
+    def testKilledWorkerIsRetried(self):
+        attempts = {}
+        for i in range(spool.MAX_ATTEMPTS - 1):
+            self.spool.claim(self.name)
+            spool._reap(self.spool, self.name, 9, attempts)
+            self.assertEquals([self.name], self.spool.pending())
+        self.failUnless(sys.stderr.getvalue().find('killed by signal 9') != -1)
+
+        self.spool.claim(self.name)
+        spool._reap(self.spool, self.name, 1 << 8, attempts)
+        self.assertEquals([], self.spool.pending())
+        self.assertEquals([self.name], os.listdir(os.path.join(self.dir, 'failed')))
+        self.assertEquals({}, attempts)
+
+if __name__ == '__main__':
+    unittest.main()
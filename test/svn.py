@@ -0,0 +1,382 @@
+#!/usr/bin/python
+#
+# commitmessage
+# Copyright 2002-2004 Stephen Haberman
+#
+
+"""Tests the parsing of C{svnlook} output by the Subversion controller."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+if __name__ == '__main__':
+    sys.path.append('.')
+
+from commitmessage.controllers.svn import SvnController, splitDiffs
+from commitmessage.model import EXCLUDED
+from commitmessage.util import CmConfigParser, Process
+
+INFO = [
+    'stephen\n',
+    '2005-01-01 12:00:00 -0600 (Sat, 01 Jan 2005)\n',
+    '12\n',
+    'Changed foo and bar.\n']
+
+CHANGED = [
+    'U   trunk/foo.txt\n',
+    'A   trunk/bar.txt\n',
+    '_U  trunk/\n']
+
+DIFF = [
+    'Modified: trunk/foo.txt\n',
+    '===================================================================\n',
+    '--- trunk/foo.txt\t2005-01-01 11:00:00 UTC (rev 11)\n',
+    '+++ trunk/foo.txt\t2005-01-01 12:00:00 UTC (rev 12)\n',
+    '@@ -1,2 +1,2 @@\n',
+    ' same\n',
+    '-old\n',
+    '+new\n',
+    '\n',
+    'Added: trunk/bar.txt\n',
+    '===================================================================\n',
+    '--- trunk/bar.txt\t2005-01-01 11:00:00 UTC (rev 0)\n',
+    '+++ trunk/bar.txt\t2005-01-01 12:00:00 UTC (rev 12)\n',
+    '@@ -0,0 +1,2 @@\n',
+    '+one\n',
+    '+two\n',
+    '\n',
+    '\n',
+    'Property changes on: trunk/bar.txt\n',
+    '___________________________________________________________________\n',
+    'Added: svn:mime-type\n',
+    '   + text/plain\n',
+    '\n',
+    'Property changes on: trunk\n',
+    '___________________________________________________________________\n',
+    'Name: svn:ignore\n',
+    '   + *.dll\n',
+    '\n']
+
+class FakeProcess:
+    """Stands in for a L{commitmessage.util.Process} that has already output C{lines}."""
+
+    def __init__(self, lines):
+        self.stdout = StringIO(''.join(lines))
+        self.returncode = 0
+        self.timedOut = False
+        self.err = ''
+
+    def readlines(self):
+        return self.stdout.readlines()
+
+    def kill(self):
+        pass
+
+    def wait(self):
+        return self.returncode
+
+class FakeSvnController(SvnController):
+    """Serves canned C{svnlook} output instead of running C{svnlook}."""
+
+    def _startSvnlook(self, command, stdout=None):
+        self.started.append(command)
+        return FakeProcess({'info': INFO, 'changed': CHANGED, 'diff': DIFF}[command])
+
+class BlockedDiffSvnController(FakeSvnController):
+    """Runs an C{svnlook diff} stand-in that blocks on its full pipe until it is read or killed."""
+
+    def _startSvnlook(self, command, stdout=None):
+        if command != 'diff':
+            return FakeSvnController._startSvnlook(self, command, stdout)
+        self.started.append(command)
+        return Process('head -c 1000000 /dev/zero')
+
+def createConfig(text):
+    """@return: a L{CmConfigParser} for the config C{text}"""
+    fd, path = tempfile.mkstemp()
+    os.write(fd, text)
+    os.close(fd)
+    try:
+        return CmConfigParser(path)
+    finally:
+        os.remove(path)
+
+class TestSplitDiffs(unittest.TestCase):
+    """Tests the L{splitDiffs} generator."""
+
+    def testSplitsOnMarkers(self):
+        diffs = list(splitDiffs(DIFF))
+        self.assertEquals(4, len(diffs))
+        self.assertEquals('Modified: trunk/foo.txt\n', diffs[0][0][0])
+        self.assertEquals('Added: trunk/bar.txt\n', diffs[1][0][0])
+        self.assertEquals('Property changes on: trunk/bar.txt\n', diffs[2][0][0])
+        self.assertEquals('Property changes on: trunk\n', diffs[3][0][0])
+
+    def testPropertyMarkerIsNotANewDiff(self):
+        diffs = list(splitDiffs(DIFF))
+        self.assertEquals('Added: svn:mime-type\n', diffs[2][0][2])
+
+    def testCounts(self):
+        counts = [(added, removed) for lines, added, removed in splitDiffs(DIFF)]
+        self.assertEquals([(1, 1), (2, 0), (0, 0), (0, 0)], counts)
+
+    def testTrailingLineIsNotCounted(self):
+        diffs = list(splitDiffs(['Added: a.txt\n', '===\n', '+one\n', '+two\n']))
+        self.assertEquals(1, diffs[0][1])
+
+    def testCountsWithoutKeepingLines(self):
+        diffs = list(splitDiffs(DIFF, False))
+        self.assertEquals([(['Modified: trunk/foo.txt\n'], 1, 1), (['Added: trunk/bar.txt\n'], 2, 0)], diffs[:2])
+        self.assertEquals([(1, 1), (2, 0), (0, 0), (0, 0)], [(added, removed) for lines, added, removed in diffs])
+
+    def testIgnoresLeadingGarbage(self):
+        self.assertEquals([], list(splitDiffs(['garbage\n', '+more garbage\n'])))
+
+    def testIsLazy(self):
+        def lines():
+            for line in DIFF[:10]:
+                yield line
+            raise AssertionError('Read past the second diff')
+        self.assertEquals('Modified: trunk/foo.txt\n', splitDiffs(lines()).next()[0][0])
+
+class TestPopulateModel(unittest.TestCase):
+    """Tests L{SvnController} building the model from C{svnlook} output."""
+
+    def setUp(self):
+        config = createConfig('[scm]\ncontroller = commitmessage.controllers.svn.SvnController\n')
+        self.controller = FakeSvnController(config, ['main.py', '/repos/project', '12'], None)
+        self.controller.started = []
+        self.controller._populateModel()
+        self.model = self.controller.model
+
+    def testStartsDiffBeforeItIsRead(self):
+        self.assertEquals(['info', 'changed', 'diff'], self.controller.started)
+        self.assertEquals(None, self.model.file('/trunk/foo.txt')._delta)
+        self.model.file('/trunk/foo.txt').delta
+        self.model.file('/trunk/bar.txt').diff
+        self.assertEquals(['info', 'changed', 'diff'], self.controller.started)
+
+    def testFrozenModelFetchesDiffs(self):
+        frozen = self.model.freeze()
+        self.assertEquals('+1 -1', frozen.file('/trunk/foo.txt').delta)
+        self.assertEquals(''.join(DIFF[23:]), frozen.directory('/trunk/').diff)
+        self.assertEquals(['info', 'changed', 'diff'], self.controller.started)
+
+    def testInfo(self):
+        self.assertEquals('stephen', self.model.user)
+        self.assertEquals('Changed foo and bar.', self.model.log)
+
+    def testFileDiffs(self):
+        foo = self.model.file('/trunk/foo.txt')
+        self.assertEquals('+1 -1', foo.delta)
+        self.assertEquals(''.join(DIFF[1:8]), foo.diff)
+
+    def testFileWithPropertyChanges(self):
+        bar = self.model.file('/trunk/bar.txt')
+        self.assertEquals('+2 -0', bar.delta)
+        self.failUnless(bar.diff.startswith(''.join(DIFF[10:16])))
+        self.failUnless(bar.diff.endswith(''.join(DIFF[18:23])))
+
+    def testDirectoryPropertyChanges(self):
+        trunk = self.model.directory('/trunk/')
+        self.assertEquals('modified', trunk.action)
+        self.assertEquals(''.join(DIFF[23:]), trunk.diff)
+
+class TestUnreadDiff(unittest.TestCase):
+    """Tests stopping C{svnlook diff} when no view reads it."""
+
+    def testStoppedAfterTheViews(self):
+        config = createConfig('[scm]\ncontroller = commitmessage.controllers.svn.SvnController\n\n[modules]\n')
+        controller = BlockedDiffSvnController(config, ['main.py', '/repos/project', '12'], None)
+        controller.started = []
+        controller._populateModel()
+        process = controller.diffProcess
+        self.assertEquals(None, process.returncode)
+        controller._executeViews()
+        self.failIf(process.returncode is None)
+
+class TestRequiredFacets(unittest.TestCase):
+    """Tests only running the C{svnlook}s that the configured views need."""
+
+    def buildModel(self, views):
+        config = createConfig('''[scm]
+controller = commitmessage.controllers.svn.SvnController
+
+[modules]
+trunk = ^/project/trunk
+branches = ^/project/branches
+
+[views]
+tigris = commitmessage.views.email.TigrisStyleEmailView
+ethereal = commitmessage.views.email.EtherealStyleEmailView
+jabber = commitmessage.views.im.JabberView
+
+[trunk]
+views = %s
+
+[branches]
+views = tigris
+''' % views)
+        controller = FakeSvnController(config, ['main.py', '/repos/project', '12'], None)
+        controller.started = []
+        controller.buildModel()
+        return controller
+
+    def testDeltasOnly(self):
+        controller = self.buildModel('ethereal')
+        model = controller.model
+        self.assertEquals(['info', 'changed', 'diff'], controller.started)
+        self.assertEquals('+1 -1', model.file('/trunk/foo.txt').delta)
+        self.assertEquals('+2 -0', model.file('/trunk/bar.txt').delta)
+        self.assertEquals(None, model.file('/trunk/foo.txt').diff)
+        self.assertEquals(None, model.directory('/trunk/').diff)
+        self.assertEquals(['info', 'changed', 'diff'], controller.started)
+
+    def testFilesAndLogOnly(self):
+        controller = self.buildModel('jabber')
+        self.assertEquals(None, controller.model.file('/trunk/foo.txt').delta)
+        self.assertEquals('Changed foo and bar.', controller.model.log)
+        self.assertEquals(['info', 'changed'], controller.started)
+
+    def testUnionOfViews(self):
+        controller = self.buildModel('jabber, tigris')
+        self.assertEquals(''.join(DIFF[1:8]), controller.model.file('/trunk/foo.txt').diff)
+
+    def testUnknownView(self):
+        controller = self.buildModel('jabber, unknown')
+        self.assertEquals(''.join(DIFF[1:8]), controller.model.file('/trunk/foo.txt').diff)
+
+    def testOnlyTheRoutedModules(self):
+        controller = self.buildModel('jabber')
+        self.assertEquals([('trunk', None)], controller.routes)
+        self.assertEquals({'files': True, 'log': True}, controller.facets)
+
+    def testNoModules(self):
+        controller = FakeSvnController(createConfig('''[scm]
+controller = commitmessage.controllers.svn.SvnController
+
+[modules]
+branches = ^/project/branches
+
+[views]
+tigris = commitmessage.views.email.TigrisStyleEmailView
+
+[branches]
+views = tigris
+'''), ['main.py', '/repos/project', '12'], None)
+        controller.started = []
+        self.assertEquals(False, controller.buildModel())
+        self.assertEquals([], controller.routes)
+        self.assertEquals(None, controller.model.file('/trunk/foo.txt').diff)
+        self.assertEquals(['info', 'changed'], controller.started)
+
+class TestRoutePerFile(unittest.TestCase):
+    """Tests giving each module's views only the paths that matched it."""
+
+    def setUp(self):
+        self.config = createConfig('''[scm]
+controller = commitmessage.controllers.svn.SvnController
+routePerFile = yes
+
+[modules]
+foo = /project/trunk/foo
+trunk = /project/trunk/$
+
+[views]
+tigris = commitmessage.views.email.TigrisStyleEmailView
+
+[foo]
+views = tigris
+
+[trunk]
+views = tigris
+
+[DEFAULT_MODULE]
+views = tigris
+''')
+        self.config.getViewsForModule = self.record
+        self.executed = []
+
+    def record(self, module, model):
+        self.executed.append((module, [f.path for f in model.files()], [d.path for d in model.directories()], model))
+        return []
+
+    def execute(self, routePerFile):
+        self.config.set('scm', 'routePerFile', routePerFile)
+        controller = FakeSvnController(self.config, ['main.py', '/repos/project', '12'], None)
+        controller.started = []
+        controller.process()
+
+    def testSlices(self):
+        self.execute('yes')
+        self.assertEquals(['DEFAULT_MODULE', 'foo', 'trunk'], [e[0] for e in self.executed])
+        self.assertEquals((['/trunk/bar.txt'], ['/', '/trunk/']), self.executed[0][1:3])
+        self.assertEquals((['/trunk/foo.txt'], ['/', '/trunk/']), self.executed[1][1:3])
+        self.assertEquals(([], ['/', '/trunk/']), self.executed[2][1:3])
+        model = self.executed[1][3]
+        self.assertEquals(''.join(DIFF[1:8]), model.file('/trunk/foo.txt').diff)
+        self.assertEquals(None, model.file('/trunk/bar.txt'))
+        self.assertEquals('/trunk/foo.txt', model.greatestCommonDirectory() + model.files()[0].name)
+
+    def testOff(self):
+        self.execute('no')
+        self.assertEquals(['trunk'], [e[0] for e in self.executed])
+        self.assertEquals(['/trunk/bar.txt', '/trunk/foo.txt'], self.executed[0][1])
+
+class TestExclude(unittest.TestCase):
+    """Tests leaving out the diffs of the files that match the C{exclude} patterns."""
+
+    def buildModel(self, scmExclude='', trunkExclude='', projectViews=''):
+        config = createConfig('''[scm]
+controller = commitmessage.controllers.svn.SvnController
+exclude = %s
+
+[modules]
+trunk = ^/project/trunk
+project = ^/project
+
+[views]
+tigris = commitmessage.views.email.TigrisStyleEmailView
+
+[trunk]
+views = tigris
+exclude = %s
+
+[project]
+views = %s
+''' % (scmExclude, trunkExclude, projectViews))
+        self.controller = FakeSvnController(config, ['main.py', '/repos/project', '12'], None)
+        self.controller.started = []
+        self.controller.buildModel()
+        return self.controller.model
+
+    def testScm(self):
+        model = self.buildModel(scmExclude='bar.txt')
+        self.assertEquals(''.join(DIFF[1:8]), model.file('/trunk/foo.txt').diff)
+        self.assertEquals(EXCLUDED, model.file('/trunk/bar.txt').delta)
+        self.assertEquals('', model.file('/trunk/bar.txt').diff)
+        self.failUnless(model.directory('/trunk/').diff.find('*.dll') != -1)
+
+    def testModule(self):
+        model = self.buildModel(trunkExclude='*.txt')
+        self.assertEquals(EXCLUDED, model.file('/trunk/foo.txt').delta)
+        self.assertEquals(EXCLUDED, model.file('/trunk/bar.txt').delta)
+
+    def testWantedByAnotherModule(self):
+        model = self.buildModel(trunkExclude='foo.txt', projectViews='tigris')
+        self.assertEquals('+1 -1', model.file('/trunk/foo.txt').delta)
+
+        executed = []
+        def record(module, model):
+            executed.append((module, model.file('/trunk/foo.txt').delta, model.file('/trunk/bar.txt').delta))
+            return []
+        self.controller.config.getViewsForModule = record
+        self.controller._executeViews()
+        self.assertEquals([('project', '+1 -1', '+2 -0'), ('trunk', EXCLUDED, '+2 -0')], executed)
+
+if __name__ == '__main__':
+    unittest.main()